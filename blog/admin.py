@@ -4,27 +4,27 @@ from .models import BlogPost, Category, Tag
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'created_at')
+    list_display = ('name', 'slug', 'published_post_count', 'created_at')
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'created_at')
+    list_display = ('name', 'slug', 'published_post_count', 'created_at')
     search_fields = ('name',)
     prepopulated_fields = {'slug': ('name',)}
 
 
 @admin.register(BlogPost)
 class BlogPostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'category', 'published', 'created_at', 'updated_at')
+    list_display = ('title', 'author', 'category', 'published', 'view_count', 'created_at', 'updated_at')
     list_filter = ('published', 'category', 'tags', 'created_at')
     search_fields = ('title', 'content', 'author')
     prepopulated_fields = {'slug': ('title',)}
     filter_horizontal = ('tags',)
     date_hierarchy = 'created_at'
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('view_count', 'created_at', 'updated_at')
     
     fieldsets = (
         ('Content', {
@@ -33,6 +33,9 @@ class BlogPostAdmin(admin.ModelAdmin):
         ('Metadata', {
             'fields': ('author', 'category', 'tags', 'published', 'published_at')
         }),
+        ('Statistics', {
+            'fields': ('view_count',),
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -0,0 +1,202 @@
+"""
+Read-only JSON API for published posts.
+
+GET /api/posts/ lists posts newest first and GET /api/posts/<slug>/ returns one.
+?fields=title,slug,... picks the keys returned, and only the matching columns
+are selected (as tuples via values_list, so no model instances are built).
+The list takes ?category=<slug>, ?tag=<slug> and ?author=<fingerprint prefix>
+filters. It is paginated with an opaque ?cursor= over (created_at, id), so a
+page costs the same however deep it is and doesn't shift when new posts arrive.
+
+GET /api/posts/export/ streams the whole corpus as NDJSON (see blog.export)
+for backups and mirrors. It needs the X-API-TOKEN header to match
+BLOG_EXPORT_TOKEN.
+"""
+import base64
+import json
+import secrets
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404, HttpRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_http_methods
+
+from .export import gzip_chunks, iter_ndjson
+from .models import BlogPost
+from .view_counter import view_counts
+from . import views
+
+
+# API field name -> column selected for it. 'url' and 'tags' are derived.
+FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'excerpt': 'excerpt',
+    'content': 'content',
+    'author': 'author',
+    'author_fingerprint': 'author_user__fingerprint',
+    'category': 'category__slug',
+    'category_name': 'category__name',
+    'view_count': 'view_count',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'published_at': 'published_at',
+    'url': 'slug',
+}
+DERIVED_FIELDS = ('tags',)
+
+LIST_FIELDS = ('title', 'slug', 'url', 'excerpt', 'author', 'category', 'tags', 'published_at', 'view_count')
+DETAIL_FIELDS = LIST_FIELDS + ('content', 'author_fingerprint', 'updated_at')
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _requested_fields(request, default):
+    raw = request.GET.get('fields', '').strip()
+    if not raw:
+        return default
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in FIELDS and name not in DERIVED_FIELDS]
+    if unknown:
+        raise BadRequest(f'Unknown field(s): {", ".join(unknown)}')
+    return fields
+
+
+def _columns(fields):
+    """Columns to select: id and created_at first (for tags and the cursor), then the requested ones"""
+    return list(dict.fromkeys(['id', 'created_at'] + [FIELDS[name] for name in fields if name in FIELDS]))
+
+
+def _tag_slugs(post_ids):
+    tags = {post_id: [] for post_id in post_ids}
+    through = BlogPost.tags.through.objects.filter(blogpost_id__in=post_ids).order_by('tag__name')
+    for post_id, slug in through.values_list('blogpost_id', 'tag__slug'):
+        tags[post_id].append(slug)
+    return tags
+
+
+def _serialise(rows, columns, fields):
+    """Dicts of the requested fields for values_list rows"""
+    position = {column: index for index, column in enumerate(columns)}
+    tags = _tag_slugs([row[0] for row in rows]) if 'tags' in fields else {}
+    results = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            if name == 'tags':
+                item[name] = tags[row[0]]
+            elif name == 'url':
+                item[name] = reverse('blog:post_detail', kwargs={'slug': row[position['slug']]})
+            elif name == 'view_count':
+                # Include views buffered in this process but not flushed yet
+                item[name] = row[position['view_count']] + view_counts.pending(row[0])
+            else:
+                item[name] = row[position[FIELDS[name]]]
+        results.append(item)
+    return results
+
+
+def encode_cursor(created_at, post_id):
+    payload = json.dumps([created_at.isoformat(), post_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, post_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (ValueError, TypeError):
+        raise BadRequest('Invalid cursor')
+
+
+def _filtered_posts(request):
+    posts = BlogPost.objects.filter(published=True)
+    if request.GET.get('category'):
+        posts = posts.filter(category__slug=request.GET['category'])
+    if request.GET.get('tag'):
+        posts = posts.filter(tags__slug=request.GET['tag'])
+    if request.GET.get('author'):
+        # Authors are usually shown by their short (16 character) fingerprint
+        posts = posts.filter(author_user__fingerprint__startswith=request.GET['author'].strip().lower())
+    return posts
+
+
+def _limit(request):
+    try:
+        return min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+
+
+@require_http_methods(["GET"])
+def api_list_posts(request: HttpRequest):
+    """API endpoint listing published posts, newest first"""
+    try:
+        fields = _requested_fields(request, LIST_FIELDS)
+        limit = _limit(request)
+        posts = _filtered_posts(request)
+        if request.GET.get('cursor'):
+            created_at, post_id = decode_cursor(request.GET['cursor'])
+            posts = posts.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id))
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    columns = _columns(fields)
+    # One extra row tells us whether there is a next page
+    rows = list(posts.order_by('-created_at', '-id').values_list(*columns)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    rows = rows[:limit]
+    return JsonResponse({'posts': _serialise(rows, columns, fields), 'next_cursor': next_cursor})
+
+
+@require_http_methods(["GET"])
+def api_post_detail(request: HttpRequest, slug: str):
+    """API endpoint returning a single published post"""
+    try:
+        fields = _requested_fields(request, DETAIL_FIELDS)
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    columns = _columns(fields)
+    row = get_object_or_404(BlogPost.objects.filter(published=True).values_list(*columns), slug=slug)
+    return JsonResponse({'post': _serialise([row], columns, fields)[0]})
+
+
+@require_http_methods(["GET", "POST"])
+def api_posts(request: HttpRequest):
+    """GET lists posts, POST creates one"""
+    if request.method == 'POST':
+        return views.api_create_post(request)
+    return api_list_posts(request)
+
+
+@require_http_methods(["GET"])
+def api_export_posts(request: HttpRequest):
+    """Stream every post as NDJSON, gzipped when the client accepts it; ?after_id= resumes an export"""
+    token = getattr(settings, 'BLOG_EXPORT_TOKEN', '')
+    if not token:
+        raise Http404('Export is disabled')
+    if not secrets.compare_digest(request.headers.get('X-API-TOKEN', '').encode(), token.encode()):
+        return HttpResponseForbidden()
+    try:
+        after_id = int(request.GET.get('after_id', 0))
+    except ValueError:
+        return JsonResponse({'error': 'after_id must be an integer'}, status=400)
+
+    chunks = iter_ndjson(after_id=after_id, published_only=request.GET.get('published') == '1')
+    gzipped = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = StreamingHttpResponse(gzip_chunks(chunks) if gzipped else chunks, content_type='application/x-ndjson')
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Cache-Control'] = 'no-store'
+    return response
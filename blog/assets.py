@@ -0,0 +1,206 @@
+"""
+Fingerprinted, minified and pre-compressed static assets.
+
+`manage.py build_static` collects the static files into STATIC_ROOT through
+HashedCompressedStaticStorage. It minifies CSS and JS before hashing, so
+the hash covers the bytes actually served. It then stores each file under a
+content-hashed name (base.css -> base.3f2a9c1e04b7.css) and writes a .gz
+sibling next to every compressible hashed file. `{% static %}` resolves
+names through the storage manifest, so templates always point at the
+current hash. An asset that changes gets a new URL, and each URL can be
+cached forever.
+
+serve_asset serves STATIC_ROOT when no front web server does. Hashed names
+get a year-long immutable Cache-Control and the .gz sibling when the client
+accepts gzip. The nginx equivalent is
+
+    location /static/ { alias <STATIC_ROOT>/; gzip_static on; expires max; add_header Cache-Control immutable; }
+
+Assets loaded from CDNs in base.html (Materialize, jQuery, jsrsasign) are
+not part of the build.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from .middleware import MIN_LENGTH, accepted_encoding, compression_levels
+
+
+# Hashed names never change content, so caches may keep them for a year
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+# Unhashed names can change on the next build
+MUTABLE_MAX_AGE = 300
+
+_CSS_STRINGS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''')
+_CSS_COMMENTS = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_AROUND = re.compile(r'\s*([{};,>])\s*')
+_CSS_SPACE_AFTER_COLON = re.compile(r':\s+')
+
+
+def minify_css(source):
+    """Strip comments and the whitespace CSS doesn't need, leaving strings alone"""
+    parts = _CSS_STRINGS.split(_CSS_COMMENTS.sub('', source))
+    for i in range(0, len(parts), 2):
+        # Spaces before a colon are kept: `a :hover` and `a:hover` differ
+        text = ' '.join(parts[i].split())
+        text = _CSS_SPACE_AFTER_COLON.sub(':', _CSS_SPACE_AROUND.sub(r'\1', text))
+        parts[i] = text.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def _minify_js_lines(source):
+    # Line-based so automatic semicolon insertion still sees every line break
+    out = []
+    in_template = in_comment = False
+    for line in source.splitlines():
+        if in_template:
+            code = line
+        else:
+            code = line.strip()
+            if in_comment:
+                end = code.find('*/')
+                if end == -1:
+                    continue
+                in_comment = False
+                code = code[end + 2:].lstrip()
+            # Only the comment is dropped; code after its closing */ stays
+            while code.startswith('/*'):
+                end = code.find('*/', 2)
+                if end == -1:
+                    in_comment = True
+                    code = ''
+                    break
+                code = code[end + 2:].lstrip()
+            if not code or code.startswith('//'):
+                continue
+        out.append(code)
+        # A line with an odd number of backticks opens or closes a multi-line template literal
+        if (code.count('`') - code.count('\\`')) % 2:
+            in_template = not in_template
+    return '\n'.join(out)
+
+
+def minify_js(source):
+    """rjsmin when it is installed, otherwise drop comment lines, blank lines and indentation"""
+    try:
+        import rjsmin
+    except ImportError:
+        return _minify_js_lines(source)
+    return rjsmin.jsmin(source)
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+
+class HashedCompressedStaticStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that minifies CSS/JS before hashing and writes .gz siblings"""
+
+    manifest_strict = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = {}
+
+    def stored_name(self, name):
+        # Until build_static has run, {% static %} falls back to the plain name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        self.stats = {'files': 0, 'source_bytes': 0, 'minified_bytes': 0, 'compressed': 0, 'gzip_bytes': 0}
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+
+        paths = dict(paths)
+        for name, (storage, path) in list(paths.items()):
+            minify = MINIFIERS.get(os.path.splitext(name)[1])
+            with storage.open(path) as f:
+                content = f.read()
+            self.stats['files'] += 1
+            self.stats['source_bytes'] += len(content)
+            if minify is not None and '.min.' not in name:
+                content = minify(content.decode('utf-8')).encode('utf-8')
+                # Hashing reads the copy in STATIC_ROOT, not the app directory
+                self.delete(name)
+                self._save(name, ContentFile(content))
+                paths[name] = (self, name)
+            self.stats['minified_bytes'] += len(content)
+
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        for hashed_name in sorted(hashed_names):
+            self._write_gzip(hashed_name)
+
+    def _write_gzip(self, name):
+        content_type, _ = mimetypes.guess_type(name)
+        level = compression_levels().get(content_type, 0)
+        if not level:
+            return
+        with self.open(name) as f:
+            content = f.read()
+        if len(content) < MIN_LENGTH:
+            return
+        # mtime=0 keeps rebuilds of unchanged files byte-identical
+        compressed = gzip.compress(content, compresslevel=level, mtime=0)
+        if len(compressed) >= len(content):
+            return
+        if self.exists(name + '.gz'):
+            self.delete(name + '.gz')
+        self._save(name + '.gz', ContentFile(compressed))
+        self.stats['compressed'] += 1
+        self.stats['gzip_bytes'] += len(compressed)
+
+
+def is_hashed(name):
+    """Whether name is a content-hashed file listed in the build_static manifest"""
+    return name in getattr(staticfiles_storage, 'hashed_files', {}).values()
+
+
+@require_safe
+def serve_asset(request, path):
+    root = settings.STATIC_ROOT
+    if not root:
+        raise Http404('STATIC_ROOT is not set')
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        filename = safe_join(root, name)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+    if name.endswith('.gz') or not os.path.isfile(filename):
+        raise Http404('No such asset')
+
+    content_type, _ = mimetypes.guess_type(filename)
+    encoding = None
+    if accepted_encoding(request.headers.get('Accept-Encoding', '')) == 'gzip' and os.path.isfile(filename + '.gz'):
+        filename, encoding = filename + '.gz', 'gzip'
+    response = FileResponse(
+        open(filename, 'rb'), content_type=content_type or 'application/octet-stream', filename=posixpath.basename(name),
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if is_hashed(name):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=MUTABLE_MAX_AGE)
+    return response
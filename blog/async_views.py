@@ -0,0 +1,191 @@
+"""
+Async versions of the public read views, served when BLOG_ASYNC_VIEWS is
+enabled (main.asgi turns it on).
+
+Under ASGI a slow Tor client waiting on its response costs a coroutine
+instead of a worker thread. Queries go through Django's async ORM, and
+querysets are evaluated before rendering, except on the streamed list
+pages (blog.streaming), which fetch and render a chunk of posts at a time.
+Template rendering is sync code,
+so it runs via sync_to_async; the CPU-bound parts - RSA verification,
+Markdown conversion and semantic search - run in the default executor so
+they don't hold up the event loop or the request's sync thread.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpRequest, JsonResponse
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+import secrets
+
+from .models import BlogPost, Category, Tag
+from .lite import template_for
+from .signals import get_taxonomy_version
+from .streaming import astream_list, streaming_enabled
+from .templatetags.blog_filters import render_markdown
+from .view_counter import view_counts
+from .views import _semantic_results, _result_limit, verify_post_encryption
+from . import semantic, trending
+
+
+async def _get_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+def _in_executor(func):
+    """Run func in a worker thread that isn't tied to the request"""
+    return sync_to_async(func, thread_sensitive=False)
+
+
+async def post_list(request: HttpRequest):
+    """Display list of published blog posts"""
+    posts = BlogPost.objects.filter(published=True).order_by('-created_at').select_related(
+        'category', 'author_user'
+    ).prefetch_related('tags')
+
+    category_slug = request.GET.get('category')
+    if category_slug:
+        category = await _get_or_404(Category.objects.all(), slug=category_slug)
+        posts = posts.filter(category=category)
+
+    tag_slug = request.GET.get('tag')
+    if tag_slug:
+        tag = await _get_or_404(Tag.objects.all(), slug=tag_slug)
+        posts = posts.filter(tags=tag)
+
+    context = {
+        # Lazy: only evaluated (inside the sync render) when the cached sidebar fragments are missing
+        'categories': Category.objects.order_by('-published_post_count', 'name'),
+        'tags': Tag.objects.order_by('-published_post_count', 'name'),
+        'selected_category': category_slug,
+        'selected_tag': tag_slug,
+        'taxonomy_version': await sync_to_async(get_taxonomy_version)(),
+    }
+    if streaming_enabled():
+        return await astream_list(
+            request, template_for(request, 'blog/post_list.html'), context, posts,
+            template_for(request, 'blog/includes/post_card.html'),
+        )
+    context['posts'] = [post async for post in posts]
+    return await sync_to_async(render)(request, template_for(request, 'blog/post_list.html'), context)
+
+
+async def post_detail(request: HttpRequest, slug: str):
+    """Display a single blog post"""
+    post = await _get_or_404(
+        BlogPost.objects.select_related('category', 'author_user').prefetch_related('tags'),
+        slug=slug, published=True,
+    )
+    if not getattr(request, 'static_snapshot', False):
+        await sync_to_async(view_counts.record)(post.pk)
+    related_posts = [
+        related async for related in BlogPost.objects.filter(
+            published=True, category=post.category_id
+        ).exclude(id=post.id).select_related('author_user')[:3]
+    ]
+
+    if post.encrypted_data and post.author_user:
+        encrypted_valid = await _in_executor(verify_post_encryption)(post)
+        if post.encrypted_valid != encrypted_valid:
+            post.encrypted_valid = encrypted_valid
+            await post.asave(update_fields=['encrypted_valid'])
+
+    # Converts (and caches) the Markdown off the loop; the template's
+    # |markdown filter then finds it in the cache.
+    await _in_executor(render_markdown)(post.content)
+
+    context = {
+        'post': post,
+        'related_posts': related_posts,
+    }
+    return await sync_to_async(render)(request, template_for(request, 'blog/post_detail.html'), context)
+
+
+async def category_detail(request: HttpRequest, slug: str):
+    """Display posts in a category"""
+    category = await _get_or_404(Category.objects.all(), slug=slug)
+    posts = BlogPost.objects.filter(category=category, published=True).order_by('-created_at').select_related(
+        'author_user'
+    )
+    context = {
+        'category': category,
+    }
+    if streaming_enabled():
+        return await astream_list(
+            request, template_for(request, 'blog/category_detail.html'), context, posts,
+            template_for(request, 'blog/includes/category_post_card.html'),
+        )
+    context['posts'] = [post async for post in posts]
+    return await sync_to_async(render)(request, template_for(request, 'blog/category_detail.html'), context)
+
+
+@require_http_methods(["GET"])
+async def get_challenge(request: HttpRequest):
+    """Get a challenge string for authentication"""
+    challenge = secrets.token_urlsafe(32)
+    await request.session.aset('auth_challenge', challenge)
+    return JsonResponse({'challenge': challenge})
+
+
+@require_http_methods(["GET"])
+async def api_trending_posts(request: HttpRequest):
+    """API endpoint returning the top trending posts"""
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    now = timezone.now()
+    posts = trending.trending_posts(limit=limit).values_list('title', 'slug', 'view_count', 'trending_score')
+    return JsonResponse({
+        'posts': [
+            {
+                'title': title,
+                'slug': slug,
+                'url': reverse('blog:post_detail', kwargs={'slug': slug}),
+                'view_count': view_count,
+                'score': trending.current_score(score, now),
+            }
+            async for title, slug, view_count, score in posts
+        ]
+    })
+
+
+@require_http_methods(["GET"])
+async def api_post_stats(request: HttpRequest, slug: str):
+    """API endpoint returning a published post's view total"""
+    post = await _get_or_404(BlogPost.objects.only('pk', 'slug', 'view_count'), slug=slug, published=True)
+    return JsonResponse({
+        'slug': post.slug,
+        # Include views buffered in this process but not flushed yet
+        'view_count': post.view_count + view_counts.pending(post.pk),
+    })
+
+
+@require_http_methods(["GET"])
+async def api_search_posts(request: HttpRequest):
+    """API endpoint ranking published posts by semantic similarity to ?q="""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'q is required'}, status=400)
+    try:
+        limit = _result_limit(request)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    matches = await _in_executor(semantic.search)(query[:1000], k=limit)
+    return JsonResponse({'query': query, 'posts': await sync_to_async(_semantic_results)(matches)})
+
+
+@require_http_methods(["GET"])
+async def api_similar_posts(request: HttpRequest, slug: str):
+    """API endpoint listing the published posts most similar to a post"""
+    post = await _get_or_404(BlogPost.objects.only('pk'), slug=slug, published=True)
+    try:
+        limit = _result_limit(request)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    matches = await _in_executor(semantic.similar_posts)(post.pk, k=limit)
+    return JsonResponse({'slug': slug, 'posts': await sync_to_async(_semantic_results)(matches)})
@@ -0,0 +1,250 @@
+"""
+Shared cache backend built on a SQLite table in WAL mode.
+
+Every gunicorn worker on the host opens the same database file, so cached
+entries are shared between workers and survive restarts - unlike
+LocMemCache - without needing Redis on the Tor host. WAL mode lets readers
+proceed while a single writer commits.
+
+Entries carry an absolute expiry time and a last-access time. Expired
+entries are ignored on read and removed during culling; once the table holds
+more than MAX_ENTRIES rows the least recently accessed entries are evicted.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class SQLiteCache(BaseCache):
+    """
+    Django cache backend storing pickled values in a SQLite-WAL table.
+
+    OPTIONS (in addition to the standard MAX_ENTRIES / CULL_FREQUENCY):
+        ACCESS_GRANULARITY: seconds between last-access updates for a key,
+            so hot keys don't turn every read into a write (default: 60)
+        CULL_CHECK_INTERVAL: number of sets between size checks (default: 16)
+        BUSY_TIMEOUT: seconds to wait for the write lock (default: 5)
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = str(location)
+        self._access_granularity = float(options.get('ACCESS_GRANULARITY', 60))
+        self._cull_check_interval = int(options.get('CULL_CHECK_INTERVAL', 16))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+        self._sets_since_cull = 0
+        # The instance is shared by the threads of a worker
+        self._cull_lock = threading.Lock()
+
+    # -- connection handling --------------------------------------------------
+
+    def _connection(self):
+        """Return this thread's connection, reopening it after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                ' key TEXT PRIMARY KEY,'
+                ' value BLOB NOT NULL,'
+                ' expires REAL,'
+                ' accessed REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed)')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self, **kwargs):
+        # Connections are reused across requests; Django calls close() after
+        # every request, so reopening here would defeat the point.
+        pass
+
+    # -- helpers ----------------------------------------------------------------
+
+    def _encode(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _decode(self, blob):
+        return pickle.loads(blob)
+
+    def _is_live(self, expires, now):
+        return expires is None or expires > now
+
+    def _maybe_cull(self, conn):
+        with self._cull_lock:
+            self._sets_since_cull += 1
+            if self._sets_since_cull < self._cull_check_interval:
+                return
+            self._sets_since_cull = 0
+        self._cull(conn, time.time())
+
+    def _cull(self, conn, now):
+        conn.execute('DELETE FROM cache_entries WHERE expires IS NOT NULL AND expires <= ?', (now,))
+        count = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count > self._max_entries:
+            # Evict the least recently used entries, plus a 1/CULL_FREQUENCY
+            # margin so we don't cull again on the very next set.
+            excess = count - self._max_entries
+            if self._cull_frequency:
+                excess += self._max_entries // self._cull_frequency
+            conn.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                ' SELECT key FROM cache_entries ORDER BY accessed LIMIT ?'
+                ')',
+                (excess,),
+            )
+
+    # -- BaseCache API ----------------------------------------------------------
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        conn = self._connection()
+        cursor = conn.execute(
+            'INSERT INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET '
+            ' value = excluded.value, expires = excluded.expires, accessed = excluded.accessed '
+            'WHERE cache_entries.expires IS NOT NULL AND cache_entries.expires <= ?',
+            (key, self._encode(value), self.get_backend_timeout(timeout), now, now),
+        )
+        added = cursor.rowcount == 1
+        if added:
+            self._maybe_cull(conn)
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT value, expires, accessed FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or not self._is_live(row[1], now):
+            return default
+        if now - row[2] > self._access_granularity:
+            conn.execute('UPDATE cache_entries SET accessed = ? WHERE key = ?', (now, key))
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        now = time.time()
+        conn = self._connection()
+        placeholders = ', '.join('?' * len(key_map))
+        rows = conn.execute(
+            f'SELECT key, value, expires, accessed FROM cache_entries WHERE key IN ({placeholders})',
+            list(key_map),
+        ).fetchall()
+        result = {}
+        stale = []
+        for key, blob, expires, accessed in rows:
+            if not self._is_live(expires, now):
+                continue
+            result[key_map[key]] = self._decode(blob)
+            if now - accessed > self._access_granularity:
+                stale.append((now, key))
+        if stale:
+            conn.executemany('UPDATE cache_entries SET accessed = ? WHERE key = ?', stale)
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+            (key, self._encode(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        self._maybe_cull(conn)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [
+            (self.make_and_validate_key(key, version=version), self._encode(value), expires, now)
+            for key, value in data.items()
+        ]
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                rows,
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._maybe_cull(conn)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._connection().execute(
+            'UPDATE cache_entries SET expires = ?, accessed = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            self._connection().execute(f'DELETE FROM cache_entries WHERE key IN ({placeholders})', keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Atomically increment a value - BEGIN IMMEDIATE holds the write lock across read and write"""
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value, expires FROM cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or not self._is_live(row[1], now):
+                raise ValueError("Key '%s' not found" % key)
+            new_value = self._decode(row[0]) + delta
+            conn.execute(
+                'UPDATE cache_entries SET value = ?, accessed = ? WHERE key = ?',
+                (self._encode(new_value), now, key),
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return new_value
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
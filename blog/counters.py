@@ -0,0 +1,67 @@
+"""
+Denormalized published-post counters on Category and Tag.
+
+The counters are adjusted in place with F() expressions by the signal
+handlers in blog.signals, inside the transaction that changed the post, so
+they stay exact without a COUNT ... GROUP BY on every page. recount() is the
+slow path used by the recount_posts command and bulk imports.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, Q
+
+from .models import Category, Tag
+
+
+def adjust_counts(model, deltas):
+    """
+    Apply {pk: delta} to model.published_post_count.
+    One UPDATE per distinct delta value, which is one statement in practice.
+    """
+    by_delta = {}
+    for pk, delta in deltas.items():
+        if pk is not None and delta:
+            by_delta.setdefault(delta, []).append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.filter(pk__in=pks).update(
+            published_post_count=F('published_post_count') + delta
+        )
+    return bool(by_delta)
+
+
+def adjust_tag_counts_for_links(links, sign):
+    """Adjust tag counters for (post_id, tag_id) links of published posts"""
+    deltas = Counter()
+    for _post_id, tag_id in links:
+        deltas[tag_id] += sign
+    return adjust_counts(Tag, deltas)
+
+
+def recount(model, pks=None, apply=True):
+    """
+    Recompute published_post_count from the posts table.
+
+    Returns a list of (obj, stored, actual) for every row that drifted; when
+    apply is True the drifted rows are corrected with a single bulk_update.
+    """
+    queryset = model.objects.annotate(
+        actual_count=Count('posts', filter=Q(posts__published=True))
+    ).order_by()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+
+    drift = []
+    for obj in queryset.only('pk', 'name', 'published_post_count').iterator(chunk_size=2000):
+        if obj.published_post_count != obj.actual_count:
+            drift.append((obj, obj.published_post_count, obj.actual_count))
+
+    if apply and drift:
+        for obj, _stored, actual in drift:
+            obj.published_post_count = actual
+        model.objects.bulk_update([obj for obj, _, _ in drift], ['published_post_count'], batch_size=500)
+    return drift
+
+
+def recount_all(apply=True):
+    """Recount categories and tags; returns {model: drift}"""
+    return {model: recount(model, apply=apply) for model in (Category, Tag)}
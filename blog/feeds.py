@@ -0,0 +1,252 @@
+"""
+RSS/Atom feeds (every post, per category, per tag) and the sitemap, served
+from stored bytes.
+
+Each document is rendered once and cached together with its ETag and
+Last-Modified (the newest updated_at it covers). The cache key includes the
+version of the document's scope (see blog.signals.get_feed_version), which
+is bumped only when a published post in that scope changes. Other feeds keep
+their stored bytes. A conditional GET that matches gets a 304 without
+rendering or touching the database.
+"""
+import hashlib
+
+from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps.views import sitemap
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import http_date
+from django.utils.text import Truncator
+from django.views.decorators.http import require_safe
+
+from .models import BlogPost, Category, Tag
+from .signals import get_feed_version, get_taxonomy_version
+
+
+FEED_ITEMS = 30
+
+FEED_CACHE_KEY = 'blog:feed:%s:%s:%s:%s'
+
+# Readers poll; let them (and any proxy) reuse a copy briefly before revalidating
+FEED_MAX_AGE = 300
+
+
+class PostsFeed(Feed):
+    title = 'Signed Blog'
+    description = 'Latest posts'
+
+    def link(self):
+        return reverse('blog:post_list')
+
+    def posts(self, obj):
+        return BlogPost.objects.filter(published=True)
+
+    def items(self, obj):
+        return self.posts(obj).select_related('category').prefetch_related('tags').order_by('-created_at')[:FEED_ITEMS]
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.excerpt or Truncator(item.content).words(60)
+
+    def item_author_name(self, item):
+        return item.author
+
+    def item_pubdate(self, item):
+        return item.published_at or item.created_at
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
+    def item_categories(self, item):
+        names = [item.category.name] if item.category else []
+        return names + [tag.name for tag in item.tags.all()]
+
+
+class AtomPostsFeed(PostsFeed):
+    feed_type = Atom1Feed
+    subtitle = PostsFeed.description
+
+
+class CategoryFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Category, slug=slug)
+
+    def title(self, obj):
+        return f'Signed Blog - {obj.name}'
+
+    def description(self, obj):
+        return obj.description or f'Latest posts in {obj.name}'
+
+    def link(self, obj):
+        return obj.get_absolute_url()
+
+    def posts(self, obj):
+        return BlogPost.objects.filter(published=True, category=obj)
+
+
+class AtomCategoryFeed(CategoryFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+class TagFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Tag, slug=slug)
+
+    def title(self, obj):
+        return f'Signed Blog - #{obj.name}'
+
+    def description(self, obj):
+        return f'Latest posts tagged {obj.name}'
+
+    def link(self, obj):
+        return f'{reverse("blog:post_list")}?tag={obj.slug}'
+
+    def posts(self, obj):
+        return BlogPost.objects.filter(published=True, tags=obj)
+
+
+class AtomTagFeed(TagFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+class PostSitemap(Sitemap):
+    changefreq = 'weekly'
+
+    def items(self):
+        return BlogPost.objects.filter(published=True).only('slug', 'updated_at').order_by('-created_at')
+
+    def lastmod(self, item):
+        return item.updated_at
+
+
+class CategorySitemap(Sitemap):
+    changefreq = 'daily'
+
+    def items(self):
+        return Category.objects.filter(published_post_count__gt=0).order_by('name')
+
+
+class PostListSitemap(Sitemap):
+    changefreq = 'hourly'
+    priority = 1.0
+
+    def items(self):
+        return ['blog:post_list']
+
+    def location(self, item):
+        return reverse(item)
+
+
+SITEMAPS = {
+    'home': PostListSitemap,
+    'posts': PostSitemap,
+    'categories': CategorySitemap,
+}
+
+
+def _render_feed(feed_class, request, slug=None):
+    # Feed.__call__ resolves the object and renders the whole document
+    response = feed_class()(request, slug=slug) if slug else feed_class()(request)
+    return response.content, response['Content-Type']
+
+
+def _render_sitemap(request):
+    response = sitemap(request, sitemaps=SITEMAPS)
+    response.render()
+    return response.content, response['Content-Type']
+
+
+def _last_modified(posts):
+    newest = posts.aggregate(newest=Max('updated_at'))['newest']
+    return int(newest.timestamp()) if newest else None
+
+
+def _serve(request, name, scope_key, render, posts, page=''):
+    """Serve the stored document for this scope version, rendering and storing it on a miss"""
+    # Links in the document are absolute, so .onion and clearnet hosts get their own copies
+    key = FEED_CACHE_KEY % (name, request.get_host(), page, scope_key)
+    entry = cache.get(key)
+    if entry is None:
+        content, content_type = render()
+        entry = {
+            'content': content,
+            'content_type': content_type,
+            'etag': '"%s"' % hashlib.md5(content, usedforsecurity=False).hexdigest(),
+            'last_modified': _last_modified(posts()),
+        }
+        cache.set(key, entry)
+
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+    if response is None:
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    if entry['last_modified']:
+        response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_cache_control(response, public=True, max_age=FEED_MAX_AGE)
+    return response
+
+
+@require_safe
+def posts_feed(request, atom=False):
+    feed_class = AtomPostsFeed if atom else PostsFeed
+    return _serve(
+        request, 'atom' if atom else 'rss', get_feed_version('all'),
+        lambda: _render_feed(feed_class, request),
+        lambda: BlogPost.objects.filter(published=True),
+    )
+
+
+@require_safe
+def category_feed(request, slug, atom=False):
+    feed_class = AtomCategoryFeed if atom else CategoryFeed
+    return _serve(
+        request, f'category:{slug}:{"atom" if atom else "rss"}', get_feed_version(f'category:{slug}'),
+        lambda: _render_feed(feed_class, request, slug),
+        lambda: BlogPost.objects.filter(published=True, category__slug=slug),
+    )
+
+
+@require_safe
+def tag_feed(request, slug, atom=False):
+    feed_class = AtomTagFeed if atom else TagFeed
+    return _serve(
+        request, f'tag:{slug}:{"atom" if atom else "rss"}', get_feed_version(f'tag:{slug}'),
+        lambda: _render_feed(feed_class, request, slug),
+        lambda: BlogPost.objects.filter(published=True, tags__slug=slug),
+    )
+
+
+def _sitemap_page(request):
+    """The requested sitemap page as a number, so ?p=01 and ?p=1 share one cache entry"""
+    try:
+        page = int(request.GET.get('p', 1))
+    except ValueError:
+        page = 0
+    if page < 1:
+        raise Http404('No such sitemap page')
+    return page
+
+
+@require_safe
+def sitemap_xml(request):
+    # Category pages are listed too, so category changes count as well as post changes
+    return _serve(
+        request, 'sitemap', f'{get_feed_version("all")}:{get_taxonomy_version()}',
+        lambda: _render_sitemap(request),
+        lambda: BlogPost.objects.filter(published=True),
+        page=_sitemap_page(request),
+    )
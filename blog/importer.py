@@ -0,0 +1,280 @@
+"""
+Bulk NDJSON import of posts, the counterpart of blog.export, used by
+`manage.py import_posts`.
+
+Records are processed in batches, and each batch is one transaction.
+Categories and tags are resolved (and created) with one query each, and
+the posts and their tag links are inserted with bulk_create.
+
+The idempotency key is a hash of a post's title and content, stored as
+BlogPost.import_key: re-running an import skips the posts it already
+created, and a post already on the site under the record's slug with the
+same title and content counts as present too. A new post whose slug is
+taken by a different post gets the first free slug-2, slug-3, ... instead.
+A record without a slug gets one derived from its title.
+
+bulk_create bypasses the signal handlers, so the importer does their work
+itself. It stamps each post's trending score with its publish event. It
+keeps the original timestamps, recounts the category/tag counters and bumps
+the taxonomy and feed versions. It also embeds the new posts for semantic search.
+"""
+import hashlib
+import json
+import logging
+import re
+
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from . import semantic
+from .counters import recount_all
+from .models import BlogPost, Category, PublicKeyUser, Tag
+from .signals import bump_feed_versions, bump_taxonomy_version, feed_scopes
+from .trending import event_score, publish_weight
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+SLUG_LENGTH = BlogPost._meta.get_field('slug').max_length
+
+
+# Invalid lines reported in detail; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportStats:
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.errors = []
+        # Scopes whose feeds need regenerating
+        self.category_ids = set()
+        self.tag_ids = set()
+
+    @property
+    def processed(self):
+        return self.created + self.skipped + self.invalid
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def import_key(title, content):
+    """Idempotency key of a post: SHA-256 of its trimmed title and content"""
+    return hashlib.sha256(f'{title.strip()}\n{content.strip()}'.encode()).hexdigest()
+
+
+def _datetime(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise InvalidRecord(f'bad datetime {value!r}')
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def _taxonomy_ref(value):
+    """(slug, name) from an exported {'slug', 'name'} object or a bare name"""
+    if isinstance(value, dict):
+        name = (value.get('name') or value.get('slug') or '').strip()
+        slug = slugify(value.get('slug') or name)
+    else:
+        name = str(value or '').strip()
+        slug = slugify(name)
+    return (slug, name) if slug and name else None
+
+
+def clean_record(record):
+    """Validate one decoded NDJSON record into the fields the importer uses"""
+    if not isinstance(record, dict):
+        raise InvalidRecord('not a JSON object')
+    title = str(record.get('title') or '').strip()[:200]
+    content = str(record.get('content') or '').strip()
+    if not title or not content:
+        raise InvalidRecord('title and content are required')
+    tags = record.get('tags') or []
+    if not isinstance(tags, list) or not all(isinstance(tag, (str, dict)) for tag in tags):
+        raise InvalidRecord('tags must be a list of names or {"slug", "name"} objects')
+    fingerprint = record.get('author_fingerprint') or None
+    if fingerprint is not None and not isinstance(fingerprint, str):
+        raise InvalidRecord('author_fingerprint must be a string')
+    slug = slugify(record.get('slug') or '')[:SLUG_LENGTH] or slugify(title)[:SLUG_LENGTH] or 'post'
+    published = bool(record.get('published', True))
+    published_at = _datetime(record.get('published_at'))
+    created_at = _datetime(record.get('created_at'))
+    if published and not published_at:
+        published_at = created_at or timezone.now()
+    return {
+        'title': title,
+        'slug': slug,
+        'import_key': import_key(title, content),
+        'content': content,
+        'excerpt': str(record.get('excerpt') or '')[:500],
+        'author': str(record.get('author') or 'Anonymous')[:100],
+        'author_fingerprint': fingerprint,
+        'category': _taxonomy_ref(record.get('category')),
+        'tags': [ref for ref in map(_taxonomy_ref, tags) if ref],
+        'published': published,
+        'published_at': published_at,
+        'created_at': created_at,
+        'updated_at': _datetime(record.get('updated_at')),
+        'view_count': max(int(record.get('view_count') or 0), 0),
+        'encrypted_data': str(record.get('encrypted_data') or ''),
+    }
+
+
+def resolve_taxonomy(model, refs):
+    """
+    {slug: pk} for (slug, name) refs, creating the missing rows in one
+    bulk_create. A ref whose name is already used under another slug maps to
+    that existing row.
+    """
+    refs = dict(refs)
+    if not refs:
+        return {}
+    existing = dict(model.objects.filter(slug__in=refs).values_list('slug', 'pk'))
+    missing = [model(slug=slug, name=name) for slug, name in refs.items() if slug not in existing]
+    if missing:
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+        existing.update(model.objects.filter(slug__in=refs).values_list('slug', 'pk'))
+        by_name = {name: slug for slug, name in refs.items() if slug not in existing}
+        for name, pk in model.objects.filter(name__in=by_name).values_list('name', 'pk'):
+            existing[by_name[name]] = pk
+    return existing
+
+
+def _restore_timestamps(rows):
+    """bulk_create stamps auto_now(_add) fields; put back the imported ones in one UPDATE"""
+    for name in ('created_at', 'updated_at'):
+        whens = [When(pk=pk, then=Value(values[name])) for pk, values in rows if values[name]]
+        if whens:
+            BlogPost.objects.filter(pk__in=[pk for pk, values in rows if values[name]]).update(
+                **{name: Case(*whens, output_field=DateTimeField())}
+            )
+
+
+def _allocate_slugs(records):
+    """A slug per record that no post has yet: its own, or the first free slug-2, slug-3, ..."""
+    bases = {record['slug'] for record in records}
+    # Every variant of every slug in the batch, in one query
+    pattern = '^(%s)(-[0-9]+)?$' % '|'.join(map(re.escape, sorted(bases)))
+    taken = set(BlogPost.objects.filter(slug__regex=pattern).values_list('slug', flat=True))
+    while True:
+        slugs, assigned = [], set()
+        for record in records:
+            base, slug, n = record['slug'], record['slug'], 1
+            while slug in taken or slug in assigned:
+                n += 1
+                suffix = f'-{n}'
+                slug = base[:SLUG_LENGTH - len(suffix)] + suffix
+            slugs.append(slug)
+            assigned.add(slug)
+        # A slug shortened to fit its suffix can fall outside the pattern above
+        clashes = set(BlogPost.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+        if not clashes:
+            return slugs
+        taken |= clashes
+
+
+def import_batch(records, stats, embed=True):
+    """Import one batch of cleaned records in a single transaction"""
+    # Later duplicates within the batch lose to the first occurrence
+    by_key = {}
+    for record in records:
+        if record['import_key'] in by_key:
+            stats.skipped += 1
+        else:
+            by_key[record['import_key']] = record
+
+    with transaction.atomic():
+        existing = set(BlogPost.objects.filter(import_key__in=by_key).values_list('import_key', flat=True))
+        # Posts written on the site (or imported before import keys) only match by slug and content
+        same_slug = BlogPost.objects.filter(slug__in={record['slug'] for record in by_key.values()})
+        existing.update(import_key(title, content) for title, content in same_slug.values_list('title', 'content'))
+        new = [record for key, record in by_key.items() if key not in existing]
+        stats.skipped += len(by_key) - len(new)
+        if not new:
+            return
+        slugs = _allocate_slugs(new)
+
+        categories = resolve_taxonomy(Category, [r['category'] for r in new if r['category']])
+        tags = resolve_taxonomy(Tag, [ref for r in new for ref in r['tags']])
+        authors = dict(PublicKeyUser.objects.filter(
+            fingerprint__in={r['author_fingerprint'] for r in new if r['author_fingerprint']}
+        ).values_list('fingerprint', 'pk'))
+
+        posts = BlogPost.objects.bulk_create([
+            BlogPost(
+                title=r['title'],
+                slug=slug,
+                import_key=r['import_key'],
+                content=r['content'],
+                excerpt=r['excerpt'],
+                author=r['author'],
+                author_user_id=authors.get(r['author_fingerprint']),
+                category_id=categories.get(r['category'][0]) if r['category'] else None,
+                published=r['published'],
+                published_at=r['published_at'],
+                view_count=r['view_count'],
+                # Signatures are re-verified against the local author on first view
+                encrypted_data=r['encrypted_data'],
+                encrypted_valid=False,
+                trending_score=event_score(publish_weight(), r['published_at']) if r['published'] else None,
+            )
+            for r, slug in zip(new, slugs)
+        ])
+        rows = [(post.pk, record) for post, record in zip(posts, new)]
+        _restore_timestamps(rows)
+        BlogPost.tags.through.objects.bulk_create([
+            BlogPost.tags.through(blogpost_id=pk, tag_id=tags[slug])
+            for pk, record in rows
+            for slug in dict(record['tags'])
+            if slug in tags
+        ], ignore_conflicts=True)
+
+    stats.created += len(posts)
+    stats.category_ids.update(post.category_id for post in posts if post.published and post.category_id)
+    stats.tag_ids.update(tags[slug] for record in new if record['published'] for slug, _name in record['tags'] if slug in tags)
+    if embed:
+        try:
+            semantic.embed_posts(BlogPost.objects.filter(pk__in=[post.pk for post in posts], published=True))
+        except Exception:
+            # The posts are in; `manage.py embed_posts` can catch up later
+            logger.exception('Embedding imported posts failed')
+
+
+def import_lines(lines, batch_size=DEFAULT_BATCH_SIZE, embed=True, progress=None):
+    """Import NDJSON lines (str or bytes); returns ImportStats"""
+    stats = ImportStats()
+    batch = []
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            batch.append(clean_record(json.loads(line)))
+        except (ValueError, TypeError) as e:
+            stats.invalid += 1
+            if len(stats.errors) < MAX_REPORTED_ERRORS:
+                stats.errors.append((line_number, str(e)))
+            continue
+        if len(batch) >= batch_size:
+            import_batch(batch, stats, embed)
+            batch = []
+            if progress:
+                progress(stats)
+    if batch:
+        import_batch(batch, stats, embed)
+        if progress:
+            progress(stats)
+    if stats.created:
+        recount_all()
+        bump_taxonomy_version()
+        bump_feed_versions(feed_scopes(stats.category_ids, stats.tag_ids))
+    return stats
@@ -0,0 +1,87 @@
+"""
+Lite rendering of the reading pages for slow Tor circuits.
+
+The full templates load Materialize CSS and JS, jQuery, jsrsasign and the
+Material Icons font from CDNs, which is several hundred kilobytes before the
+first post shows. In lite mode the post list, post, category and trending
+pages render from blog/lite/ instead. Those templates use one small inline
+stylesheet, no web fonts and no JavaScript. Post bodies still come from the
+|markdown filter, so they reuse the Markdown HTML already in the shared
+cache.
+
+LiteModeMiddleware decides per request:
+
+    ?lite=1 / ?lite=0   switch, and remember the choice in the blog_lite cookie
+    blog_lite cookie    the remembered choice
+    .onion host         lite by default when BLOG_LITE_ONION_DEFAULT is set
+
+Pages that need JavaScript (login, writing a post, the profile) always use
+the full templates. The static snapshot (blog.snapshot) renders the way a
+reader without the cookie would see it: lite when it is published for a
+.onion host with BLOG_LITE_ONION_DEFAULT set, full otherwise. A front server
+that serves the snapshot should pass requests with the cookie or the query
+parameter through to Django.
+
+The middleware works under both WSGI and ASGI.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+
+LITE_COOKIE = 'blog_lite'
+LITE_PARAM = 'lite'
+LITE_COOKIE_AGE = 60 * 60 * 24 * 365
+
+
+def _choice(value):
+    return {'1': True, '0': False}.get(value)
+
+
+def lite_by_default(host):
+    """Whether requests to host get the lite templates when they don't choose"""
+    return getattr(settings, 'BLOG_LITE_ONION_DEFAULT', True) and host.split(':')[0].endswith('.onion')
+
+
+def is_lite(request):
+    """Whether request should get the lite templates"""
+    for choice in (_choice(request.GET.get(LITE_PARAM)), _choice(request.COOKIES.get(LITE_COOKIE))):
+        if choice is not None:
+            return choice
+    return lite_by_default(request.get_host())
+
+
+def template_for(request, name):
+    """The lite variant of a blog/ template name when the request is in lite mode"""
+    if getattr(request, 'lite', False):
+        return name.replace('blog/', 'blog/lite/', 1)
+    return name
+
+
+class LiteModeMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.lite = is_lite(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        request.lite = is_lite(request)
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        choice = request.GET.get(LITE_PARAM)
+        if _choice(choice) is not None and request.COOKIES.get(LITE_COOKIE) != choice:
+            response.set_cookie(LITE_COOKIE, choice, max_age=LITE_COOKIE_AGE, httponly=True, samesite='Lax')
+        if response.get('Content-Type', '').startswith('text/html'):
+            # The same URL renders differently depending on the cookie
+            patch_vary_headers(response, ('Cookie',))
+        return response
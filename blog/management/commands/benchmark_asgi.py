@@ -0,0 +1,219 @@
+"""
+Management command comparing the sync WSGI stack against the ASGI stack with
+async views when clients are slow, as they are over Tor.
+
+No server is started: each side drives Django's handler in-process and
+simulates the network. Every request costs the client one round trip to
+deliver and one more per CHUNK_SIZE bytes of response. Under WSGI that time
+is spent inside a worker thread (--workers of them, like gunicorn --threads),
+while under ASGI it is spent awaiting receive()/send() on the event loop.
+Each side runs in a child process so BLOG_ASYNC_VIEWS can be set before the
+URLconf is imported.
+
+Run it against a database with some published posts.
+"""
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import BlogPost
+
+
+# Response bytes delivered per simulated round trip
+CHUNK_SIZE = 16 * 1024
+
+
+class Command(BaseCommand):
+    help = 'Benchmark WSGI vs ASGI throughput and latency under slow (high-latency) clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients',
+            type=int,
+            default=100,
+            help='Concurrent clients (default: 100)',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=5,
+            help='Requests made by each client (default: 5)',
+        )
+        parser.add_argument(
+            '--latency-ms',
+            type=float,
+            default=300,
+            help='Client round-trip time in milliseconds (default: 300)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='WSGI worker threads (default: 8)',
+        )
+        parser.add_argument(
+            '--path',
+            action='append',
+            help='Path to request; repeatable (default: the post list and a few post pages)',
+        )
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], help='Run a single side (used internally)')
+
+    def handle(self, *args, **options):
+        paths = options['path'] or self._default_paths()
+        if options['mode']:
+            runner = self._run_wsgi if options['mode'] == 'wsgi' else self._run_asgi
+            timings, elapsed, errors = runner(paths, options)
+            self.stdout.write(json.dumps({'timings': timings, 'elapsed': elapsed, 'errors': errors}))
+            return
+
+        self.stdout.write(
+            f'{options["clients"]} clients x {options["requests"]} requests, '
+            f'{options["latency_ms"]:.0f}ms RTT, {len(paths)} paths\n'
+        )
+        self.stdout.write(f'{"stack":<26}{"req/s":>10}{"median ms":>12}{"p95 ms":>10}{"errors":>8}')
+        for mode, label in (('wsgi', f'wsgi ({options["workers"]} threads)'), ('asgi', 'asgi (async views)')):
+            result = self._spawn(mode, paths, options)
+            timings = result['timings']
+            if not timings:
+                raise CommandError(f'{mode}: no successful requests')
+            self.stdout.write(
+                f'{label:<26}{len(timings) / result["elapsed"]:>10.1f}{statistics.median(timings):>12.1f}'
+                f'{self._p95(timings):>10.1f}{result["errors"]:>8}'
+            )
+
+    def _default_paths(self):
+        slugs = list(BlogPost.objects.filter(published=True).order_by('-created_at').values_list('slug', flat=True)[:4])
+        if not slugs:
+            raise CommandError('No published posts to request; pass --path or create some posts')
+        return ['/'] + [f'/post/{slug}/' for slug in slugs]
+
+    def _spawn(self, mode, paths, options):
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'benchmark_asgi', '--mode', mode,
+            '--clients', str(options['clients']), '--requests', str(options['requests']),
+            '--latency-ms', str(options['latency_ms']), '--workers', str(options['workers']),
+        ]
+        for path in paths:
+            command += ['--path', path]
+        env = dict(os.environ, BLOG_ASYNC_VIEWS='1' if mode == 'asgi' else '0')
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f'{mode} run failed:\n{completed.stderr}')
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def _schedule(self, paths, options):
+        # Client i walks the paths starting at its own offset
+        return [
+            [paths[(client + n) % len(paths)] for n in range(options['requests'])]
+            for client in range(options['clients'])
+        ]
+
+    def _run_wsgi(self, paths, options):
+        from django.core.wsgi import get_wsgi_application
+
+        application = get_wsgi_application()
+        latency = options['latency_ms'] / 1000
+        errors = []
+        lock = threading.Lock()
+
+        def serve(path):
+            # The worker reads the request, then writes the body at the client's pace
+            time.sleep(latency)
+            status = []
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'localhost', 'REMOTE_ADDR': '127.0.0.1',
+                'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            body = b''.join(application(environ, lambda s, headers: status.append(s)))
+            for _ in range(max(1, -(-len(body) // CHUNK_SIZE))):
+                time.sleep(latency)
+            if not status[0].startswith('200'):
+                with lock:
+                    errors.append(status[0])
+
+        def client(schedule):
+            # Each request's clock starts when the client sends it, including time queued for a worker
+            timings = []
+            for path in schedule:
+                sent = time.perf_counter()
+                pool.submit(serve, path).result()
+                timings.append((time.perf_counter() - sent) * 1000)
+            return timings
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            with ThreadPoolExecutor(max_workers=options['clients']) as clients:
+                results = list(clients.map(client, self._schedule(paths, options)))
+        elapsed = time.perf_counter() - started
+        timings = [t for result in results for t in result]
+        return timings, elapsed, len(errors)
+
+    def _run_asgi(self, paths, options):
+        from main.asgi import application
+
+        latency = options['latency_ms'] / 1000
+        errors = []
+
+        async def request(path):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'root_path': '', 'headers': [(b'host', b'localhost')],
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            delivered = False
+            disconnect = asyncio.Event()
+
+            async def receive():
+                nonlocal delivered
+                if not delivered:
+                    delivered = True
+                    await asyncio.sleep(latency)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Django listens for a disconnect while the view runs
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start' and message['status'] != 200:
+                    errors.append(message['status'])
+                elif message['type'] == 'http.response.body':
+                    for _ in range(max(1, -(-len(message.get('body', b'')) // CHUNK_SIZE))):
+                        await asyncio.sleep(latency)
+
+            await application(scope, receive, send)
+            disconnect.set()
+
+        async def client(schedule):
+            timings = []
+            for path in schedule:
+                sent = time.perf_counter()
+                await request(path)
+                timings.append((time.perf_counter() - sent) * 1000)
+            return timings
+
+        async def main():
+            return await asyncio.gather(*(client(s) for s in self._schedule(paths, options)))
+
+        started = time.perf_counter()
+        results = asyncio.run(main())
+        elapsed = time.perf_counter() - started
+        timings = [t for result in results for t in result]
+        return timings, elapsed, len(errors)
+
+    def _p95(self, timings):
+        return sorted(timings)[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
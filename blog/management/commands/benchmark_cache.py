@@ -0,0 +1,84 @@
+"""
+Management command to benchmark the shared SQLite cache backend against
+Django's LocMemCache and FileBasedCache.
+"""
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from blog.cache_backend import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = 'Benchmark SQLiteCache against LocMemCache and FileBasedCache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keys',
+            type=int,
+            default=2000,
+            help='Number of distinct keys (default: 2000)',
+        )
+        parser.add_argument(
+            '--value-size',
+            type=int,
+            default=4096,
+            help='Size in bytes of each cached value, roughly a rendered fragment (default: 4096)',
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=3,
+            help='Timed rounds per operation (default: 3)',
+        )
+
+    def handle(self, *args, **options):
+        num_keys = options['keys']
+        value = 'x' * options['value_size']
+        params = {'TIMEOUT': 300, 'OPTIONS': {'MAX_ENTRIES': num_keys * 2}}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            backends = {
+                'SQLiteCache': SQLiteCache(os.path.join(tmp, 'cache.sqlite3'), params),
+                'LocMemCache': LocMemCache('benchmark', params),
+                'FileBasedCache': FileBasedCache(os.path.join(tmp, 'filebased'), params),
+            }
+            self.stdout.write(
+                f'{num_keys} keys, {options["value_size"]} byte values, '
+                f'{options["rounds"]} rounds (median ops/s, higher is better)\n'
+            )
+            self.stdout.write(f'{"backend":<16}{"set":>12}{"get hit":>12}{"get miss":>12}{"get_many":>12}')
+
+            for name, backend in backends.items():
+                keys = [f'fragment:{i}' for i in range(num_keys)]
+                set_rate = self._rate(options['rounds'], num_keys, lambda: [backend.set(k, value) for k in keys])
+                hit_rate = self._rate(options['rounds'], num_keys, lambda: [backend.get(k) for k in keys])
+                miss_rate = self._rate(
+                    options['rounds'], num_keys, lambda: [backend.get(f'missing:{k}') for k in keys]
+                )
+                batches = [keys[i:i + 50] for i in range(0, num_keys, 50)]
+                many_rate = self._rate(
+                    options['rounds'], num_keys, lambda: [backend.get_many(batch) for batch in batches]
+                )
+                self.stdout.write(
+                    f'{name:<16}{set_rate:>12,.0f}{hit_rate:>12,.0f}{miss_rate:>12,.0f}{many_rate:>12,.0f}'
+                )
+                backend.clear()
+
+        self.stdout.write(
+            '\nLocMemCache is per-process: with N workers it holds N copies and is empty '
+            'after every restart. SQLiteCache and FileBasedCache are shared by all workers.'
+        )
+
+    def _rate(self, rounds, ops, func):
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return ops / statistics.median(timings)
@@ -0,0 +1,106 @@
+"""
+Management command to compare the lite templates (see blog.lite) with the full ones.
+
+Renders the reading pages in both modes through the middleware and views
+(blog.snapshot.Renderer) and prints, per page, the median render time, the
+HTML size before and after gzip and the external stylesheets, scripts and
+fonts the page pulls in. Post views are counted as usual, so run it against
+a copy of the database.
+"""
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.middleware import compress, compression_levels
+from blog.models import BlogPost, Category
+from blog.snapshot import Renderer, snapshot_host
+
+
+TAG_RE = re.compile(r'<(script|link)\b([^>]*)>')
+ATTR_RE = re.compile(r'\s(src|href|rel)="([^"]*)"')
+
+
+def subresources(html):
+    """External scripts and stylesheets (including web fonts) the page loads"""
+    urls = []
+    for tag, attrs in TAG_RE.findall(html.decode('utf-8', 'replace')):
+        attrs = dict(ATTR_RE.findall(attrs))
+        url = attrs.get('src') if tag == 'script' else attrs.get('href') if attrs.get('rel') == 'stylesheet' else None
+        if url and '//' in url:
+            urls.append(url)
+    return urls
+
+
+class Command(BaseCommand):
+    help = 'Benchmark bytes and render time of the lite templates against the full ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=10,
+            help='Timed renders per page and mode (default: 10)',
+        )
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help='Page to benchmark, may be repeated (default: /, /trending/, the biggest category and the newest post)',
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self._default_paths()
+        if not paths:
+            raise CommandError('No published posts to benchmark')
+        host = snapshot_host()
+        level = compression_levels().get('text/html', 6) or 6
+        renderers = {'full': Renderer(host, lite=False), 'lite': Renderer(host, lite=True)}
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{"page":<36} {"mode":<5} {"median ms":>10} {"html bytes":>11} {"gzip bytes":>11} {"external":>9}'
+        ))
+        totals = {mode: {'ms': 0.0, 'html': 0, 'gzip': 0, 'external': 0} for mode in renderers}
+        for path in paths:
+            for mode, renderer in renderers.items():
+                status, content = renderer.get(path)
+                if status != 200:
+                    raise CommandError(f'{path} returned {status} in {mode} mode')
+                timings = []
+                for _ in range(options['runs']):
+                    start = time.perf_counter()
+                    renderer.get(path)
+                    timings.append((time.perf_counter() - start) * 1000)
+                median = statistics.median(timings)
+                gzipped = len(compress(content, 'gzip', level))
+                external = subresources(content)
+                totals[mode]['ms'] += median
+                totals[mode]['html'] += len(content)
+                totals[mode]['gzip'] += gzipped
+                totals[mode]['external'] += len(external)
+                self.stdout.write(
+                    f'{path[:36]:<36} {mode:<5} {median:10.2f} {len(content):11d} {gzipped:11d} {len(external):9d}'
+                )
+                if options['verbosity'] > 1:
+                    for url in external:
+                        self.stdout.write(f'    {url}')
+
+        full, lite = totals['full'], totals['lite']
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'lite vs full: {lite["ms"]:.1f} vs {full["ms"]:.1f} ms, '
+            f'{lite["html"]} vs {full["html"]} HTML bytes, {lite["gzip"]} vs {full["gzip"]} gzipped '
+            f'({lite["gzip"] / full["gzip"]:.0%}), {lite["external"]} vs {full["external"]} external resources '
+            '(use -v 2 to list them)'
+        ))
+
+    def _default_paths(self):
+        post = BlogPost.objects.filter(published=True).order_by('-created_at').only('slug').first()
+        if post is None:
+            return []
+        paths = ['/', '/trending/', f'/post/{post.slug}/']
+        category = Category.objects.filter(published_post_count__gt=0).order_by('-published_post_count').first()
+        if category is not None:
+            paths.insert(2, f'/category/{category.slug}/')
+        return paths
@@ -0,0 +1,254 @@
+"""
+Management command to benchmark the blog's read-path queries.
+
+Seeds a synthetic corpus (optionally), then prints the query plan and the
+latency of every read path with and without the composite/partial indexes
+added in migration 0005. The "without" run drops those indexes inside a
+transaction that is rolled back, so the schema is left untouched.
+
+Run it against a copy of the database - seeding a million posts takes a while
+and the rows stay behind until --cleanup is used.
+"""
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from blog.importer import import_key
+from blog.models import BlogPost, Category, PublicKeyUser
+
+
+# Indexes introduced for the read paths (see blog/migrations/0005).
+READ_PATH_INDEXES = [
+    'blog_post_published_idx',
+    'blog_post_category_pub_idx',
+    'blog_post_author_created_idx',
+    'blog_user_login_created_idx',
+]
+
+SEED_PREFIX = 'bench-'
+SEED_CONTENT = 'Lorem ipsum dolor sit amet.'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark read-path queries with and without the composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Number of synthetic posts to insert before benchmarking (default: 0)',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=1000,
+            help='Number of synthetic users to create when seeding (default: 1000)',
+        )
+        parser.add_argument(
+            '--categories',
+            type=int,
+            default=50,
+            help='Number of synthetic categories to create when seeding (default: 50)',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=20,
+            help='Timed runs per query (default: 20)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Rows fetched per list query (default: 50)',
+        )
+        parser.add_argument(
+            '--no-compare',
+            action='store_true',
+            help='Only benchmark with the indexes in place',
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Delete previously seeded synthetic rows and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self._cleanup()
+            return
+
+        if options['seed']:
+            self._seed(options['seed'], options['users'], options['categories'])
+
+        queries = self._queries(options['limit'])
+        if not queries:
+            self.stdout.write(self.style.WARNING('No posts to benchmark - use --seed N first'))
+            return
+
+        with_indexes = self._run(queries, options['runs'], drop_indexes=False)
+        without_indexes = None
+        if not options['no_compare']:
+            without_indexes = self._run(queries, options['runs'], drop_indexes=True)
+
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING('Summary (median ms)'))
+        for name in queries:
+            line = f'  {name:<24} with indexes: {with_indexes[name]:8.3f}'
+            if without_indexes is not None:
+                before = without_indexes[name]
+                speedup = before / with_indexes[name] if with_indexes[name] else float('inf')
+                line += f'   without: {before:8.3f}   speedup: {speedup:6.1f}x'
+            self.stdout.write(line)
+
+    def _queries(self, limit):
+        """Build one queryset per read path, mirroring the views"""
+        post = BlogPost.objects.filter(published=True).exclude(category=None).first()
+        author = PublicKeyUser.objects.filter(posts__isnull=False).first()
+        if post is None:
+            return {}
+
+        cutoff = timezone.now() - timedelta(days=60)
+        queries = {
+            'post_list': BlogPost.objects.filter(published=True).order_by('-created_at')[:limit],
+            'category_detail': BlogPost.objects.filter(
+                category_id=post.category_id, published=True
+            ).order_by('-created_at')[:limit],
+            'cleanup_inactive_users': PublicKeyUser.objects.filter(
+                last_login__isnull=True, created_at__lt=cutoff
+            ).values('pk'),
+        }
+        if author is not None:
+            queries['user_profile'] = BlogPost.objects.filter(
+                author_user=author
+            ).order_by('-created_at')[:limit]
+        return queries
+
+    def _run(self, queries, runs, drop_indexes):
+        label = 'without read-path indexes' if drop_indexes else 'with read-path indexes'
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Benchmark {label}'))
+
+        results = {}
+        with transaction.atomic():
+            if drop_indexes:
+                with connection.cursor() as cursor:
+                    for name in READ_PATH_INDEXES:
+                        cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(name)}')
+
+            for name, queryset in queries.items():
+                self.stdout.write(f'\n{name}')
+                for line in self._explain(queryset, label):
+                    self.stdout.write(f'    {line}')
+
+                # Warm the page cache before timing
+                list(queryset.all())
+                timings = []
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    list(queryset.all())
+                    timings.append((time.perf_counter() - start) * 1000)
+                results[name] = statistics.median(timings)
+                self.stdout.write(
+                    f'    median {results[name]:.3f} ms, '
+                    f'p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:.3f} ms'
+                )
+
+            if drop_indexes:
+                transaction.set_rollback(True)
+        return results
+
+    def _explain(self, queryset, label):
+        """
+        EXPLAIN the queryset's SQL. QuerySet.explain() is not used because
+        sqlite3's statement cache can return the plan prepared before the
+        indexes were dropped; the label comment makes each run's SQL unique.
+        """
+        sql, params = queryset.query.sql_with_params()
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql} /* {label} */', params)
+            return [' '.join(str(col) for col in row) for row in cursor.fetchall()]
+
+    def _seed(self, num_posts, num_users, num_categories):
+        """Insert synthetic rows with raw executemany - bulk_create would overwrite created_at"""
+        self.stdout.write(f'Seeding {num_posts} posts, {num_users} users, {num_categories} categories...')
+        start = time.time()
+        now = timezone.now()
+        rng = random.Random(42)
+
+        Category.objects.bulk_create(
+            [Category(name=f'{SEED_PREFIX}category-{i}', slug=f'{SEED_PREFIX}category-{i}')
+             for i in range(num_categories)],
+            ignore_conflicts=True,
+        )
+        category_ids = list(
+            Category.objects.filter(slug__startswith=SEED_PREFIX).values_list('id', flat=True)
+        )
+
+        users = []
+        for i in range(num_users):
+            # A third of the users never logged in, as cleanup_inactive_users expects
+            last_login = None if i % 3 == 0 else now - timedelta(days=rng.randint(0, 120))
+            users.append(PublicKeyUser(
+                public_key=f'{SEED_PREFIX}key-{i}',
+                fingerprint=f'{SEED_PREFIX}{i:058d}',
+                last_login=last_login,
+            ))
+        PublicKeyUser.objects.bulk_create(users, ignore_conflicts=True)
+        user_ids = list(
+            PublicKeyUser.objects.filter(fingerprint__startswith=SEED_PREFIX).values_list('id', flat=True)
+        )
+
+        table = BlogPost._meta.db_table
+        columns = [
+            'title', 'slug', 'content', 'excerpt', 'author', 'author_user_id', 'category_id',
+            'published', 'encrypted_data', 'encrypted_valid', 'view_count', 'embedding_key', 'import_key',
+            'created_at', 'updated_at', 'published_at',
+        ]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(table),
+            ', '.join(connection.ops.quote_name(c) for c in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        offset = BlogPost.objects.filter(slug__startswith=SEED_PREFIX).count()
+        batch_size = 10000
+        with connection.cursor() as cursor:
+            for batch_start in range(0, num_posts, batch_size):
+                rows = []
+                for i in range(batch_start, min(batch_start + batch_size, num_posts)):
+                    n = offset + i
+                    created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365 * 5))
+                    published = rng.random() < 0.9
+                    created = connection.ops.adapt_datetimefield_value(created)
+                    title = f'Benchmark post {n}'
+                    rows.append((
+                        title, f'{SEED_PREFIX}{n}', SEED_CONTENT, '',
+                        'Anonymous', rng.choice(user_ids), rng.choice(category_ids + [None]),
+                        published, '', False, 0, '', import_key(title, SEED_CONTENT),
+                        created, created, created if published else None,
+                    ))
+                with transaction.atomic():
+                    cursor.executemany(sql, rows)
+                self.stdout.write(f'  {batch_start + len(rows)}/{num_posts}', ending='\r')
+                self.stdout.flush()
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+            else:
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(table)}')
+
+        self.stdout.write(self.style.SUCCESS(f'\nSeeded in {time.time() - start:.1f}s'))
+
+    def _cleanup(self):
+        posts = BlogPost.objects.filter(slug__startswith=SEED_PREFIX).delete()[0]
+        users = PublicKeyUser.objects.filter(fingerprint__startswith=SEED_PREFIX).delete()[0]
+        categories = Category.objects.filter(slug__startswith=SEED_PREFIX).delete()[0]
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {posts} posts, {users} users, {categories} categories')
+        )
@@ -0,0 +1,111 @@
+"""
+Management command to benchmark semantic search: brute force against the
+IVF partitioned index, reporting recall@k and latency for several probe counts.
+
+Runs on synthetic clustered unit vectors, so it needs no posts and no model.
+"""
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from blog.semantic import SemanticIndex, normalise
+
+
+class Command(BaseCommand):
+    help = 'Benchmark brute-force vs IVF semantic search (recall@k and latency)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts',
+            type=int,
+            default=100000,
+            help='Number of indexed vectors (default: 100000)',
+        )
+        parser.add_argument(
+            '--dim',
+            type=int,
+            default=256,
+            help='Embedding dimension (default: 256)',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='Number of timed queries (default: 200)',
+        )
+        parser.add_argument(
+            '-k',
+            type=int,
+            default=10,
+            help='Results per query (default: 10)',
+        )
+        parser.add_argument(
+            '--noise',
+            type=float,
+            default=1.0,
+            help='Spread of vectors around their topic centre, relative to its norm (default: 1.0)',
+        )
+        parser.add_argument(
+            '--probes',
+            default='1,2,4,8,16,32',
+            help='Comma-separated IVF probe counts to try (default: 1,2,4,8,16,32)',
+        )
+
+    def handle(self, *args, **options):
+        n, dim, k = options['posts'], options['dim'], options['k']
+        rng = np.random.default_rng(0)
+        # Topic-like structure: vectors scattered around a few hundred centres
+        centres = normalise(rng.standard_normal((max(1, n // 500), dim), dtype=np.float32))
+        scale = options['noise'] / np.sqrt(dim)
+        vectors = normalise(centres[rng.integers(0, len(centres), n)] + scale * rng.standard_normal((n, dim), dtype=np.float32))
+        # Queries land near existing posts, like a search for a known topic
+        queries = normalise(vectors[rng.integers(0, n, options['queries'])]
+                            + 0.5 * scale * rng.standard_normal((options['queries'], dim), dtype=np.float32))
+        post_ids = np.arange(1, n + 1)
+
+        self.stdout.write(f'{n} vectors, dim {dim}, {len(queries)} queries, k={k}\n')
+
+        start = time.perf_counter()
+        index = SemanticIndex(dim, ivf_min_size=0, background=False)
+        index.add_many(post_ids.tolist(), vectors)
+        self.stdout.write(
+            f'Index build (incl. k-means, {index.stats()["ivf_lists"]} lists): {time.perf_counter() - start:.2f}s\n'
+        )
+
+        exact, brute_ms = self._run(lambda q: index.search(q, k=k, exact=True), queries)
+        self.stdout.write(f'{"method":<16}{"recall@k":>10}{"median ms":>12}{"p95 ms":>10}{"speedup":>10}')
+        self.stdout.write(f'{"brute force":<16}{1.0:>10.3f}{statistics.median(brute_ms):>12.2f}'
+                          f'{self._p95(brute_ms):>10.2f}{1.0:>9.1f}x')
+
+        for probes in [int(p) for p in options['probes'].split(',') if p.strip()]:
+            results, ivf_ms = self._run(lambda q: index.search(q, k=k, probes=probes), queries)
+            recall = statistics.mean(
+                len({pid for pid, _ in got} & {pid for pid, _ in want}) / max(1, len(want))
+                for got, want in zip(results, exact)
+            )
+            speedup = statistics.median(brute_ms) / statistics.median(ivf_ms)
+            self.stdout.write(f'{f"ivf probes={probes}":<16}{recall:>10.3f}{statistics.median(ivf_ms):>12.2f}'
+                              f'{self._p95(ivf_ms):>10.2f}{speedup:>9.1f}x')
+
+        # Incremental updates go to the unpartitioned tail / tombstones
+        extra = normalise(rng.standard_normal((1000, dim), dtype=np.float32))
+        start = time.perf_counter()
+        for offset, vector in enumerate(extra):
+            index.add(n + 1 + offset, vector)
+        for post_id in range(1, 1001):
+            index.remove(post_id)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'\n1000 adds + 1000 removes: {elapsed * 1000:.1f}ms ({index.stats()})')
+
+    def _run(self, search, queries):
+        results, timings = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(search(query))
+            timings.append((time.perf_counter() - start) * 1000)
+        return results, timings
+
+    def _p95(self, timings):
+        return sorted(timings)[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
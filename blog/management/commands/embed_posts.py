@@ -0,0 +1,29 @@
+"""
+Management command to compute missing or stale post embeddings for semantic search
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import semantic
+from blog.models import BlogPost
+
+
+class Command(BaseCommand):
+    help = 'Embed published posts whose embedding is missing or was computed from other text or another model'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=64,
+            help='Posts per embedding call (default: 64)',
+        )
+
+    def handle(self, *args, **options):
+        embedder = semantic.get_embedder()
+        self.stdout.write(f'Embedding with {embedder.model_id}...')
+        start = time.perf_counter()
+        updated = semantic.embed_posts(BlogPost.objects.filter(published=True), batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Embedded {updated} post(s) in {elapsed:.1f}s'))
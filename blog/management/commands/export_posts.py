@@ -0,0 +1,78 @@
+"""
+Management command to export every post as NDJSON (see blog.export).
+
+If an export is interrupted, rerun it with --after-id set to the id on the
+last complete line, and it appends to the same file.
+"""
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.export import DEFAULT_CHUNK_SIZE, gzip_chunks, iter_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Stream all posts with category, tags and author fingerprint as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='File to write, or - for stdout (default: -)',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Gzip the output',
+        )
+        parser.add_argument(
+            '--after-id',
+            type=int,
+            default=0,
+            help='Only export posts with a greater id, appending to --output (default: 0)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Posts read per query (default: {DEFAULT_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--published-only',
+            action='store_true',
+            help='Skip unpublished drafts',
+        )
+
+    def handle(self, *args, **options):
+        self.posts = 0
+        chunks = self._counted(iter_ndjson(
+            after_id=options['after_id'],
+            chunk_size=options['chunk_size'],
+            published_only=options['published_only'],
+        ))
+        if options['gzip']:
+            # Appending makes a multi-member gzip file, which gunzip reads as one stream
+            chunks = gzip_chunks(chunks)
+
+        start = time.perf_counter()
+        written = 0
+        if options['output'] == '-':
+            output = sys.stdout.buffer
+        else:
+            output = open(options['output'], 'ab' if options['after_id'] else 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+            output.flush()
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        elapsed = time.perf_counter() - start
+        self.stderr.write(self.style.SUCCESS(f'Exported {self.posts} post(s), {written} bytes in {elapsed:.1f}s'))
+
+    def _counted(self, chunks):
+        for chunk in chunks:
+            self.posts += chunk.count(b'\n')
+            yield chunk
@@ -0,0 +1,68 @@
+"""
+Management command to bulk-import posts from NDJSON (see blog.importer),
+e.g. the output of export_posts from another instance.
+
+Gzipped input is detected automatically. Re-running an import is safe:
+posts already imported (same title and content) are skipped.
+"""
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.importer import DEFAULT_BATCH_SIZE, import_lines
+
+
+class Command(BaseCommand):
+    help = 'Import posts from an NDJSON file (or - for stdin) with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='NDJSON file, optionally gzipped, or - for stdin')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Posts per transaction (default: {DEFAULT_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--no-embed',
+            action='store_true',
+            help='Skip embedding the imported posts (run embed_posts later)',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        try:
+            source = sys.stdin.buffer if options['input'] == '-' else open(options['input'], 'rb')
+        except OSError as e:
+            raise CommandError(e)
+
+        start = time.perf_counter()
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'  {stats.processed} processed, {stats.created} created ({stats.created / elapsed:.0f}/s)')
+
+        try:
+            # Gzip magic number; peek() leaves the bytes in the buffer
+            if source.peek(2)[:2] == b'\x1f\x8b':
+                source = gzip.GzipFile(fileobj=source)
+            stats = import_lines(
+                source, batch_size=options['batch_size'], embed=not options['no_embed'], progress=progress,
+            )
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+        elapsed = time.perf_counter() - start
+
+        for line_number, error in stats.errors:
+            self.stdout.write(self.style.WARNING(f'  line {line_number}: {error}'))
+        if stats.invalid:
+            self.stdout.write(self.style.WARNING(f'{stats.invalid} invalid line(s) skipped'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats.created} post(s), skipped {stats.skipped} already present, '
+            f'in {elapsed:.1f}s ({stats.processed / elapsed:.0f} records/s)'
+        ))
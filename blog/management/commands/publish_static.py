@@ -0,0 +1,47 @@
+"""
+Management command to render the public read path into a static snapshot (see blog.snapshot)
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.http.request import validate_host
+
+from blog.snapshot import publish, snapshot_host
+
+
+class Command(BaseCommand):
+    help = 'Render post list, posts, categories, feeds and sitemap to pre-compressed static files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Snapshot directory (default: STATIC_SNAPSHOT_ROOT)',
+        )
+        parser.add_argument(
+            '--host',
+            help='Host name used for absolute URLs (default: STATIC_SNAPSHOT_HOST)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-render every page, ignoring the manifest stamps',
+        )
+
+    def handle(self, *args, **options):
+        root = options['output'] or getattr(settings, 'STATIC_SNAPSHOT_ROOT', None)
+        if not root:
+            raise CommandError('Pass --output or set STATIC_SNAPSHOT_ROOT')
+        host = options['host'] or snapshot_host()
+        if not validate_host(host, settings.ALLOWED_HOSTS):
+            raise CommandError(f'{host} is not in ALLOWED_HOSTS')
+        self.stdout.write(f'Publishing to {root} as {host}...')
+        start = time.perf_counter()
+        stats = publish(root, full=options['full'], host=host)
+        elapsed = time.perf_counter() - start
+        if stats['failed']:
+            self.stdout.write(self.style.WARNING(f'{stats["failed"]} page(s) failed to render (see log)'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats["pages"]} page(s): {stats["rendered"]} rendered, {stats["written"]} written, '
+            f'{stats["removed"]} removed in {elapsed:.1f}s'
+        ))
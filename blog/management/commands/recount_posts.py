@@ -0,0 +1,40 @@
+"""
+Management command to recompute the published post counters on categories and tags
+"""
+from django.core.management.base import BaseCommand
+
+from blog.counters import recount_all
+from blog.signals import bump_taxonomy_version
+
+
+class Command(BaseCommand):
+    help = 'Recompute published_post_count on categories and tags and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without correcting it',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        results = recount_all(apply=not dry_run)
+
+        total = 0
+        for model, drift in results.items():
+            name = model._meta.verbose_name_plural
+            total += len(drift)
+            if not drift:
+                self.stdout.write(f'{name.capitalize()}: no drift')
+                continue
+            self.stdout.write(self.style.WARNING(f'{name.capitalize()}: {len(drift)} drifted counter(s)'))
+            for obj, stored, actual in drift:
+                self.stdout.write(f'  - {obj.name}: stored {stored}, actual {actual}')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'DRY RUN: {total} counter(s) would be corrected'))
+        else:
+            if total:
+                bump_taxonomy_version()
+            self.stdout.write(self.style.SUCCESS(f'Corrected {total} counter(s)'))
@@ -0,0 +1,230 @@
+"""
+Response compression with a cache of the compressed bodies.
+
+Bandwidth is the main latency cost over Tor, but compressing every response
+costs CPU on every hit. CompressedResponseCacheMiddleware compresses a
+cacheable response once per (strong ETag, encoding) and keeps the compressed
+bytes in a per-process LRU bounded by BLOG_COMPRESSION_CACHE_MAX_BYTES. Later
+requests for the same representation get those bytes without recompressing.
+Responses without an ETag get one from a hash of the body, which is far
+cheaper than compressing it. A weak ETag doesn't pin the bytes, so those
+bodies are cached under the hash of the body too.
+
+Levels come from BLOG_COMPRESSION_LEVELS by content type (0 disables).
+Responses that carry a CSRF token or set a cookie are sent uncompressed.
+Compressing secrets next to reflected input invites BREACH, and such bodies
+are unique per visitor anyway, so caching them is pointless. Streaming
+responses have no body to key a cache on. They are compressed chunk by chunk
+as they are produced, with a sync flush after each chunk so the client can
+render what has arrived so far.
+
+Under ASGI the middleware runs async. Compressing a body that isn't cached
+yet is CPU-bound, so it happens in a worker thread instead of on the event
+loop.
+"""
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+
+DEFAULT_LEVELS = {
+    'text/html': 6,
+    'application/json': 6,
+    'application/xml': 9,
+    'application/rss+xml': 9,
+    'application/atom+xml': 9,
+    'application/x-ndjson': 6,
+    'text/css': 9,
+    'text/javascript': 9,
+    'application/javascript': 9,
+    'text/plain': 6,
+}
+
+# Smaller bodies don't fit fewer packets once compressed
+MIN_LENGTH = 200
+
+# zlib wbits per supported encoding, in order of preference
+ENCODINGS = {
+    'gzip': 31,
+    'deflate': 15,
+}
+
+
+def compression_levels():
+    return getattr(settings, 'BLOG_COMPRESSION_LEVELS', DEFAULT_LEVELS)
+
+
+def accepted_encoding(header):
+    """The preferred encoding the client accepts (by q-value, then ENCODINGS order), or None"""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get('*', 0.0)
+    ranked = [(accepted.get(name, wildcard), -order, name) for order, name in enumerate(ENCODINGS)]
+    q, _, name = max(ranked)
+    return name if q > 0 else None
+
+
+def compress(content, encoding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(content) + compressor.flush()
+
+
+def compress_chunks(chunks, encoding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    for chunk in chunks:
+        if chunk:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+async def acompress_chunks(chunks, encoding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    async for chunk in chunks:
+        if chunk:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+class CompressedBodyCache:
+    """Thread-safe LRU of compressed bodies, bounded by their total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _key, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+compressed_bodies = CompressedBodyCache(getattr(settings, 'BLOG_COMPRESSION_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+
+class CompressedResponseCacheMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if response.streaming:
+            # Only wraps the iterator; the chunks are compressed as they are sent
+            return self.process_response(request, response)
+        return await sync_to_async(self.process_response, thread_sensitive=False)(request, response)
+
+    def process_response(self, request, response):
+        # The representation depends on Accept-Encoding whether or not this one is compressed
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if (
+            response.status_code != 200
+            or response.has_header('Content-Encoding')
+            or response.cookies
+            or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+            or (not response.streaming and len(response.content) < MIN_LENGTH)
+        ):
+            return response
+        level = compression_levels().get(response.get('Content-Type', '').split(';')[0].strip().lower(), 0)
+        if not level:
+            return response
+        encoding = accepted_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+        if response.streaming:
+            return self.compress_stream(response, encoding, level)
+
+        etag = response.get('ETag')
+        body_hash = None
+        if not etag:
+            body_hash = '"%s"' % hashlib.md5(response.content, usedforsecurity=False).hexdigest()
+            etag = response['ETag'] = body_hash
+        elif etag.startswith('W/'):
+            # A weak ETag only promises equivalent content, not these bytes
+            body_hash = '"%s"' % hashlib.md5(response.content, usedforsecurity=False).hexdigest()
+        key = (body_hash or etag, encoding, level)
+        body = compressed_bodies.get(key)
+        if body is None:
+            body = compress(response.content, encoding, level)
+            compressed_bodies.set(key, body)
+        if len(body) >= len(response.content):
+            return response
+
+        response.content = body
+        response['Content-Length'] = str(len(body))
+        response['Content-Encoding'] = encoding
+        # The compressed bytes differ from the identity representation the ETag names
+        if not etag.startswith('W/'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    def compress_stream(self, response, encoding, level):
+        chunks = response.streaming_content
+        if response.is_async:
+            response.streaming_content = acompress_chunks(chunks, encoding, level)
+        else:
+            response.streaming_content = compress_chunks(chunks, encoding, level)
+        if response.has_header('Content-Length'):
+            del response['Content-Length']
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and not etag.startswith('W/'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_remove_blogpost_signature_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('published', True)), fields=['-created_at'], name='blog_post_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('published', True)), fields=['category', '-created_at'], name='blog_post_category_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['author_user', '-created_at'], name='blog_post_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publickeyuser',
+            index=models.Index(fields=['last_login', 'created_at'], name='blog_user_login_created_idx'),
+        ),
+        # A left prefix of blog_user_login_created_idx, so it only slows writes
+        migrations.RemoveIndex(
+            model_name='publickeyuser',
+            name='blog_public_last_lo_044d2d_idx',
+        ),
+    ]
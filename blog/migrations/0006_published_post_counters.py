@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:18
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_counters(apps, schema_editor):
+    for model_name in ('Category', 'Tag'):
+        model = apps.get_model('blog', model_name)
+        rows = model.objects.annotate(
+            actual_count=Count('posts', filter=Q(posts__published=True))
+        ).filter(actual_count__gt=0)
+        for obj in rows:
+            obj.published_post_count = obj.actual_count
+        model.objects.bulk_update(rows, ['published_post_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_read_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='published_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of published posts in this category'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='published_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of published posts with this tag'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['-published_post_count', 'name'], name='blog_catego_publish_3b8d46_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-published_post_count', 'name'], name='blog_tag_publish_64da25_idx'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_published_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='view_count',
+            field=models.PositiveBigIntegerField(default=0, editable=False, help_text='Number of times the post has been viewed'),
+        ),
+    ]
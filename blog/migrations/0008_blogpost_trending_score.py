@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:19
+
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+
+# Frozen copies of blog.trending's EPOCH, default half-life and publish weight,
+# so later changes to the module or the settings can't alter this migration
+EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+DECAY_RATE = math.log(2) / (24 * 3600)
+PUBLISH_WEIGHT = 10.0
+
+
+def seed_publish_events(apps, schema_editor):
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    posts = []
+    for post in BlogPost.objects.filter(published=True).only('pk', 'created_at', 'published_at').iterator(chunk_size=2000):
+        when = post.published_at or post.created_at
+        post.trending_score = DECAY_RATE * (when - EPOCH).total_seconds() + math.log(PUBLISH_WEIGHT)
+        posts.append(post)
+        if len(posts) >= 2000:
+            BlogPost.objects.bulk_update(posts, ['trending_score'])
+            posts = []
+    BlogPost.objects.bulk_update(posts, ['trending_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_blogpost_view_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='trending_score',
+            field=models.FloatField(blank=True, editable=False, help_text='Log-space time-decayed event score (see blog.trending)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('published', True)), fields=['-trending_score'], name='blog_post_trending_idx'),
+        ),
+        migrations.RunPython(seed_publish_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_blogpost_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='embedding',
+            field=models.BinaryField(help_text='Little-endian float32 text embedding (see blog.semantic)', null=True),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='embedding_key',
+            field=models.CharField(blank=True, editable=False, help_text='Model and text hash the embedding was computed from', max_length=200),
+        ),
+    ]
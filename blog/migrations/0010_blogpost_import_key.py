@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_blogpost_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='import_key',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the title and content the post was imported with (see blog.importer)', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('import_key', ''), _negated=True), fields=['import_key'], name='blog_post_import_key_idx'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
@@ -9,11 +9,15 @@ class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    published_post_count = models.PositiveIntegerField(default=0, editable=False, help_text='Number of published posts in this category')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name_plural = 'categories'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['-published_post_count', 'name']),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -25,10 +29,14 @@ class Category(models.Model):
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=50, unique=True)
+    published_post_count = models.PositiveIntegerField(default=0, editable=False, help_text='Number of published posts with this tag')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['-published_post_count', 'name']),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -46,6 +54,11 @@ class BlogPost(models.Model):
     published = models.BooleanField(default=False, help_text='Only published posts are visible to visitors')
     encrypted_data = models.TextField(blank=True, help_text='Encrypted fingerprint and content hash')
     encrypted_valid = models.BooleanField(default=False, help_text='Whether the encryption has been verified')
+    view_count = models.PositiveBigIntegerField(default=0, editable=False, help_text='Number of times the post has been viewed')
+    trending_score = models.FloatField(null=True, blank=True, editable=False, help_text='Log-space time-decayed event score (see blog.trending)')
+    embedding = models.BinaryField(null=True, editable=False, help_text='Little-endian float32 text embedding (see blog.semantic)')
+    embedding_key = models.CharField(max_length=200, blank=True, editable=False, help_text='Model and text hash the embedding was computed from')
+    import_key = models.CharField(max_length=64, blank=True, editable=False, help_text='Hash of the title and content the post was imported with (see blog.importer)')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(null=True, blank=True, help_text='Publication date')
@@ -55,6 +68,32 @@ class BlogPost(models.Model):
         indexes = [
             models.Index(fields=['-created_at']),
             models.Index(fields=['slug']),
+            # post_list: WHERE published ORDER BY created_at DESC
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(published=True),
+                name='blog_post_published_idx',
+            ),
+            # category_detail / post_list?category=: WHERE category AND published
+            models.Index(
+                fields=['category', '-created_at'],
+                condition=models.Q(published=True),
+                name='blog_post_category_pub_idx',
+            ),
+            # user_profile: WHERE author_user ORDER BY created_at DESC
+            models.Index(fields=['author_user', '-created_at'], name='blog_post_author_created_idx'),
+            # trending listing: WHERE published ORDER BY trending_score DESC
+            models.Index(
+                fields=['-trending_score'],
+                condition=models.Q(published=True),
+                name='blog_post_trending_idx',
+            ),
+            # import_posts: WHERE import_key IN (...)
+            models.Index(
+                fields=['import_key'],
+                condition=~models.Q(import_key=''),
+                name='blog_post_import_key_idx',
+            ),
         ]
 
     def __str__(self) -> str:
@@ -63,10 +102,24 @@ class BlogPost(models.Model):
     def get_absolute_url(self):
         return reverse('blog:post_detail', kwargs={'slug': self.slug})
 
+    # Maintained with F() updates by the view counter and trending scores;
+    # a plain save() of a stale instance must not write them back.
+    COUNTER_FIELDS = ('view_count', 'trending_score')
+    # Written by blog.semantic after the post is saved
+    DERIVED_FIELDS = COUNTER_FIELDS + ('embedding', 'embedding_key')
+
     def save(self, *args, **kwargs):
         if self.published and not self.published_at:
             self.published_at = timezone.now()
-        super().save(*args, **kwargs)
+        if kwargs.get('update_fields') is None and not self._state.adding and self.pk:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        # Keep the row and the category/tag counters updated by the
+        # pre_save/post_save handlers in one transaction.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
 
 class PublicKeyUserManager(BaseUserManager):
@@ -104,7 +157,9 @@ class PublicKeyUser(AbstractBaseUser):
         verbose_name_plural = 'Users'
         indexes = [
             models.Index(fields=['fingerprint']),
-            models.Index(fields=['last_login']),
+            # cleanup_inactive_users: last_login < cutoff OR (last_login IS NULL AND created_at < cutoff);
+            # also serves lookups on last_login alone
+            models.Index(fields=['last_login', 'created_at'], name='blog_user_login_created_idx'),
         ]
     
     def __str__(self):
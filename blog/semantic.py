@@ -0,0 +1,531 @@
+"""
+Semantic search over published posts.
+
+Each published post is embedded when it is saved (see blog.signals) and the
+float32 vector is stored on the row. Every process keeps the vectors of all
+published posts in one contiguous matrix with a post id map, so a query is
+a single matrix-vector product plus an argpartition for the top k.
+
+Above BLOG_SEMANTIC_IVF_MIN_POSTS posts the index also builds an IVF
+partition: k-means centroids, with the matrix reordered so every centroid's
+posts are one contiguous block. A query then scores the centroids, and only
+the BLOG_SEMANTIC_IVF_PROBES closest blocks plus the rows added since the
+last build. Removed rows are tombstoned until the next rebuild, which runs
+on a background thread: queries keep using the current layout until the
+new one is swapped in.
+
+Saved and deleted posts are queued by blog.signals after commit and
+embedded on a background thread (BLOG_SEMANTIC_BACKGROUND), so neither the
+model nor the request waits on the other. Changes are applied to the local
+index and announce a new version through the shared cache; other processes
+reload when they see a version they didn't produce.
+
+Embeddings come from BLOG_SEMANTIC_ENGINE: 'hashing' (default, a
+dependency-free hashed bag of words and bigrams) or the name of a webui
+engine such as 'large_feature_extraction', used through webui.batching.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from main.versions import bump_version, get_version
+
+from .models import BlogPost
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_KEY = 'blog:semantic_index_version'
+
+# Characters of a post fed to the embedder
+MAX_EMBED_CHARS = 4000
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word bigrams, log-scaled and L2-normalised"""
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.model_id = f'hashing-{dim}'
+
+    def embed(self, texts):
+        result = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(text.lower())
+            features = tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                h = zlib.crc32(feature.encode('utf-8'))
+                result[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        np.copysign(np.log1p(np.abs(result)), result, out=result)
+        return normalise(result)
+
+
+class EngineEmbedder:
+    """Embeds through a webui engine, sharing its micro-batcher and embedding store"""
+
+    def __init__(self, engine_name):
+        self.engine_name = engine_name
+
+    @property
+    def model_id(self):
+        from webui.batching import embedding_model_id
+        from webui.registry import registry
+        return embedding_model_id(self.engine_name, registry.get(self.engine_name)) or self.engine_name
+
+    def embed(self, texts):
+        from webui.batching import embed_texts
+        from webui.registry import registry
+        registry.get(self.engine_name)
+        return normalise(embed_texts(self.engine_name, list(texts)))
+
+
+def normalise(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            engine = getattr(settings, 'BLOG_SEMANTIC_ENGINE', 'hashing')
+            _embedder = HashingEmbedder() if engine == 'hashing' else EngineEmbedder(engine)
+        return _embedder
+
+
+def post_text(post):
+    return f'{post.title}\n{post.excerpt}\n{post.content}'[:MAX_EMBED_CHARS]
+
+
+def embedding_key(model_id, text):
+    """Identifies what an embedding was computed from, so unchanged posts aren't re-embedded"""
+    return f'{model_id}:{hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]}'
+
+
+def to_bytes(vector):
+    return np.ascontiguousarray(vector, dtype='<f4').tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype='<f4')
+
+
+def kmeans(vectors, k, iterations=10, seed=0, sample_size=65536):
+    """Spherical k-means centroids of unit vectors, trained on a sample"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty clusters from random points
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalise(sums)
+    return centroids
+
+
+class SemanticIndex:
+    """Contiguous float32 matrix of unit vectors with an id map and an optional IVF partition"""
+
+    def __init__(self, dim, ivf_min_size=None, probes=None, background=True):
+        self.dim = dim
+        self.background = background
+        self.ivf_min_size = ivf_min_size if ivf_min_size is not None else getattr(
+            settings, 'BLOG_SEMANTIC_IVF_MIN_POSTS', 20000)
+        self.probes = probes or getattr(settings, 'BLOG_SEMANTIC_IVF_PROBES', 8)
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._positions = {}
+        self._centroids = None
+        self._offsets = None
+        self._partitioned = 0
+        self._lock = threading.RLock()
+        self._rebuilder = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, post_id):
+        return post_id in self._positions
+
+    # -- updates ------------------------------------------------------------------------
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= len(self._matrix):
+            return
+        capacity = max(needed, 2 * len(self._matrix), 64)
+        for name in ('_matrix', '_ids', '_alive'):
+            old = getattr(self, name)
+            grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:self._size] = old[:self._size]
+            setattr(self, name, grown)
+
+    def add_many(self, post_ids, vectors):
+        """Insert or replace vectors; rows are appended (amortised O(1) each)"""
+        vectors = normalise(np.asarray(vectors, dtype=np.float32).reshape(len(post_ids), self.dim))
+        with self._lock:
+            self.remove_many(post_ids)
+            self._reserve(len(post_ids))
+            end = self._size + len(post_ids)
+            self._matrix[self._size:end] = vectors
+            self._ids[self._size:end] = post_ids
+            self._alive[self._size:end] = True
+            for offset, post_id in enumerate(post_ids):
+                self._positions[post_id] = self._size + offset
+            self._size = end
+            self._maybe_rebuild()
+
+    def add(self, post_id, vector):
+        self.add_many([post_id], [vector])
+
+    def remove_many(self, post_ids):
+        with self._lock:
+            for post_id in post_ids:
+                row = self._positions.pop(post_id, None)
+                if row is not None:
+                    self._alive[row] = False
+
+    def remove(self, post_id):
+        self.remove_many([post_id])
+
+    def _needs_rebuild(self):
+        dead = self._size - len(self._positions)
+        tail = self._size - self._partitioned
+        if dead > max(1024, self._size // 4):
+            return True
+        if self._centroids is None:
+            return 0 < len(self._positions) >= self.ivf_min_size
+        return tail > max(1024, self._partitioned // 10)
+
+    def _maybe_rebuild(self):
+        if not self._needs_rebuild():
+            return
+        if not self.background:
+            self.rebuild()
+        elif self._rebuilder is None:
+            self._rebuilder = threading.Thread(target=self._run_rebuilds, name='semantic-rebuild', daemon=True)
+            self._rebuilder.start()
+
+    def _run_rebuilds(self):
+        try:
+            while True:
+                self.rebuild()
+                with self._lock:
+                    if not self._needs_rebuild():
+                        self._rebuilder = None
+                        return
+        except Exception:
+            logger.exception('Semantic index rebuild failed')
+            with self._lock:
+                self._rebuilder = None
+
+    def wait_for_rebuild(self, timeout=None):
+        """Block until a background rebuild in progress has finished"""
+        rebuilder = self._rebuilder
+        if rebuilder is not None:
+            rebuilder.join(timeout)
+
+    def rebuild(self):
+        """
+        Drop tombstones and, for a large index, retrain the IVF partition.
+        k-means runs on a copy without holding the lock; rows added or
+        removed meanwhile are carried over when the result is swapped in.
+        """
+        with self._lock:
+            size = self._size
+            live = np.flatnonzero(self._alive[:size])
+            matrix, ids = self._matrix[live], self._ids[live]
+        centroids = offsets = None
+        if 0 < len(live) >= self.ivf_min_size:
+            lists = max(1, int(math.sqrt(len(live))))
+            centroids = kmeans(matrix, lists)
+            assignment = np.argmax(matrix @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind='stable')
+            matrix, ids, live = matrix[order], ids[order], live[order]
+            offsets = np.searchsorted(assignment[order], np.arange(lists + 1))
+        with self._lock:
+            # A copied row is still current only if its post maps to the same row
+            alive = np.fromiter(
+                (self._positions.get(post_id) == row for post_id, row in zip(ids.tolist(), live.tolist())),
+                dtype=bool, count=len(ids),
+            )
+            tail = slice(size, self._size)
+            self._matrix = np.ascontiguousarray(np.concatenate([matrix, self._matrix[tail]]))
+            self._ids = np.concatenate([ids, self._ids[tail]])
+            self._alive = np.concatenate([alive, self._alive[tail]])
+            self._size = len(self._ids)
+            self._centroids, self._offsets = centroids, offsets
+            self._partitioned = len(ids) if centroids is not None else 0
+            self._positions = {
+                post_id: row for row, post_id in enumerate(self._ids.tolist()) if self._alive[row]
+            }
+
+    # -- queries ------------------------------------------------------------------------------
+
+    def vector(self, post_id):
+        row = self._positions.get(post_id)
+        return None if row is None else self._matrix[row].copy()
+
+    def search(self, query, k=10, exclude=(), exact=False, probes=None):
+        """
+        Top k (post_id, cosine) pairs for a query vector, best first. exact
+        scores every row even when an IVF partition exists.
+        """
+        query = normalise(np.asarray(query, dtype=np.float32).reshape(self.dim))
+        with self._lock:
+            if self._centroids is None or exact:
+                ranges = [(0, self._size)]
+            else:
+                probes = min(probes or self.probes, len(self._centroids))
+                nearest = np.argpartition(-(self._centroids @ query), probes - 1)[:probes]
+                ranges = [(self._offsets[c], self._offsets[c + 1]) for c in nearest]
+                ranges.append((self._partitioned, self._size))
+            ranges = [(start, end) for start, end in ranges if end > start]
+            if not ranges:
+                return []
+            # Contiguous blocks: score them in place, no gather copy
+            scores = np.concatenate([self._matrix[start:end] @ query for start, end in ranges])
+            rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+            scores[~self._alive[rows]] = -np.inf
+            for post_id in exclude:
+                row = self._positions.get(post_id)
+                if row is not None:
+                    scores[rows == row] = -np.inf
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [
+                (int(self._ids[rows[i]]), float(scores[i]))
+                for i in top if scores[i] > -np.inf
+            ]
+
+    def stats(self):
+        return {
+            'posts': len(self),
+            'rows': self._size,
+            'dim': self.dim,
+            'ivf_lists': None if self._centroids is None else len(self._centroids),
+            'unpartitioned_rows': self._size - self._partitioned,
+        }
+
+
+# -- process-wide index --------------------------------------------------------------------
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def _bump_shared_version():
+    """Announce a change; returns whether no other process changed the index meanwhile"""
+    global _index_version
+    version = bump_version(INDEX_VERSION_KEY)
+    # A reseeded counter jumps to the clock, so it is never one step ahead
+    in_step = _index_version is not None and version == _index_version + 1
+    _index_version = version if in_step else None
+    return in_step
+
+
+def load_index():
+    """Build an index from the stored embeddings of published posts"""
+    model_id = get_embedder().model_id
+    rows = BlogPost.objects.filter(
+        published=True, embedding__isnull=False, embedding_key__startswith=f'{model_id}:',
+    ).values_list('pk', 'embedding')
+    post_ids, vectors = [], []
+    for post_id, data in rows.iterator(chunk_size=2000):
+        post_ids.append(post_id)
+        vectors.append(from_bytes(data))
+    dim = len(vectors[0]) if vectors else getattr(get_embedder(), 'dim', None)
+    index = SemanticIndex(dim or 0)
+    if vectors:
+        # Builds the IVF partition too when there are enough posts
+        index.add_many(post_ids, np.stack(vectors))
+    return index
+
+
+def get_index():
+    """This process's index, reloaded when another process has changed the shared version"""
+    global _index, _index_version
+    with _index_lock:
+        version = get_version(INDEX_VERSION_KEY)
+        if _index is None or version != _index_version:
+            _index = load_index()
+            _index_version = version
+        return _index
+
+
+def embed_post(post):
+    """
+    Compute and store the post's embedding if its text or the model changed,
+    and add it to (or, when unpublished, remove it from) the index.
+    """
+    with _index_lock:
+        index = _index
+    if not post.published:
+        if index is not None and post.pk in index:
+            index.remove(post.pk)
+            _after_local_change()
+        return
+    embedder = get_embedder()
+    text = post_text(post)
+    key = embedding_key(embedder.model_id, text)
+    stored_key, stored = BlogPost.objects.filter(pk=post.pk).values_list('embedding_key', 'embedding').first()
+    if stored_key == key and stored is not None:
+        vector = from_bytes(stored)
+    else:
+        vector = embedder.embed([text])[0]
+        BlogPost.objects.filter(pk=post.pk).update(embedding=to_bytes(vector), embedding_key=key)
+    if index is not None and index.dim == len(vector):
+        index.add(post.pk, vector)
+    _after_local_change()
+
+
+def remove_post(post_id):
+    with _index_lock:
+        index = _index
+    if index is not None:
+        index.remove(post_id)
+    _after_local_change()
+
+
+def _after_local_change():
+    global _index
+    with _index_lock:
+        if not _bump_shared_version():
+            # Someone else changed the index too; reload on next use
+            _index = None
+
+
+# -- background updates ----------------------------------------------------------------------
+
+_pending = {}
+_pending_lock = threading.Lock()
+_updater = None
+
+
+def _schedule(post_id, action):
+    global _updater
+    with _pending_lock:
+        # The latest request for a post wins
+        _pending[post_id] = action
+        if not getattr(settings, 'BLOG_SEMANTIC_BACKGROUND', True):
+            background = False
+        elif _updater is None:
+            background = True
+            _updater = threading.Thread(target=_run_updates, name='semantic-updates', daemon=True)
+            _updater.start()
+        else:
+            return
+    if not background:
+        process_pending()
+
+
+def schedule_embed(post_id):
+    """(Re-)embed a saved post off the request thread"""
+    _schedule(post_id, 'embed')
+
+
+def schedule_remove(post_id):
+    """Drop a deleted post from the index off the request thread"""
+    _schedule(post_id, 'remove')
+
+
+def process_pending():
+    """Apply the queued embeds and removals; returns how many posts were handled"""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    embed_ids = [post_id for post_id, action in pending.items() if action == 'embed']
+    posts = BlogPost.objects.filter(pk__in=embed_ids).only('pk', 'title', 'excerpt', 'content', 'published').in_bulk()
+    for post_id, action in pending.items():
+        try:
+            if post_id in posts:
+                embed_post(posts[post_id])
+            else:
+                # Deleted, or gone again before we got to it
+                remove_post(post_id)
+        except Exception:
+            # Search freshness must never break anything else
+            logger.exception('Semantic index update of post %s failed', post_id)
+    return len(pending)
+
+
+def _run_updates():
+    global _updater
+    try:
+        while True:
+            with _pending_lock:
+                if not _pending:
+                    _updater = None
+                    return
+            process_pending()
+    finally:
+        connection.close()
+
+
+def embed_posts(queryset, batch_size=64):
+    """Embed every post in queryset whose stored embedding is missing or stale; returns the count"""
+    embedder = get_embedder()
+    updated = 0
+    batch = []
+
+    def flush():
+        nonlocal updated
+        vectors = embedder.embed([text for _, text, _ in batch])
+        # One commit per batch rather than per post
+        with transaction.atomic():
+            for (post, _, key), vector in zip(batch, vectors):
+                BlogPost.objects.filter(pk=post.pk).update(embedding=to_bytes(vector), embedding_key=key)
+        updated += len(batch)
+        batch.clear()
+
+    for post in queryset.only('pk', 'title', 'excerpt', 'content', 'embedding_key').iterator(chunk_size=500):
+        text = post_text(post)
+        key = embedding_key(embedder.model_id, text)
+        if post.embedding_key != key:
+            batch.append((post, text, key))
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+    if updated:
+        _after_local_change()
+    return updated
+
+
+def search(query, k=10):
+    """Top k (post_id, score) for a free-text query"""
+    index = get_index()
+    if not len(index):
+        return []
+    return index.search(get_embedder().embed([query])[0], k=k)
+
+
+def similar_posts(post_id, k=10):
+    """Top k posts most similar to a published post, excluding itself"""
+    index = get_index()
+    vector = index.vector(post_id)
+    if vector is None:
+        return []
+    return index.search(vector, k=k, exclude=[post_id])
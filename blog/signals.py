@@ -0,0 +1,245 @@
+"""
+Signal handlers keeping cached fragments and counters in sync with the database.
+
+Sidebar and form fragments listing categories and tags are cached with the
+taxonomy version as part of their key. Any change to a Category, a Tag or a
+post's tags bumps the version, so the next request renders fresh fragments
+and the stale ones simply age out of the cache.
+
+The same handlers maintain the published_post_count counters on Category
+and Tag (see blog.counters) whenever a post is saved, deleted, published or
+unpublished, or has its tags changed, and add a publish event to the post's
+trending score (see blog.trending).
+
+Saved posts are queued for (re-)embedding for semantic search and deleted
+ones for removal from the index once the transaction commits; a background
+thread does the work (see blog.semantic).
+
+Feeds are cached per scope - every post, one category or one tag - under a
+per-scope version (see blog.feeds). Changing a post bumps the global scope
+and the scopes of its categories and tags, so only those feeds are rendered again.
+The changed posts' ids go along to the static snapshot (see blog.snapshot).
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from main.versions import bump_version, get_version
+
+from . import semantic
+from .counters import adjust_counts, adjust_tag_counts_for_links
+from .models import BlogPost, Category, Tag
+from .trending import record_publish
+
+
+TAXONOMY_VERSION_KEY = 'blog:taxonomy_version'
+
+
+def get_taxonomy_version():
+    """Return the current taxonomy version used in fragment cache keys"""
+    return get_version(TAXONOMY_VERSION_KEY)
+
+
+def bump_taxonomy_version():
+    """Invalidate every cached taxonomy fragment"""
+    bump_version(TAXONOMY_VERSION_KEY)
+
+
+def _bump_taxonomy_on_commit():
+    # After commit, so a fragment rendered meanwhile can't be stored under the new version with old counts
+    transaction.on_commit(bump_taxonomy_version)
+
+
+FEED_VERSION_KEY = 'blog:feed_version:%s'
+
+
+def get_feed_version(scope):
+    """Current version of a feed scope: 'all', 'category:<slug>' or 'tag:<slug>'"""
+    return get_version(FEED_VERSION_KEY % scope)
+
+
+def bump_feed_versions(scopes, post_ids=None):
+    """Bump the scopes' versions; post_ids are the posts that changed, None if unknown"""
+    from .snapshot import schedule_publish
+
+    for scope in scopes:
+        bump_version(FEED_VERSION_KEY % scope)
+    # The static snapshot's page stamps are built from these versions
+    schedule_publish(scopes, post_ids)
+
+
+def feed_scopes(category_ids=(), tag_ids=()):
+    """The global scope plus the scopes of the given categories and tags"""
+    scopes = {'all'}
+    scopes.update(f'category:{slug}' for slug in Category.objects.filter(pk__in=category_ids).values_list('slug', flat=True))
+    scopes.update(f'tag:{slug}' for slug in Tag.objects.filter(pk__in=tag_ids).values_list('slug', flat=True))
+    return scopes
+
+
+def _bump_feeds_on_commit(category_ids=(), tag_ids=(), post_ids=()):
+    # After commit, so a feed rendered meanwhile can't be stored under the new version with old rows
+    category_ids = [pk for pk in category_ids if pk is not None]
+    post_ids = list(post_ids)
+    transaction.on_commit(lambda: bump_feed_versions(feed_scopes(category_ids, tag_ids), post_ids))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def taxonomy_changed(sender, instance, created=False, **kwargs):
+    _bump_taxonomy_on_commit()
+    if not created:
+        # Feed titles and item categories use the names
+        scopes = ['all', f'{sender.__name__.lower()}:{instance.slug}']
+        post_ids = None
+        if kwargs.get('signal') is post_save:
+            # Post pages show their tags' names; a category's posts come with its scope
+            post_ids = list(instance.posts.values_list('pk', flat=True)) if sender is Tag else []
+        # A deletion detaches posts without signals of their own, so every page is checked
+        transaction.on_commit(lambda: bump_feed_versions(scopes, post_ids))
+
+
+@receiver(pre_save, sender=BlogPost)
+def remember_post_counter_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Record the stored published/category state so post_save can diff it"""
+    instance._counter_state = None
+    if raw or instance._state.adding or not instance.pk:
+        return
+    if update_fields is not None and not {'published', 'category'} & set(update_fields):
+        return
+    instance._counter_state = (
+        BlogPost.objects.filter(pk=instance.pk).values_list('published', 'category_id').first()
+    )
+
+
+@receiver(post_save, sender=BlogPost)
+def update_post_counters(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    old_state = getattr(instance, '_counter_state', None)
+    if old_state is None:
+        if not created:
+            return
+        old_state = (False, None)
+    was_published, old_category_id = old_state
+
+    category_deltas = {}
+    if was_published and old_category_id:
+        category_deltas[old_category_id] = category_deltas.get(old_category_id, 0) - 1
+    if instance.published and instance.category_id:
+        category_deltas[instance.category_id] = category_deltas.get(instance.category_id, 0) + 1
+    changed = adjust_counts(Category, category_deltas)
+
+    if instance.published and not was_published:
+        record_publish(instance.pk, instance.published_at)
+
+    if was_published != instance.published and not created:
+        tag_links = [
+            (instance.pk, tag_id) for tag_id in instance.tags.values_list('pk', flat=True)
+        ]
+        changed |= adjust_tag_counts_for_links(tag_links, 1 if instance.published else -1)
+
+    if changed:
+        _bump_taxonomy_on_commit()
+
+
+# Post fields that appear in feeds or the sitemap
+FEED_FIELDS = {'title', 'slug', 'excerpt', 'content', 'author', 'category', 'published', 'published_at', 'updated_at'}
+
+
+@receiver(post_save, sender=BlogPost)
+def invalidate_post_feeds(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not FEED_FIELDS & set(update_fields):
+        return
+    old_state = getattr(instance, '_counter_state', None)
+    if old_state is None:
+        old_state = (False, None) if created else (instance.published, None)
+    was_published, old_category_id = old_state
+    # Drafts never appear in feeds
+    if was_published or instance.published:
+        _bump_feeds_on_commit(
+            [instance.category_id, old_category_id], list(instance.tags.values_list('pk', flat=True)), [instance.pk],
+        )
+
+
+@receiver(pre_delete, sender=BlogPost)
+def remember_deleted_post_tags(sender, instance, **kwargs):
+    # The M2M rows are deleted before post_delete fires, without m2m_changed
+    instance._counter_tag_ids = list(instance.tags.values_list('pk', flat=True)) if instance.published else []
+
+
+@receiver(post_delete, sender=BlogPost)
+def update_counters_for_deleted_post(sender, instance, **kwargs):
+    if not instance.published:
+        return
+    changed = adjust_counts(Category, {instance.category_id: -1})
+    tag_links = [(instance.pk, tag_id) for tag_id in getattr(instance, '_counter_tag_ids', [])]
+    changed |= adjust_tag_counts_for_links(tag_links, -1)
+    if changed:
+        _bump_taxonomy_on_commit()
+    _bump_feeds_on_commit([instance.category_id], getattr(instance, '_counter_tag_ids', []), [instance.pk])
+
+
+def _tag_links(instance, reverse, pk_set):
+    """Normalise an m2m_changed call into (post_id, tag_id) pairs"""
+    if reverse:
+        return [(post_id, instance.pk) for post_id in pk_set]
+    return [(instance.pk, tag_id) for tag_id in pk_set]
+
+
+def _published_links(links):
+    post_ids = {post_id for post_id, _tag_id in links}
+    published = set(
+        BlogPost.objects.filter(pk__in=post_ids, published=True).values_list('pk', flat=True)
+    )
+    return [link for link in links if link[0] in published]
+
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def post_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_remove', 'pre_clear'):
+        # Remember which links really exist; pk_set on remove is whatever the
+        # caller asked for, and clear() doesn't provide one at all.
+        links = sender.objects.filter(**{'tag_id' if reverse else 'blogpost_id': instance.pk})
+        if pk_set is not None:
+            links = links.filter(**{'blogpost_id__in' if reverse else 'tag_id__in': pk_set})
+        instance._removed_tag_links = _published_links(list(links.values_list('blogpost_id', 'tag_id')))
+        return
+
+    if action == 'post_add':
+        links = _published_links(_tag_links(instance, reverse, pk_set))
+        adjust_tag_counts_for_links(links, 1)
+    elif action in ('post_remove', 'post_clear'):
+        links = getattr(instance, '_removed_tag_links', [])
+        adjust_tag_counts_for_links(links, -1)
+    else:
+        return
+    _bump_taxonomy_on_commit()
+    if links:
+        # Items list their tags, so every feed showing these posts changes
+        post_ids = {post_id for post_id, _tag_id in links}
+        _bump_feeds_on_commit(
+            BlogPost.objects.filter(pk__in=post_ids).values_list('category_id', flat=True).distinct(),
+            {tag_id for _post_id, tag_id in links}
+            | set(sender.objects.filter(blogpost_id__in=post_ids).values_list('tag_id', flat=True)),
+            post_ids,
+        )
+
+
+@receiver(post_save, sender=BlogPost)
+def embed_saved_post(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {'title', 'excerpt', 'content', 'published'} & set(update_fields):
+        return
+    post_id = instance.pk
+    transaction.on_commit(lambda: semantic.schedule_embed(post_id))
+
+
+@receiver(post_delete, sender=BlogPost)
+def unindex_deleted_post(sender, instance, **kwargs):
+    post_id = instance.pk
+    transaction.on_commit(lambda: semantic.schedule_remove(post_id))
@@ -0,0 +1,313 @@
+"""
+Static snapshot of the public read path, for a front web server to serve
+without touching Django.
+
+publish() renders the post list, every published post, the category pages,
+the feeds and the sitemap through the normal middleware and views. It writes
+each page to a directory with a pre-compressed .gz sibling. Paths map to
+files as
+
+    /                    -> index.html
+    /post/<slug>/        -> post/<slug>/index.html
+    /feeds/rss/          -> feeds/rss/index.xml
+    /sitemap.xml         -> sitemap.xml
+
+e.g. nginx: `gzip_static on; try_files $uri $uri/index.html $uri/index.xml @django;`.
+
+Re-rendering is incremental. Each page has a stamp made of the feed scope
+versions it depends on (see blog.signals.get_feed_version) and, for post
+pages, the post's updated_at. A page is rendered again only when its stamp
+changes. It is rewritten only when the content hash recorded in the
+manifest changes. Pages that no longer exist are removed.
+
+With STATIC_SNAPSHOT_ROOT set, every feed version bump (post saves,
+deletions, tag and taxonomy changes) schedules a publish in a background
+thread. It only looks at the pages of the bumped scopes and the changed
+posts, which the manifest records per page, so a change costs a few queries
+however big the corpus is. `manage.py publish_static` checks every page.
+
+The pages are what a reader without the blog_lite cookie gets from the
+snapshot host: the lite templates for a .onion host with
+BLOG_LITE_ONION_DEFAULT set, the full ones otherwise (see blog.lite).
+Changing the host or that setting re-renders every page.
+"""
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection
+from django.db.models import Q
+
+from .lite import LITE_COOKIE, lite_by_default
+from .models import BlogPost, Category, Tag
+from .signals import get_feed_version, get_taxonomy_version
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.manifest.json'
+# Bumped when the pages' recorded scopes change meaning; older manifests get a full check
+MANIFEST_FORMAT = 2
+LOCK_NAME = '.lock'
+
+
+def snapshot_host():
+    return getattr(settings, 'STATIC_SNAPSHOT_HOST', None) or 'localhost'
+
+
+def _file_for(path):
+    if path.endswith('.xml'):
+        return path.lstrip('/')
+    name = 'index.xml' if path.startswith('/feeds/') else 'index.html'
+    return os.path.join(path.strip('/'), name) if path != '/' else name
+
+
+def _stamp(*parts):
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def _page(stamp, scopes, post_id=None):
+    return {'stamp': stamp, 'scopes': sorted(scopes), 'post': post_id}
+
+
+def _scope_slugs(scopes, kind):
+    return [scope.split(':', 1)[1] for scope in scopes if scope.startswith(f'{kind}:')]
+
+
+def pages(scopes=None, post_ids=()):
+    """
+    {path: {'stamp', 'scopes', 'post'}} for every page in the snapshot, or
+    with scopes only for the pages those feed scopes and the posts in
+    post_ids affect. 'scopes' lists the feed scopes a page depends on.
+
+    A post page shows the post, its tags' names and related posts from its
+    category, so it depends on its category's scope only. Tag scopes change
+    with every post carrying the tag; the tag names go into the post's stamp
+    instead, and changes to a post's tags or a tag's name come with the post
+    ids (see blog.signals).
+    """
+    full = scopes is None
+    scopes = set(scopes or ())
+    versions = {}
+
+    def version(scope):
+        if scope not in versions:
+            versions[scope] = get_feed_version(scope)
+        return versions[scope]
+
+    stamps = {}
+    if full or 'all' in scopes:
+        everything, taxonomy = version('all'), get_taxonomy_version()
+        stamps['/'] = _page(_stamp(everything, taxonomy), ['all'])
+        stamps['/feeds/rss/'] = _page(_stamp(everything), ['all'])
+        stamps['/feeds/atom/'] = _page(_stamp(everything), ['all'])
+        stamps['/sitemap.xml'] = _page(_stamp(everything, taxonomy), ['all'])
+
+    categories = Category.objects.filter(published_post_count__gt=0)
+    tags = Tag.objects.filter(published_post_count__gt=0)
+    posts = BlogPost.objects.filter(published=True)
+    if not full:
+        category_slugs, tag_slugs = _scope_slugs(scopes, 'category'), _scope_slugs(scopes, 'tag')
+        categories = categories.filter(slug__in=category_slugs)
+        tags = tags.filter(slug__in=tag_slugs)
+        # Post pages show the category's related posts
+        posts = posts.filter(Q(pk__in=list(post_ids)) | Q(category__slug__in=category_slugs))
+    for slug in categories.values_list('slug', flat=True):
+        scope = f'category:{slug}'
+        for path in (f'/category/{slug}/', f'/feeds/category/{slug}/rss/', f'/feeds/category/{slug}/atom/'):
+            stamps[path] = _page(_stamp(version(scope)), [scope])
+    for slug in tags.values_list('slug', flat=True):
+        scope = f'tag:{slug}'
+        for path in (f'/feeds/tag/{slug}/rss/', f'/feeds/tag/{slug}/atom/'):
+            stamps[path] = _page(_stamp(version(scope)), [scope])
+
+    post_tags = {}
+    links = BlogPost.tags.through.objects.filter(blogpost__in=posts).values_list('blogpost_id', 'tag__name')
+    for post_id, name in links.iterator(chunk_size=5000):
+        post_tags.setdefault(post_id, []).append(name)
+    rows = posts.values_list('pk', 'slug', 'updated_at', 'category__slug')
+    for post_id, slug, updated_at, category in rows.iterator(chunk_size=2000):
+        depends = [f'category:{category}'] if category else []
+        stamps[f'/post/{slug}/'] = _page(
+            _stamp(updated_at.isoformat(), *[f'{scope}={version(scope)}' for scope in depends],
+                   *sorted(post_tags.get(post_id, []))),
+            depends, post_id,
+        )
+    return stamps
+
+
+class Renderer:
+    """Runs GET requests through the middleware and URLconf without a server"""
+
+    def __init__(self, host, lite=False):
+        self.host = host
+        # An explicit choice, so the page doesn't depend on the middleware's host check
+        self.cookie = f'{LITE_COOKIE}={int(lite)}'
+        self.handler = BaseHandler()
+        self.handler.load_middleware()
+
+    def get(self, path):
+        request = WSGIRequest({
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': '',
+            'SERVER_NAME': self.host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host, 'HTTP_COOKIE': self.cookie, 'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO(),
+            'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        })
+        # Rendering a page for the snapshot isn't a visit
+        request.static_snapshot = True
+        response = self.handler.get_response(request)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response.status_code, content
+
+
+def _write_atomic(filename, data):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as out:
+            out.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _remove(root, name):
+    for filename in (os.path.join(root, name), os.path.join(root, name) + '.gz'):
+        try:
+            os.unlink(filename)
+        except FileNotFoundError:
+            pass
+
+
+def publish(root, full=False, host=None, scopes=None, post_ids=()):
+    """
+    Bring the snapshot in root up to date; returns counts of what was done.
+    With scopes only the pages of those feed scopes and of the posts in
+    post_ids are checked, otherwise every page is.
+    """
+    os.makedirs(root, exist_ok=True)
+    stats = {'pages': 0, 'rendered': 0, 'written': 0, 'removed': 0, 'failed': 0}
+    with open(os.path.join(root, LOCK_NAME), 'a') as lock:
+        # One publisher at a time per directory, across processes
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest_path = os.path.join(root, MANIFEST_NAME)
+        try:
+            with open(manifest_path) as f:
+                stored = json.load(f)
+        except (FileNotFoundError, ValueError):
+            stored = {}
+        manifest = stored.get('pages', {})
+        host = host or snapshot_host()
+        # Readers of an onion snapshot get the pages Django would serve them by default
+        lite = lite_by_default(host)
+        # Absolute URLs in feeds and the sitemap embed the host
+        full = full or stored.get('host') != host or stored.get('lite', False) != lite
+        # A partial update needs a manifest that knows each page's scopes
+        partial = not full and scopes is not None and manifest and stored.get('format') == MANIFEST_FORMAT
+        post_ids = set(post_ids)
+
+        renderer = Renderer(host, lite=lite)
+        current = pages(scopes if partial else None, post_ids)
+        if partial:
+            scopes = set(scopes)
+            # Pages that depended on a changed scope or post and may be gone now
+            candidates = {
+                path for path, entry in manifest.items()
+                if scopes.intersection(entry['scopes']) or entry['post'] in post_ids
+            }
+        else:
+            candidates = set(manifest)
+        stats['pages'] = len(current)
+        for path, page in current.items():
+            name = _file_for(path)
+            entry = manifest.get(path)
+            exists = os.path.exists(os.path.join(root, name))
+            if not full and entry and entry['stamp'] == page['stamp'] and exists:
+                manifest[path] = dict(entry, scopes=page['scopes'], post=page['post'])
+                continue
+            status, content = renderer.get(path)
+            stats['rendered'] += 1
+            if status != 200:
+                logger.warning('Snapshot of %s returned %s', path, status)
+                stats['failed'] += 1
+                manifest.pop(path, None)
+                _remove(root, name)
+                continue
+            digest = hashlib.sha256(content).hexdigest()
+            if not (entry and entry['sha256'] == digest and exists):
+                _write_atomic(os.path.join(root, name), content)
+                # mtime=0 keeps the .gz identical for identical content
+                _write_atomic(os.path.join(root, name) + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+                stats['written'] += 1
+            manifest[path] = dict(page, file=name, sha256=digest)
+
+        for path in candidates - set(current):
+            _remove(root, manifest.pop(path)['file'])
+            stats['removed'] += 1
+
+        _write_atomic(manifest_path, json.dumps({'format': MANIFEST_FORMAT, 'host': host, 'lite': lite, 'pages': manifest}, indent=0, sort_keys=True).encode())
+    return stats
+
+
+_schedule_lock = threading.Lock()
+# What the next background run has to check: None for everything
+_pending = None
+_worker = None
+
+
+def schedule_publish(scopes=None, post_ids=None):
+    """
+    Publish in the background if STATIC_SNAPSHOT_ROOT is set, checking the
+    pages of the given feed scopes and posts (every page when either is
+    None). Bursts of changes share one run.
+    """
+    global _pending, _worker
+    root = getattr(settings, 'STATIC_SNAPSHOT_ROOT', None)
+    if not root:
+        return
+    with _schedule_lock:
+        if scopes is None or post_ids is None:
+            _pending = {'full': True}
+        elif _pending is None:
+            _pending = {'full': False, 'scopes': set(scopes), 'post_ids': set(post_ids)}
+        elif not _pending['full']:
+            _pending['scopes'].update(scopes)
+            _pending['post_ids'].update(post_ids)
+        if _worker is None:
+            _worker = threading.Thread(target=_run, args=(root,), name='static-snapshot', daemon=True)
+            _worker.start()
+
+
+def _run(root):
+    global _pending, _worker
+    try:
+        while True:
+            with _schedule_lock:
+                if _pending is None:
+                    _worker = None
+                    return
+                request, _pending = _pending, None
+            try:
+                if request['full']:
+                    publish(root)
+                else:
+                    publish(root, scopes=request['scopes'], post_ids=request['post_ids'])
+            except Exception:
+                logger.exception('Static snapshot publish failed')
+    finally:
+        connection.close()
@@ -0,0 +1,108 @@
+"""
+Streamed rendering for the long list pages (post list, category, profile).
+
+A buffered render builds the whole page before sending a byte, so on a slow
+Tor circuit the reader stares at a blank tab until the last post is
+rendered. stream_list renders the page once with STREAM_SLOT in place of
+the list. Everything around the list (base.html, sidebars, messages, the
+CSRF token) is therefore done before the response starts. The page is split
+at the slot, and the response sends the head, then the posts
+BLOG_STREAM_CHUNK_SIZE at a time, then the tail. Each chunk is one query
+(plus its prefetches) through QuerySet.iterator, so memory stays bounded
+however long the list is.
+
+Page templates render `{{ stream_slot }}` in place of their post loop when
+it is set. Each chunk is rendered through blog/includes/stream_chunk.html,
+which includes item_template once per post. An empty list is rendered the
+normal buffered way, so the template's {% empty %} branch still applies.
+"""
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+STREAM_SLOT = mark_safe('<!-- stream-slot -->')
+
+CHUNK_TEMPLATE = 'blog/includes/stream_chunk.html'
+
+
+def streaming_enabled():
+    return getattr(settings, 'BLOG_STREAM_LISTS', True)
+
+
+def chunk_size():
+    return getattr(settings, 'BLOG_STREAM_CHUNK_SIZE', 25)
+
+
+def _split_page(request, template_name, context):
+    # A page that decided not to show the list (e.g. a zero count) has no slot
+    return render_to_string(template_name, {**context, 'stream_slot': STREAM_SLOT}, request).split(STREAM_SLOT, 1)
+
+
+def _render_chunk(request, item_template, posts, context):
+    return render_to_string(CHUNK_TEMPLATE, {**context, 'item_template': item_template, 'posts': posts}, request)
+
+
+def stream_list(request, template_name, context, posts, item_template):
+    """
+    Render template_name with context, streaming the queryset posts through
+    item_template. context holds everything else the page needs; posts is
+    added to it as 'posts' when the list is empty and the page is rendered
+    whole.
+    """
+    size = chunk_size()
+    rows = posts.iterator(chunk_size=size)
+    first = list(islice(rows, size))
+    if not first:
+        return render(request, template_name, {**context, 'posts': first})
+    parts = _split_page(request, template_name, context)
+    if len(parts) == 1:
+        return HttpResponse(parts[0])
+    head, tail = parts
+
+    def chunks():
+        yield head
+        chunk = first
+        while chunk:
+            yield _render_chunk(request, item_template, chunk, context)
+            chunk = list(islice(rows, size))
+        yield tail
+
+    return StreamingHttpResponse(chunks(), content_type='text/html; charset=utf-8')
+
+
+async def astream_list(request, template_name, context, posts, item_template):
+    """stream_list for async views: rows come from the async ORM and chunks render in sync_to_async"""
+    size = chunk_size()
+    rows = aiter(posts.aiterator(chunk_size=size))
+
+    async def next_chunk():
+        chunk = []
+        async for post in rows:
+            chunk.append(post)
+            if len(chunk) == size:
+                break
+        return chunk
+
+    first = await next_chunk()
+    if not first:
+        return await sync_to_async(render)(request, template_name, {**context, 'posts': first})
+    parts = await sync_to_async(_split_page)(request, template_name, context)
+    if len(parts) == 1:
+        return HttpResponse(parts[0])
+    head, tail = parts
+
+    async def chunks():
+        yield head
+        chunk = first
+        while chunk:
+            yield await sync_to_async(_render_chunk)(request, item_template, chunk, context)
+            chunk = await next_chunk()
+        yield tail
+
+    return StreamingHttpResponse(chunks(), content_type='text/html; charset=utf-8')
@@ -1,18 +1,33 @@
 from django import template
+from django.core.cache import cache
 from django.utils.safestring import mark_safe
+import hashlib
 import markdown
 
 register = template.Library()
 
 
-@register.filter(name='markdown')
-def markdown_filter(text):
+# Bump to invalidate cached HTML when the markdown configuration changes
+MARKDOWN_CACHE_VERSION = 1
+
+
+def render_markdown(text):
     """
-    Convert markdown text to HTML.
+    Convert markdown text to HTML, using the shared cache.
+    Entries are keyed by a hash of the source, so edits never see stale HTML.
     """
     if not text:
         return ''
     
+    key = 'markdown:%s' % hashlib.sha256(text.encode('utf-8')).hexdigest()
+    html = cache.get(key, version=MARKDOWN_CACHE_VERSION)
+    if html is None:
+        html = _convert_markdown(text)
+        cache.set(key, html, version=MARKDOWN_CACHE_VERSION)
+    return html
+
+
+def _convert_markdown(text):
     # Configure markdown with common extensions
     extensions = [
         'extra',  # Adds tables, fenced code blocks, etc.
@@ -27,8 +42,15 @@ def markdown_filter(text):
         pass
     
     md = markdown.Markdown(extensions=extensions)
-    html = md.convert(text)
-    return mark_safe(html)
+    return md.convert(text)
+
+
+@register.filter(name='markdown')
+def markdown_filter(text):
+    """
+    Convert markdown text to HTML.
+    """
+    return mark_safe(render_markdown(text))
 
 
 @register.filter(name='markdown_safe')
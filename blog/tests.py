@@ -1,3 +1,1394 @@
-from django.test import TestCase
+import atexit
+import base64
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+import numpy as np
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from main.constants import Constants
+from main.versions import bump_version, get_version
+from webui import batching as webui_batching, embedding_store, encoding, jobs as webui_jobs, views as webui_views
+from webui.batching import MicroBatcher
+from webui.embedding_store import EmbeddingStore, cached_embeddings
+from webui.pipeline import extract_csv_features, load_features
+from webui.registry import EngineRegistry
+from webui.similarity import cosine_similarity, normalise_rows, score_matrix, top_k_matrix
+
+from . import feeds, semantic, snapshot, trending
+from .assets import _minify_js_lines
+from .cache_backend import SQLiteCache
+from .export import iter_ndjson
+from .importer import import_lines
+from .lite import LiteModeMiddleware, is_lite
+from .middleware import CompressedBodyCache, CompressedResponseCacheMiddleware
+from .models import BlogPost, Category, Tag
+from .signals import get_taxonomy_version
+from .streaming import astream_list
+from .view_counter import ViewCountBuffer
+
+
+TEST_CACHE_DIR = tempfile.mkdtemp(prefix='blog-tests-')
+atexit.register(shutil.rmtree, TEST_CACHE_DIR, True)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'blog.cache_backend.SQLiteCache',
+        'LOCATION': os.path.join(TEST_CACHE_DIR, 'cache.sqlite3'),
+    }
+}, BLOG_SEMANTIC_BACKGROUND=False)
+class BlogTestCase(TestCase):
+    """TestCase with its own shared cache file, emptied before every test; semantic updates run inline"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class SQLiteCacheTests(TestCase):
+    def make_cache(self, name='cache.sqlite3', **options):
+        path = os.path.join(tempfile.mkdtemp(dir=TEST_CACHE_DIR), name)
+        return SQLiteCache(path, {'OPTIONS': options})
+
+    def test_set_get_delete(self):
+        c = self.make_cache()
+        c.set('key', {'a': [1, 2]})
+        self.assertEqual(c.get('key'), {'a': [1, 2]})
+        self.assertTrue(c.has_key('key'))
+        self.assertTrue(c.delete('key'))
+        self.assertIsNone(c.get('key'))
+        self.assertEqual(c.get('key', 'default'), 'default')
+
+    def test_expired_entries_are_ignored_and_replaceable_by_add(self):
+        c = self.make_cache()
+        c.set('key', 'old', timeout=0.05)
+        self.assertFalse(c.add('key', 'new'))
+        time.sleep(0.1)
+        self.assertIsNone(c.get('key'))
+        self.assertFalse(c.has_key('key'))
+        self.assertTrue(c.add('key', 'new'))
+        self.assertEqual(c.get('key'), 'new')
+
+    def test_entries_are_shared_between_instances(self):
+        first = self.make_cache()
+        second = SQLiteCache(first._path, {})
+        first.set_many({'a': 1, 'b': 2})
+        self.assertEqual(second.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        second.delete_many(['a'])
+        self.assertIsNone(first.get('a'))
+
+    def test_incr_is_atomic_across_threads(self):
+        c = self.make_cache()
+        c.set('counter', 0)
+
+        def work():
+            other = SQLiteCache(c._path, {})
+            for _ in range(50):
+                other.incr('counter')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(c.get('counter'), 400)
+
+    def test_incr_missing_key_raises(self):
+        with self.assertRaises(ValueError):
+            self.make_cache().incr('missing')
+
+    def test_cull_evicts_least_recently_accessed(self):
+        c = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=5, CULL_CHECK_INTERVAL=1, ACCESS_GRANULARITY=0)
+        c.set('keep', 'value')
+        for i in range(20):
+            time.sleep(0.001)
+            c.get('keep')
+            c.set(f'filler-{i}', i)
+        self.assertEqual(c.get('keep'), 'value')
+        count = c._connection().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        self.assertLessEqual(count, 10)
+
+    def test_shared_instance_culls_once_per_interval(self):
+        c = self.make_cache(CULL_CHECK_INTERVAL=16)
+        culls = []
+
+        def work(n):
+            for i in range(32):
+                c.set(f'{n}-{i}', i)
+
+        with patch.object(c, '_cull', side_effect=lambda conn, now: culls.append(now)):
+            threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(culls), 8 * 32 // 16)
+
+
+class VersionCounterTests(BlogTestCase):
+    def test_counters_are_clock_seeded_and_survive_eviction(self):
+        before = time.time_ns()
+        version = get_version('test:version')
+        self.assertGreaterEqual(version, before)
+        self.assertEqual(get_version('test:version'), version)
+        self.assertEqual(bump_version('test:version'), version + 1)
+
+        cache.delete('test:version')
+        reseeded = bump_version('test:version')
+        self.assertGreater(reseeded, version + 1)
+        self.assertEqual(get_version('test:version'), reseeded)
+
+
+@override_settings(BLOG_LITE_ONION_DEFAULT=False)
+class TaxonomyFragmentTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='News', slug='news')
+        self.tag = Tag.objects.create(name='Django', slug='django')
+
+    def sidebar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get('/').content.decode()
+
+    def test_fragment_is_reused(self):
+        self.assertIn('News', self.sidebar())
+        # A queryset update sends no signals, so the cached fragment still applies
+        Category.objects.filter(pk=self.category.pk).update(name='Renamed quietly')
+        Tag.objects.filter(pk=self.tag.pk).update(name='Retagged quietly')
+        content = self.sidebar()
+        self.assertIn('News', content)
+        self.assertIn('Django', content)
+        self.assertNotIn('quietly', content)
+
+    def test_create_invalidates(self):
+        self.sidebar()
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Science', slug='science')
+            Tag.objects.create(name='Tor', slug='tor')
+        content = self.sidebar()
+        self.assertIn('Science', content)
+        self.assertIn('Tor', content)
+
+    def test_rename_invalidates(self):
+        self.sidebar()
+        for obj, name in ((self.category, 'World news'), (self.tag, 'Python')):
+            with self.captureOnCommitCallbacks(execute=True):
+                obj.name = name
+                obj.save()
+            self.assertIn(name, self.sidebar())
+
+    def test_rollback_keeps_version(self):
+        version = get_taxonomy_version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(DatabaseError):
+                with transaction.atomic():
+                    Category.objects.create(name='Doomed', slug='doomed')
+                    raise DatabaseError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(get_taxonomy_version(), version)
+        self.assertNotIn('Doomed', self.sidebar())
+
+
+class CounterSignalTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.news = Category.objects.create(name='News', slug='news')
+        self.misc = Category.objects.create(name='Misc', slug='misc')
+        self.tag = Tag.objects.create(name='Django', slug='django')
+
+    def make_post(self, slug, **kwargs):
+        kwargs.setdefault('category', self.news)
+        return BlogPost.objects.create(title=slug, slug=slug, content='Body', **kwargs)
+
+    def assertCounts(self, news, misc, tag):
+        self.assertEqual(
+            [Category.objects.get(pk=self.news.pk).published_post_count,
+             Category.objects.get(pk=self.misc.pk).published_post_count,
+             Tag.objects.get(pk=self.tag.pk).published_post_count],
+            [news, misc, tag],
+        )
+
+    def test_publish_move_unpublish_and_delete(self):
+        post = self.make_post('a')
+        post.tags.add(self.tag)
+        self.assertCounts(0, 0, 0)
+
+        post.published = True
+        post.save()
+        self.assertCounts(1, 0, 1)
+
+        post.category = self.misc
+        post.save()
+        self.assertCounts(0, 1, 1)
+
+        post.published = False
+        post.save()
+        self.assertCounts(0, 0, 0)
+
+        post.published = True
+        post.save()
+        post.delete()
+        self.assertCounts(0, 0, 0)
+
+    def test_tag_add_remove_and_clear(self):
+        post = self.make_post('a', published=True)
+        post.tags.add(self.tag)
+        self.assertCounts(1, 0, 1)
+        post.tags.remove(self.tag)
+        self.assertCounts(1, 0, 0)
+        self.tag.posts.add(post)
+        self.assertCounts(1, 0, 1)
+        post.tags.clear()
+        self.assertCounts(1, 0, 0)
+
+    def test_taxonomy_version_is_bumped_after_commit(self):
+        version = get_taxonomy_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_post('a', published=True)
+            self.assertEqual(get_taxonomy_version(), version)
+        self.assertGreater(get_taxonomy_version(), version)
+
+    def test_recount_posts_corrects_drift(self):
+        self.make_post('a', published=True).tags.add(self.tag)
+        Category.objects.filter(pk=self.news.pk).update(published_post_count=5)
+        Tag.objects.filter(pk=self.tag.pk).update(published_post_count=0)
+
+        out = StringIO()
+        call_command('recount_posts', '--dry-run', stdout=out)
+        self.assertIn('2 counter(s) would be corrected', out.getvalue())
+        self.assertCounts(5, 0, 0)
+
+        version = get_taxonomy_version()
+        call_command('recount_posts', stdout=StringIO())
+        self.assertCounts(1, 0, 1)
+        self.assertGreater(get_taxonomy_version(), version)
+
+
+class BenchmarkSeedTests(BlogTestCase):
+    def test_seed_fills_every_required_column(self):
+        out = StringIO()
+        call_command('benchmark_read_paths', seed=30, users=3, categories=2, runs=1, no_compare=True, stdout=out)
+        posts = BlogPost.objects.filter(slug__startswith='bench-')
+        self.assertEqual(posts.count(), 30)
+        self.assertEqual(set(posts.values_list('view_count', 'embedding_key')), {(0, '')})
+        self.assertEqual(len(set(posts.values_list('import_key', flat=True))), 30)
+        self.assertIn('Summary', out.getvalue())
+
+
+class ViewCountBufferTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.posts = [
+            BlogPost.objects.create(title=slug, slug=slug, content='Body', published=True) for slug in ('a', 'b')
+        ]
+        # Long interval: only the explicit flushes below write
+        self.buffer = ViewCountBuffer(flush_interval=3600, max_pending=3)
+        self.addCleanup(self.buffer._stop.set)
+
+    def view_counts(self):
+        return [BlogPost.objects.get(pk=post.pk).view_count for post in self.posts]
+
+    def test_flush_writes_pending_counts_in_one_batch(self):
+        a, b = self.posts
+        self.buffer.record(a.pk)
+        self.buffer.record(a.pk)
+        self.buffer.record(b.pk, 5)
+        self.assertEqual(self.buffer.pending(a.pk), 2)
+        self.assertEqual(self.view_counts(), [0, 0])
+
+        self.assertEqual(self.buffer.flush(), {a.pk: 2, b.pk: 5})
+        self.assertEqual(self.view_counts(), [2, 5])
+        self.assertEqual(self.buffer.pending(a.pk), 0)
+        self.assertIsNotNone(BlogPost.objects.get(pk=a.pk).trending_score)
+        self.assertEqual(self.buffer.flush(), {})
+
+    def test_full_buffer_flushes_on_record(self):
+        extra = BlogPost.objects.create(title='c', slug='c', content='Body', published=True)
+        for post in self.posts + [extra]:
+            self.buffer.record(post.pk)
+        self.assertEqual(self.view_counts(), [1, 1])
+        self.assertEqual(self.buffer.pending(extra.pk), 0)
+
+    def test_failed_flush_keeps_the_batch(self):
+        a, _b = self.posts
+        self.buffer.record(a.pk, 3)
+
+        def fail(batch):
+            raise DatabaseError('locked')
+
+        self.buffer._write = fail
+        with self.assertLogs('blog.view_counter', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), {})
+        self.assertEqual(self.buffer.pending(a.pk), 3)
+
+        del self.buffer._write
+        self.buffer.flush()
+        self.assertEqual(self.view_counts()[0], 3)
+
+
+class TrendingTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        self.post = BlogPost.objects.create(title='a', slug='a', content='Body')
+
+    def score(self, post=None, hours=0):
+        stored = BlogPost.objects.get(pk=(post or self.post).pk).trending_score
+        return trending.current_score(stored, self.now + timedelta(hours=hours))
+
+    @override_settings(BLOG_TRENDING_HALF_LIFE_HOURS=24)
+    def test_score_halves_every_half_life(self):
+        trending.record_events({self.post.pk: 8}, self.now)
+        self.assertAlmostEqual(self.score(), 8)
+        self.assertAlmostEqual(self.score(hours=24), 4)
+        self.assertAlmostEqual(self.score(hours=72), 1)
+
+    def test_events_add_up_in_log_space(self):
+        trending.record_events({self.post.pk: 3}, self.now)
+        trending.record_events({self.post.pk: 5}, self.now)
+        trending.record_views({self.post.pk: 2}, self.now)
+        self.assertAlmostEqual(self.score(), 3 + 5 + 2 * trending.view_weight())
+
+    def test_recent_events_outrank_older_heavier_ones(self):
+        old = BlogPost.objects.create(title='b', slug='b', content='Body', published=True)
+        self.post.published = True
+        self.post.save()
+        BlogPost.objects.update(trending_score=None)
+        trending.record_events({old.pk: 10}, self.now - timedelta(days=7))
+        trending.record_events({self.post.pk: 1}, self.now)
+        self.assertEqual(list(trending.trending_posts()), [self.post, old])
+        self.assertLess(self.score(old), 1)
+
+    def test_seed_migration_matches_publish_events(self):
+        seed = import_module('blog.migrations.0008_blogpost_trending_score')
+        with override_settings(BLOG_TRENDING_HALF_LIFE_HOURS=24, BLOG_TRENDING_PUBLISH_WEIGHT=10.0):
+            expected = trending.event_score(trending.publish_weight(), self.now)
+        seeded = seed.DECAY_RATE * (self.now - seed.EPOCH).total_seconds() + math.log(seed.PUBLISH_WEIGHT)
+        self.assertAlmostEqual(seeded, expected)
+
+
+class MicroBatcherTests(TestCase):
+    def test_concurrent_calls_share_batches(self):
+        batches = []
+
+        def double(items):
+            batches.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=50)
+        results = {}
+        threads = [threading.Thread(target=lambda i=i: results.update({i: batcher([i, i + 100])})) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {i: [i * 2, (i + 100) * 2] for i in range(4)})
+        self.assertEqual(sum(batches), 8)
+        self.assertLess(len(batches), 8)
+
+    def test_wrong_result_count_fails_every_item(self):
+        batcher = MicroBatcher(lambda items: items[:-1], max_wait_ms=50)
+        with self.assertRaisesRegex(ValueError, 'returned 1 results for 2 items'):
+            batcher(['a', 'b'])
+
+    def test_batch_errors_reach_the_callers(self):
+        def fail(items):
+            raise RuntimeError('engine gone')
+
+        with self.assertRaisesRegex(RuntimeError, 'engine gone'):
+            MicroBatcher(fail)(['a'])
+
+    def test_callers_time_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        batcher = MicroBatcher(lambda items: release.wait() and items, timeout=0.05)
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            batcher(['a'])
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class EmbeddingStoreTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir=TEST_CACHE_DIR)
+        self.texts = [f'text {i}' for i in range(11)]
+        self.vectors = np.arange(44, dtype=np.float32).reshape(11, 4)
+
+    def make_store(self, budget=10 * 16):
+        return EmbeddingStore(self.root, 'model', budget)
+
+    def test_lookups_and_normalised_keys(self):
+        store = self.make_store(budget=10 ** 6)
+        store.put_many(self.texts[:3], self.vectors[:3])
+        found = store.get_many(['text  1 ', 'missing', 'text 0'])
+        np.testing.assert_array_equal(found[0], self.vectors[1])
+        self.assertIsNone(found[1])
+        np.testing.assert_array_equal(found[2], self.vectors[0])
+        self.assertEqual(store.stats()['hits'], 2)
+        with self.assertRaises(ValueError):
+            store.put_many(['other'], np.zeros((1, 3)))
+
+    def test_other_instances_see_appends(self):
+        writer, reader = self.make_store(budget=10 ** 6), self.make_store(budget=10 ** 6)
+        writer.put_many(self.texts[:2], self.vectors[:2])
+        np.testing.assert_array_equal(reader.get('text 1'), self.vectors[1])
+        writer.put_many(self.texts[2:4], self.vectors[2:4])
+        np.testing.assert_array_equal(reader.get('text 3'), self.vectors[3])
+
+    def test_compaction_by_another_instance_between_reads(self):
+        reader, writer = self.make_store(), self.make_store()
+        reader.put_many(self.texts[:8], self.vectors[:8])
+        self.assertIsNone(reader.get('missing'))
+
+        # Touch 4-7 so they survive; the appends push the store over budget
+        writer.get_many(self.texts[4:8])
+        writer.put_many(self.texts[8:], self.vectors[8:])
+        self.assertEqual(writer.stats()['entries'], 7)
+
+        found = reader.get_many(self.texts[4:8])
+        np.testing.assert_array_equal(np.stack(found), self.vectors[4:8])
+        self.assertIsNone(reader.get('text 0'))
+        self.assertEqual(reader.stats()['entries'], 7)
+
+    def test_cached_embeddings_only_embeds_misses(self):
+        calls = []
+
+        def embed(texts):
+            calls.append(list(texts))
+            return np.stack([self.vectors[self.texts.index(text)] for text in texts])
+
+        with patch.object(Constants, 'EMBEDDING_STORE_DIR', self.root), \
+                patch.object(Constants, 'EMBEDDING_STORE_BUDGET_BYTES', 10 ** 6), \
+                patch.dict(embedding_store._stores, clear=True):
+            first = cached_embeddings('model', ['text 1', 'text 2', 'text 1'], embed)
+            second = cached_embeddings('model', ['text 2', 'text 3'], embed)
+        np.testing.assert_array_equal(first, self.vectors[[1, 2, 1]])
+        np.testing.assert_array_equal(second, self.vectors[[2, 3]])
+        self.assertEqual(calls, [['text 1', 'text 2'], ['text 3']])
+
+
+class FakeContentEngine:
+    """Stand-in for the content engine: 3-d features, one text per call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def feature_extraction(self, text):
+        self.calls.append(text)
+        return [len(text), text.count(' '), 1.0]
+
+
+@override_settings(Constants=Constants)
+class ContentFeatureExtractionTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = EngineRegistry()
+        self.registry.register('content', FakeContentEngine)
+        for patcher in (
+            patch('webui.views.registry', self.registry),
+            patch('webui.batching.registry', self.registry),
+            patch.dict(webui_batching._batchers, clear=True),
+            patch.object(Constants, 'EMBEDDING_STORE_DIR', tempfile.mkdtemp(dir=TEST_CACHE_DIR)),
+            patch.object(Constants, 'EMBEDDING_STORE_BUDGET_BYTES', 10 ** 6),
+            patch.dict(embedding_store._stores, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def extract(self, text):
+        request = RequestFactory().post('/', {'text': text}, headers={'X-API-Token': Constants.API_TOKEN})
+        response = webui_views.feature_extraction(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['embedding']
+
+    def test_repeated_texts_are_served_from_the_store(self):
+        self.assertEqual(self.extract('two words'), [9.0, 1.0, 1.0])
+        self.assertEqual(self.extract('two words'), [9.0, 1.0, 1.0])
+        engine = self.registry.get('content')
+        self.assertEqual(engine.calls, ['two words'])
+
+        # Training changes the model, so its old vectors no longer apply
+        webui_views.bump_model_version('content')
+        self.extract('two words')
+        self.assertEqual(engine.calls, ['two words', 'two words'])
+
+
+class SimilarityTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(dir=TEST_CACHE_DIR)
+        self.embeddings = np.random.default_rng(0).normal(size=(50, 8)).astype(np.float32)
+
+    def test_cosine_similarity(self):
+        self.assertAlmostEqual(cosine_similarity([1, 0], [10, 0]), 1.0)
+        self.assertAlmostEqual(cosine_similarity([1, 1], [-2, -2]), -1.0)
+        self.assertAlmostEqual(cosine_similarity([3, 0], [0, 4]), 0.0)
+        self.assertEqual(cosine_similarity([0, 0], [1, 2]), 0.0)
+
+    def test_score_matrix_matches_brute_force(self):
+        result = score_matrix(self.embeddings, os.path.join(self.dir, 'm.npy'), memory_limit_bytes=2048)
+        vectors = normalise_rows(self.embeddings)
+        np.testing.assert_allclose(np.load(result['path']), vectors @ vectors.T, atol=1e-5)
+        self.assertLess(result['strip_rows'], 50)
+
+    def test_top_k_matches_brute_force(self):
+        result = top_k_matrix(self.embeddings, os.path.join(self.dir, 'm'), 3, memory_limit_bytes=4096)
+        vectors = normalise_rows(self.embeddings)
+        full = vectors @ vectors.T
+        np.fill_diagonal(full, -np.inf)
+        expected = np.sort(full, axis=1)[:, ::-1][:, :3]
+        np.testing.assert_allclose(np.load(result['scores_path']), expected, atol=1e-5)
+        indices = np.load(result['indices_path'])
+        np.testing.assert_allclose(np.take_along_axis(full, indices, axis=1), expected, atol=1e-5)
+        self.assertLess(result['block_size'], 50)
+
+    def test_fewer_than_two_rows_give_empty_outputs(self):
+        for n in (0, 1):
+            with self.subTest(n=n):
+                prefix = os.path.join(self.dir, f'top{n}')
+                result = top_k_matrix(self.embeddings[:n], prefix, 5)
+                self.assertEqual(result['shape'], [n, 0])
+                self.assertEqual(np.load(result['indices_path']).shape, (n, 0))
+                self.assertEqual(np.load(result['scores_path']).shape, (n, 0))
+                result = score_matrix(self.embeddings[:n], os.path.join(self.dir, f'full{n}.npy'))
+                self.assertEqual(np.load(result['path']).shape, (n, n))
+        result = score_matrix(np.empty(0), os.path.join(self.dir, 'none.npy'))
+        self.assertEqual(result['shape'], [0, 0])
+
+
+class EngineRegistryTests(TestCase):
+    class Engine:
+        def __init__(self, model_name='default'):
+            if model_name == 'broken':
+                raise OSError('No weights for broken')
+            self.model_name = model_name
+
+    def setUp(self):
+        self.registry = EngineRegistry()
+        self.registry.register('fake', self.Engine)
+
+    def test_load_get_unload(self):
+        self.assertIsNone(self.registry.get('fake', load=False))
+        engine = self.registry.get('fake')
+        self.assertEqual(engine.model_name, 'default')
+        self.assertIs(self.registry.get('fake'), engine)
+        self.assertEqual(self.registry.version('fake'), 1)
+
+        loaded = self.registry.load('fake', 'other')
+        self.assertIs(self.registry.get('fake'), loaded)
+        self.assertEqual(loaded.model_name, 'other')
+        self.assertEqual(self.registry.stats()['fake']['version'], 2)
+
+        self.assertTrue(self.registry.unload('fake'))
+        self.assertFalse(self.registry.is_loaded('fake'))
+        self.assertFalse(self.registry.unload('fake'))
+        self.assertEqual(self.registry.version('fake'), 3)
+        with self.assertRaises(KeyError):
+            self.registry.load('missing')
+
+    def test_failed_reload_keeps_the_loaded_engine(self):
+        engine = self.registry.get('fake')
+        with self.assertRaises(OSError):
+            self.registry.load('fake', 'broken')
+        self.assertIs(self.registry.get('fake', load=False), engine)
+        self.assertEqual(self.registry.version('fake'), 1)
+
+    def test_engine_is_served_while_reloading(self):
+        engine = self.registry.get('fake')
+        started, release = threading.Event(), threading.Event()
+
+        def slow_factory():
+            started.set()
+            release.wait(5)
+            return self.Engine('new')
+
+        self.registry.register('fake', slow_factory)
+        thread = threading.Thread(target=self.registry.load, args=('fake',))
+        thread.start()
+        started.wait(5)
+        served = self.registry.get('fake', load=False)
+        release.set()
+        thread.join()
+        self.assertIs(served, engine)
+        self.assertEqual(self.registry.get('fake').model_name, 'new')
+
+
+@override_settings(Constants=Constants)
+class ArrayEncodingTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.embeddings = np.arange(12, dtype=np.float32).reshape(4, 3) / 7
+        self.row_ids = np.array([0, 2, 3, 2 ** 40], dtype=np.int64)
+
+    def decode(self, response):
+        """(embeddings, row_ids) from a response in any of the encodings"""
+        content_type = response['Content-Type']
+        if content_type == 'application/x-npy':
+            return np.load(BytesIO(b''.join(response)), allow_pickle=False), None
+        if content_type == 'application/x-msgpack':
+            body = encoding.msgpack.unpackb(response.content)
+        else:
+            body = json.loads(response.content)
+        arrays = []
+        for key in ('embeddings', 'row_ids'):
+            value = body[key]
+            if isinstance(value, list):
+                arrays.append(np.array(value))
+                continue
+            data = value['data']
+            if isinstance(data, str):
+                data = base64.b64decode(data)
+            arrays.append(np.frombuffer(data, dtype=np.dtype(value['dtype']).newbyteorder('<')).reshape(value['shape']))
+        return tuple(arrays)
+
+    def test_round_trips(self):
+        for fmt in ('json', 'base64', 'base64-f16', 'npy') + (('msgpack',) if encoding.msgpack else ()):
+            with self.subTest(fmt=fmt):
+                response = encoding.encode_array(self.factory.get('/', {'format': fmt}), 'embeddings',
+                                                 self.embeddings, arrays={'row_ids': self.row_ids})
+                self.assertIn('Accept', response['Vary'])
+                embeddings, row_ids = self.decode(response)
+                np.testing.assert_allclose(embeddings, self.embeddings, rtol=1e-3 if fmt == 'base64-f16' else 1e-6)
+                if fmt != 'npy':
+                    self.assertEqual(row_ids.dtype.kind, 'i')
+                    self.assertEqual(row_ids.tolist(), self.row_ids.tolist())
+
+    def test_accept_negotiation(self):
+        cases = [
+            ({}, 'json'),
+            ({'Accept': 'text/html, */*'}, 'json'),
+            ({'Accept': 'application/x-npy'}, 'npy'),
+            ({'Accept': 'text/html, application/x-msgpack;q=0.9'}, 'msgpack'),
+            ({'Accept': 'application/json, application/x-npy'}, 'json'),
+        ]
+        for headers, fmt in cases:
+            with self.subTest(headers=headers):
+                self.assertEqual(encoding.negotiate(self.factory.get('/', headers=headers)), fmt)
+        # An explicit format wins over Accept
+        request = self.factory.get('/', {'format': 'base64'}, headers={'Accept': 'application/x-npy'})
+        self.assertEqual(encoding.negotiate(request), 'base64')
+        with self.assertRaises(encoding.UnsupportedFormat):
+            encoding.negotiate(self.factory.get('/', {'format': 'xml'}))
+
+    def test_job_embeddings(self):
+        output_dir = tempfile.mkdtemp(dir=TEST_CACHE_DIR)
+        result = {
+            'embeddings_path': os.path.join(output_dir, 'embeddings.npy'),
+            'row_ids_path': os.path.join(output_dir, 'row_ids.npy'),
+        }
+        np.save(result['embeddings_path'], self.embeddings)
+        np.save(result['row_ids_path'], self.row_ids)
+
+        def get(params=None, **headers):
+            request = self.factory.get('/', params or {}, headers={'X-API-Token': Constants.API_TOKEN, **headers})
+            with patch.object(webui_views.jobs, 'get', return_value={'status': webui_jobs.SUCCEEDED}), \
+                    patch.object(webui_views.jobs, 'result', return_value=result):
+                return webui_views.job_embeddings(request, 'job')
+
+        embeddings, row_ids = self.decode(get({'format': 'base64'}))
+        np.testing.assert_array_equal(embeddings, self.embeddings)
+        np.testing.assert_array_equal(row_ids, self.row_ids)
+        embeddings, _ = self.decode(get(Accept='application/x-npy'))
+        np.testing.assert_array_equal(embeddings, self.embeddings)
+        row_ids, _ = self.decode(get({'array': 'row_ids'}, Accept='application/x-npy'))
+        np.testing.assert_array_equal(row_ids, self.row_ids)
+        self.assertEqual(get({'format': 'xml'}).status_code, 406)
+
+
+class CsvFeatureExtractionTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(dir=TEST_CACHE_DIR)
+        self.csv_path = os.path.join(self.dir, 'sentences.csv')
+        # Rows 2 and 5 have no sentence and are skipped
+        self.cells = ['alpha', 'beta', '', 'gamma', 'delta', ' ', 'epsilon', 'zeta', 'eta', 'theta', 'iota']
+        with open(self.csv_path, 'w') as f:
+            f.write('id,sentence\n' + ''.join(f'{i},{cell}\n' for i, cell in enumerate(self.cells[:10])))
+        self.expected_rows = [0, 1, 3, 4, 6, 7, 8, 9]
+        self.output_dir = os.path.join(self.dir, 'features')
+        self.calls = []
+
+    def embed(self, engine_name, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text), ord(text[0])] for text in texts], dtype=np.float32)
+
+    def extract(self, chunk_rows=3, embed=None, progress=None):
+        with patch('webui.pipeline.embed_texts', side_effect=embed or self.embed):
+            return extract_csv_features('fake', self.csv_path, 'sentence', self.output_dir,
+                                        chunk_rows=chunk_rows, progress=progress)
+
+    def assertOutputs(self):
+        embeddings, row_ids = load_features(self.output_dir)
+        self.assertEqual(row_ids.tolist(), self.expected_rows)
+        self.assertEqual(embeddings[:, 1].tolist(), [ord(self.cells[row][0]) for row in self.expected_rows])
+
+    def test_chunk_boundaries(self):
+        progress = []
+        checkpoint = self.extract(progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual([len(chunk) for chunk in self.calls], [3, 3, 2])
+        self.assertEqual(progress, [(3, 8), (6, 8), (8, 8)])
+        self.assertEqual((checkpoint['done'], checkpoint['dim'], checkpoint['complete']), (8, 2, True))
+        self.assertOutputs()
+
+        # An exact multiple of the chunk size leaves no partial chunk
+        shutil.rmtree(self.output_dir)
+        self.calls = []
+        self.extract(chunk_rows=4)
+        self.assertEqual([len(chunk) for chunk in self.calls], [4, 4])
+        self.assertOutputs()
+
+    def test_resume_after_interrupt(self):
+        def failing_embed(engine_name, texts):
+            if len(self.calls) == 2:
+                raise RuntimeError('worker killed')
+            return self.embed(engine_name, texts)
+
+        with self.assertRaises(RuntimeError):
+            self.extract(embed=failing_embed)
+        self.assertEqual(len(self.calls), 2)
+
+        # The first two chunks are kept; only the rest is embedded again
+        self.calls = []
+        self.assertTrue(self.extract()['complete'])
+        self.assertEqual(self.calls, [['eta', 'theta']])
+        self.assertOutputs()
+
+        self.calls = []
+        self.extract()
+        self.assertEqual(self.calls, [])
+
+    def test_changed_csv_starts_over(self):
+        self.extract()
+        with open(self.csv_path, 'a') as f:
+            f.write('10,iota\n')
+        self.expected_rows.append(10)
+        self.calls = []
+        self.assertEqual(self.extract()['total'], 9)
+        self.assertEqual(sum(len(chunk) for chunk in self.calls), 9)
+
+    def test_concurrent_runs_take_turns(self):
+        def slow_embed(engine_name, texts):
+            time.sleep(0.01)
+            return self.embed(engine_name, texts)
+
+        args = ('fake', self.csv_path, 'sentence', self.output_dir)
+        with patch('webui.pipeline.embed_texts', side_effect=slow_embed):
+            threads = [threading.Thread(target=extract_csv_features, args=args, kwargs={'chunk_rows': 3})
+                       for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # Every text embedded once; the later runs found the work done
+        self.assertEqual(sum(len(chunk) for chunk in self.calls), 8)
+        self.assertOutputs()
+
+
+class JobRunnerTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp(dir=TEST_CACHE_DIR)
+        patcher = patch.object(webui_jobs, 'JOBS_DIR', os.path.join(root, 'jobs'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.runner = webui_jobs.JobRunner(os.path.join(root, 'jobs.sqlite3'), concurrency={'test': 1})
+
+    def wait(self, job_id, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            state = self.runner.get(job_id)
+            if state['status'] in webui_jobs.FINISHED:
+                return state
+            time.sleep(0.01)
+        self.fail(f'Job {job_id} did not finish')
+
+    def test_result_and_progress(self):
+        def work(job, n):
+            for i in range(n):
+                job.progress(i + 1, n)
+            return {'sum': n * 2}
+
+        job = self.runner.submit('test', work, 3)
+        state = self.wait(job.id)
+        self.assertEqual(state['status'], webui_jobs.SUCCEEDED)
+        self.assertEqual(state['progress'], {'done': 3, 'total': 3})
+        self.assertEqual(self.runner.result(job.id), {'sum': 6})
+        self.assertTrue(os.path.isdir(state['output_dir']))
+        self.assertIsNone(self.runner.get('unknown'))
+
+    def test_failure_is_recorded(self):
+        def work(job):
+            raise RuntimeError('boom')
+
+        with self.assertLogs('webui.jobs', 'ERROR'):
+            state = self.wait(self.runner.submit('test', work).id)
+        self.assertEqual(state['status'], webui_jobs.FAILED)
+        self.assertEqual(state['error'], 'RuntimeError: boom')
+        self.assertIsNone(self.runner.result(state['id']))
+
+    def test_cancel_queued_and_running_jobs(self):
+        started, release = threading.Event(), threading.Event()
+
+        def blocking(job):
+            started.set()
+            release.wait(5)
+            job.progress(1)
+            return 'finished'
+
+        running = self.runner.submit('test', blocking)
+        self.assertTrue(started.wait(5))
+        queued = self.runner.submit('test', blocking)
+        self.assertTrue(self.runner.cancel(queued.id))
+        self.assertTrue(self.runner.cancel(running.id))
+        release.set()
+        self.assertEqual(self.wait(running.id)['status'], webui_jobs.CANCELLED)
+        self.assertEqual(self.wait(queued.id)['status'], webui_jobs.CANCELLED)
+        self.assertFalse(self.runner.cancel(running.id))
+
+    def test_jobs_of_dead_processes_are_failed(self):
+        connection = self.runner._connection()
+        connection.execute(
+            'INSERT INTO jobs (id, type, status, pid, created_at) VALUES (?, ?, ?, ?, ?)',
+            ('orphan', 'test', webui_jobs.RUNNING, 2 ** 22 + 1, time.time()),
+        )
+        with self.assertLogs('webui.jobs', 'WARNING'):
+            state = self.runner.get('orphan')
+        self.assertEqual(state['status'], webui_jobs.FAILED)
+
+
+class SemanticIndexTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = semantic.normalise(rng.normal(size=(300, 16)).astype(np.float32))
+
+    def assertFindsItself(self, index, post_id):
+        self.assertEqual(index.search(self.vectors[post_id], k=1, exact=True)[0][0], post_id)
+
+    def test_rebuild_runs_in_the_background(self):
+        index = semantic.SemanticIndex(16, ivf_min_size=100)
+        index.add_many(list(range(300)), self.vectors)
+        index.wait_for_rebuild(5)
+        self.assertEqual(index.stats()['ivf_lists'], 17)
+        self.assertEqual(index.stats()['unpartitioned_rows'], 0)
+        self.assertFindsItself(index, 42)
+
+    def test_changes_during_rebuild_are_kept(self):
+        index = semantic.SemanticIndex(16, ivf_min_size=100, background=False)
+        index.add_many(list(range(200)), self.vectors[:200])
+        train = semantic.kmeans
+
+        def kmeans_with_concurrent_changes(*args, **kwargs):
+            index.remove_many([5, 6])
+            index.add_many([7, 250], self.vectors[[7, 250]])
+            return train(*args, **kwargs)
+
+        with patch.object(semantic, 'kmeans', kmeans_with_concurrent_changes):
+            index.rebuild()
+        self.assertEqual(len(index), 199)
+        self.assertNotIn(5, index)
+        self.assertNotIn(6, index)
+        self.assertFindsItself(index, 7)
+        self.assertFindsItself(index, 250)
+        results = index.search(self.vectors[5], k=300, exact=True)
+        self.assertEqual(len(results), 199)
+        self.assertEqual(len({post_id for post_id, _ in results}), 199)
+
+
+class SemanticUpdateTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        semantic._index = semantic._index_version = None
+        self.addCleanup(setattr, semantic, '_index', None)
+
+    def test_saved_posts_are_embedded_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = BlogPost.objects.create(
+                title='Tor relays', slug='tor', content='Running a relay on a small VPS', published=True,
+            )
+            self.assertIsNone(BlogPost.objects.get(pk=post.pk).embedding)
+        self.assertIsNotNone(BlogPost.objects.get(pk=post.pk).embedding)
+        self.assertEqual(semantic.search('tor relay', k=1)[0][0], post.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(semantic.search('tor relay', k=1), [])
+
+    def test_failures_are_logged_not_raised(self):
+        post = BlogPost.objects.create(title='a', slug='a', content='Body', published=True)
+        with patch.object(semantic, 'embed_post', side_effect=RuntimeError('model gone')), \
+                self.assertLogs('blog.semantic', 'ERROR'):
+            semantic.schedule_embed(post.pk)
+
+
+class ApiPaginationTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now() - timedelta(days=1)
+        # Pairs of posts share a created_at, so the id has to break ties
+        for i in range(7):
+            post = BlogPost.objects.create(title=f'Post {i}', slug=f'post-{i}', content='Body', published=True)
+            BlogPost.objects.filter(pk=post.pk).update(created_at=self.start + timedelta(minutes=i // 2))
+        BlogPost.objects.create(title='Draft', slug='draft', content='Body')
+
+    def walk(self, **params):
+        slugs, cursor = [], None
+        while True:
+            query = dict(params, limit=3, fields='slug')
+            if cursor:
+                query['cursor'] = cursor
+            response = self.client.get('/api/posts/', query)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            slugs += [post['slug'] for post in data['posts']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                return slugs
+
+    def test_pages_cover_every_post_once_newest_first(self):
+        self.assertEqual(self.walk(), [f'post-{i}' for i in range(6, -1, -1)])
+
+    def test_new_posts_do_not_shift_later_pages(self):
+        first = self.client.get('/api/posts/', {'limit': 3, 'fields': 'slug'}).json()
+        post = BlogPost.objects.create(title='New', slug='new', content='Body', published=True)
+        BlogPost.objects.filter(pk=post.pk).update(created_at=self.start + timedelta(hours=1))
+        second = self.client.get('/api/posts/', {'limit': 3, 'fields': 'slug', 'cursor': first['next_cursor']}).json()
+        self.assertEqual([p['slug'] for p in second['posts']], ['post-3', 'post-2', 'post-1'])
+
+    def test_fields_and_bad_requests(self):
+        data = self.client.get('/api/posts/', {'limit': 1, 'fields': 'slug,url,tags'}).json()
+        self.assertEqual(data['posts'], [{'slug': 'post-6', 'url': '/post/post-6/', 'tags': []}])
+        self.assertEqual(self.client.get('/api/posts/', {'cursor': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/posts/', {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/posts/', {'limit': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/posts/draft/').status_code, 404)
+
+
+class ExportImportTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        news = Category.objects.create(name='News', slug='news')
+        tor = Tag.objects.create(name='Tor', slug='tor')
+        for i in range(5):
+            post = BlogPost.objects.create(
+                title=f'Post {i}', slug=f'post-{i}', content=f'Body {i}', excerpt='Short',
+                category=news, published=i != 4,
+            )
+            if i % 2:
+                post.tags.add(tor)
+        BlogPost.objects.update(created_at=timezone.now() - timedelta(days=3))
+
+    def snapshot(self):
+        return sorted(
+            (post.slug, post.title, post.content, post.excerpt, post.published, post.published_at, post.created_at,
+             post.category.slug, [tag.slug for tag in post.tags.all()])
+            for post in BlogPost.objects.select_related('category').prefetch_related('tags')
+        )
+
+    def export(self):
+        return b''.join(iter_ndjson(chunk_size=2)).splitlines()
+
+    def test_round_trip_and_reimport(self):
+        before = self.snapshot()
+        lines = self.export()
+        BlogPost.objects.all().delete()
+
+        stats = import_lines(lines, batch_size=2, embed=False)
+        self.assertEqual((stats.created, stats.skipped, stats.invalid), (5, 0, 0))
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(Category.objects.get(slug='news').published_post_count, 4)
+        self.assertEqual(Tag.objects.get(slug='tor').published_post_count, 2)
+
+        stats = import_lines(lines, embed=False)
+        self.assertEqual((stats.created, stats.skipped), (0, 5))
+
+    def test_posts_already_on_the_site_are_skipped(self):
+        stats = import_lines(self.export(), embed=False)
+        self.assertEqual((stats.created, stats.skipped), (0, 5))
+        self.assertEqual(BlogPost.objects.count(), 5)
+
+    def test_different_posts_with_taken_slugs_get_new_ones(self):
+        BlogPost.objects.create(title='x', slug='post-0-2', content='Taken')
+        lines = [
+            json.dumps({'title': 'Other', 'slug': 'post-0', 'content': 'Different body'}),
+            json.dumps({'title': 'Third', 'slug': 'post-0', 'content': 'Yet another body'}),
+            json.dumps({'title': 'Third', 'slug': 'third', 'content': 'Yet another body'}),
+            json.dumps({'title': 'No slug at all', 'content': 'Body'}),
+        ]
+        stats = import_lines(lines, embed=False)
+        self.assertEqual((stats.created, stats.skipped), (3, 1))
+        self.assertEqual(BlogPost.objects.get(title='Other').slug, 'post-0-3')
+        self.assertEqual(BlogPost.objects.get(title='Third').slug, 'post-0-4')
+        self.assertEqual(BlogPost.objects.get(title='No slug at all').slug, 'no-slug-at-all')
+        self.assertEqual(import_lines(lines, embed=False).created, 0)
+
+    def test_malformed_records_are_rejected_not_fatal(self):
+        lines = [
+            json.dumps({'title': 'Tags as text', 'content': 'Body', 'tags': 'tor'}),
+            json.dumps({'title': 'Nested tags', 'content': 'Body', 'tags': [['tor']]}),
+            json.dumps({'title': 'Numeric author', 'content': 'Body', 'author_fingerprint': 42}),
+            json.dumps({'title': 'Object author', 'content': 'Body', 'author_fingerprint': {'a': 1}}),
+            json.dumps({'title': 'Fine', 'content': 'Body', 'tags': ['tor', {'slug': 'new', 'name': 'New'}]}),
+            'not json',
+        ]
+        stats = import_lines(lines, embed=False)
+        self.assertEqual((stats.created, stats.invalid), (1, 5))
+        self.assertEqual([line for line, _error in stats.errors], [1, 2, 3, 4, 6])
+        fine = BlogPost.objects.get(title='Fine')
+        self.assertEqual(sorted(tag.slug for tag in fine.tags.all()), ['new', 'tor'])
+
+
+class FeedTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.news = Category.objects.create(name='News', slug='news')
+        self.misc = Category.objects.create(name='Misc', slug='misc')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post = BlogPost.objects.create(
+                title='First', slug='first', content='Body', category=self.news, published=True,
+            )
+            BlogPost.objects.create(title='Other', slug='other', content='Body', category=self.misc, published=True)
+
+    def test_conditional_get_returns_304(self):
+        response = self.client.get('/feeds/rss/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'First', response.content)
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/feeds/rss/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get('/feeds/rss/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+        )
+
+    def test_only_feeds_of_the_changed_scope_are_rendered_again(self):
+        rss, news, misc = (self.client.get(url)['ETag'] for url in
+                           ('/feeds/rss/', '/feeds/category/news/rss/', '/feeds/category/misc/rss/'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'First, edited'
+            self.post.save()
+        self.assertNotEqual(self.client.get('/feeds/rss/')['ETag'], rss)
+        self.assertNotEqual(self.client.get('/feeds/category/news/rss/')['ETag'], news)
+        with patch.object(feeds, '_render_feed', side_effect=AssertionError('rendered again')):
+            self.assertEqual(self.client.get('/feeds/category/misc/rss/')['ETag'], misc)
+
+    def test_query_strings_share_one_cached_document(self):
+        etag = self.client.get('/feeds/atom/')['ETag']
+        with patch.object(feeds, '_render_feed', side_effect=AssertionError('rendered again')):
+            self.assertEqual(self.client.get('/feeds/atom/', {'p': 'x'})['ETag'], etag)
+            self.assertEqual(self.client.get('/feeds/atom/', {'p': '2'})['ETag'], etag)
+
+    def test_sitemap_pages_are_normalised(self):
+        response = self.client.get('/sitemap.xml')
+        self.assertIn(b'/post/first/', response.content)
+        with patch.object(feeds, '_render_sitemap', side_effect=AssertionError('rendered again')):
+            self.assertEqual(self.client.get('/sitemap.xml', {'p': '01'})['ETag'], response['ETag'])
+        self.assertEqual(self.client.get('/sitemap.xml', {'p': 'abc'}).status_code, 404)
+        self.assertEqual(self.client.get('/sitemap.xml', {'p': '0'}).status_code, 404)
+
+
+class SnapshotTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp(dir=TEST_CACHE_DIR)
+        self.news = Category.objects.create(name='News', slug='news')
+        self.tag = Tag.objects.create(name='Tor', slug='tor')
+        self.posts = {}
+        with self.captureOnCommitCallbacks(execute=True):
+            for slug, category in (('a', self.news), ('b', self.news), ('c', None), ('d', None)):
+                self.posts[slug] = BlogPost.objects.create(
+                    title=slug.upper(), slug=slug, content='Body', category=category, published=True,
+                )
+            self.posts['d'].tags.add(self.tag)
+        snapshot.publish(self.root, host='localhost')
+
+    def change(self, func):
+        """Run func and return the scopes and posts it scheduled a publish for"""
+        with patch.object(snapshot, 'schedule_publish') as schedule, self.captureOnCommitCallbacks(execute=True):
+            func()
+        scopes, post_ids = set(), set()
+        for call in schedule.call_args_list:
+            scopes.update(call.args[0])
+            post_ids.update(call.args[1])
+        return scopes, post_ids
+
+    def read(self, path):
+        with open(os.path.join(self.root, path)) as f:
+            return f.read()
+
+    def test_only_pages_of_changed_scopes_are_checked(self):
+        post = self.posts['c']
+        post.title = 'C, edited'
+        scopes, post_ids = self.change(post.save)
+        self.assertEqual((scopes, post_ids), ({'all'}, {post.pk}))
+        stats = snapshot.publish(self.root, host='localhost', scopes=scopes, post_ids=post_ids)
+        # The list, both feeds, the sitemap and the post itself
+        self.assertEqual(stats['pages'], 5)
+        self.assertIn('C, edited', self.read('post/c/index.html'))
+        self.assertIn('C, edited', self.read('index.html'))
+
+    def test_category_change_rerenders_its_posts(self):
+        post = self.posts['a']
+        post.title = 'A, edited'
+        scopes, post_ids = self.change(post.save)
+        self.assertEqual(scopes, {'all', 'category:news'})
+        stats = snapshot.publish(self.root, host='localhost', scopes=scopes, post_ids=post_ids)
+        self.assertEqual(stats['pages'], 4 + 3 + 2)
+        self.assertIn('A, edited', self.read('category/news/index.html'))
+
+    def test_shared_tag_does_not_rerender_other_posts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts['c'].tags.add(self.tag)
+        snapshot.publish(self.root, host='localhost')
+        post = self.posts['d']
+        post.title = 'D, edited'
+        scopes, post_ids = self.change(post.save)
+        self.assertEqual((scopes, post_ids), ({'all', 'tag:tor'}, {post.pk}))
+        stats = snapshot.publish(self.root, host='localhost', scopes=scopes, post_ids=post_ids)
+        # The list, both feeds, the sitemap, the tag's two feeds and the post; not post c
+        self.assertEqual(stats['pages'], 7)
+        self.assertIn('D, edited', self.read('post/d/index.html'))
+
+    def test_tag_rename_rerenders_its_posts(self):
+        def rename():
+            self.tag.refresh_from_db()
+            self.tag.name = 'Onion'
+            self.tag.save()
+
+        scopes, post_ids = self.change(rename)
+        self.assertEqual(post_ids, {self.posts['d'].pk})
+        stats = snapshot.publish(self.root, host='localhost', scopes=scopes, post_ids=post_ids)
+        self.assertEqual(stats['pages'], 7)
+        self.assertIn('Onion', self.read('post/d/index.html'))
+
+    def test_removed_pages_are_deleted(self):
+        def unpublish():
+            for slug in ('c', 'd'):
+                self.posts[slug].published = False
+                self.posts[slug].save()
+
+        scopes, post_ids = self.change(unpublish)
+        stats = snapshot.publish(self.root, host='localhost', scopes=scopes, post_ids=post_ids)
+        # Both posts, and the feeds of the now empty tag
+        self.assertEqual(stats['removed'], 4)
+        for path in ('post/c/index.html', 'post/d/index.html', 'feeds/tag/tor/rss/index.xml'):
+            self.assertFalse(os.path.exists(os.path.join(self.root, path)))
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'post/a/index.html')))
+        self.assertEqual(snapshot.publish(self.root, host='localhost')['removed'], 0)
+
+
+class CompressionMiddlewareTests(TestCase):
+    BODY = b'<p>' + b'Hidden services are reachable only over Tor. ' * 20 + b'</p>'
+
+    def setUp(self):
+        self.factory = RequestFactory(headers={'Accept-Encoding': 'gzip'})
+        self.bodies = CompressedBodyCache(1024 * 1024)
+        patcher = patch('blog.middleware.compressed_bodies', self.bodies)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def middleware(self, response_factory):
+        return CompressedResponseCacheMiddleware(lambda request: response_factory())
+
+    def test_body_is_compressed_once_per_etag(self):
+        middleware = self.middleware(lambda: HttpResponse(self.BODY))
+        for _ in range(3):
+            response = middleware(self.factory.get('/'))
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(zlib.decompress(response.content, 31), self.BODY)
+            self.assertTrue(response['ETag'].startswith('W/"'))
+            self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual((self.bodies.misses, self.bodies.hits), (1, 2))
+
+    def test_weak_etag_is_not_a_cache_key(self):
+        bodies = iter([self.BODY, self.BODY.upper()])
+
+        def response():
+            response = HttpResponse(next(bodies))
+            response['ETag'] = 'W/"same"'
+            return response
+
+        middleware = self.middleware(response)
+        first, second = middleware(self.factory.get('/')), middleware(self.factory.get('/'))
+        self.assertEqual(zlib.decompress(first.content, 31), self.BODY)
+        self.assertEqual(zlib.decompress(second.content, 31), self.BODY.upper())
+        self.assertEqual(second['ETag'], 'W/"same"')
+        self.assertEqual(self.bodies.misses, 2)
+
+    def test_uncompressible_responses_are_untouched(self):
+        def with_cookie():
+            response = HttpResponse(self.BODY)
+            response.set_cookie('sessionid', 'x')
+            return response
+
+        for factory, request in (
+            (with_cookie, self.factory.get('/')),
+            (lambda: HttpResponse(b'short'), self.factory.get('/')),
+            (lambda: HttpResponse(self.BODY, content_type='image/png'), self.factory.get('/')),
+            (lambda: HttpResponse(self.BODY), RequestFactory().get('/')),
+        ):
+            response = self.middleware(factory)(request)
+            self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(self.bodies.stats()['entries'], 0)
+
+    def test_streaming_response_is_compressed_per_chunk(self):
+        chunks = [self.BODY, b'', self.BODY]
+        response = self.middleware(lambda: StreamingHttpResponse(iter(chunks)))(self.factory.get('/'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        parts = list(response.streaming_content)
+        # A sync-flushed piece per non-empty chunk, then the trailer
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(zlib.decompress(b''.join(parts), 31), b''.join(chunks))
+
+    def test_async_request(self):
+        async def get_response(request):
+            return HttpResponse(self.BODY)
+
+        middleware = CompressedResponseCacheMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(self.factory.get('/'))
+        self.assertEqual(zlib.decompress(response.content, 31), self.BODY)
+        self.assertEqual(self.bodies.misses, 1)
+
+
+class MinifyJsTests(TestCase):
+    def test_comments_are_dropped_but_code_after_them_kept(self):
+        self.assertEqual(_minify_js_lines('/* a */ var x = 1;\nvar y = 2;'), 'var x = 1;\nvar y = 2;')
+        self.assertEqual(_minify_js_lines('/*\n * doc\n */ var x = 1;\n  // note\n\nf();'), 'var x = 1;\nf();')
+        self.assertEqual(_minify_js_lines('/* a */ /* b */ g();\n/* c */'), 'g();')
+
+    def test_template_literals_are_kept_verbatim(self):
+        source = 'var t = `\n  /* not a comment */\n    kept`;\n    h();'
+        self.assertEqual(_minify_js_lines(source), 'var t = `\n  /* not a comment */\n    kept`;\nh();')
+
+
+@override_settings(BLOG_STREAM_CHUNK_SIZE=2, BLOG_LITE_ONION_DEFAULT=False)
+class StreamListTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            BlogPost.objects.create(title=f'Streamed post {i}', slug=f'streamed-{i}', content='Body', published=True)
+
+    def get(self, path='/'):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        if not response.streaming:
+            return response, [response.content]
+        return response, list(response.streaming_content)
+
+    def test_posts_are_sent_in_chunks(self):
+        response, parts = self.get()
+        self.assertTrue(response.streaming)
+        # The head, three chunks of at most two posts, the tail
+        self.assertEqual(len(parts), 5)
+        self.assertNotIn(b'Streamed post', parts[0] + parts[-1])
+        self.assertEqual([part.count(b'Streamed post') for part in parts[1:-1]], [2, 2, 1])
+
+    def test_streamed_page_matches_buffered_page(self):
+        _response, parts = self.get()
+        with self.settings(BLOG_STREAM_LISTS=False):
+            buffered, _parts = self.get()
+        self.assertFalse(buffered.streaming)
+
+        def normalise(html):
+            return re.sub(r'\s+', ' ', re.sub(rb'value="[\w-]{64}"', b'', html).decode())
+
+        self.assertEqual(normalise(b''.join(parts)), normalise(buffered.content))
+
+    def test_empty_list_renders_whole(self):
+        BlogPost.objects.all().delete()
+        response, _parts = self.get()
+        self.assertFalse(response.streaming)
+        self.assertContains(response, 'No posts yet.')
+
+    def test_async_stream(self):
+        posts = BlogPost.objects.filter(published=True).order_by('title')
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+
+        async def render():
+            response = await astream_list(
+                request, 'blog/post_list.html', {}, posts, 'blog/includes/post_card.html',
+            )
+            return [part async for part in response.streaming_content]
+
+        parts = async_to_sync(render)()
+        self.assertEqual([part.count(b'Streamed post') for part in parts[1:-1]], [2, 2, 1])
+        page = b''.join(parts)
+        self.assertLess(page.index(b'Streamed post 0'), page.index(b'Streamed post 4'))
+
+
+@override_settings(ALLOWED_HOSTS=['testserver', 'localhost', 'example.onion'], BLOG_LITE_ONION_DEFAULT=True)
+class LiteModeTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        BlogPost.objects.create(title='Lite post', slug='lite-post', content='Body', published=True)
+
+    def test_selection(self):
+        factory = RequestFactory()
+        cases = [
+            ({}, 'localhost', False),
+            ({}, 'example.onion:80', True),
+            ({'QUERY_STRING': 'lite=0'}, 'example.onion', False),
+            ({'HTTP_COOKIE': 'blog_lite=1'}, 'localhost', True),
+            ({'QUERY_STRING': 'lite=0', 'HTTP_COOKIE': 'blog_lite=1'}, 'localhost', False),
+            ({'QUERY_STRING': 'lite=yes'}, 'example.onion', True),
+        ]
+        for extra, host, expected in cases:
+            with self.subTest(extra=extra, host=host):
+                self.assertIs(is_lite(factory.get('/', HTTP_HOST=host, **extra)), expected)
+        with self.settings(BLOG_LITE_ONION_DEFAULT=False):
+            self.assertFalse(is_lite(factory.get('/', HTTP_HOST='example.onion')))
+
+    def test_choice_is_remembered(self):
+        response = self.client.get('/?lite=1')
+        self.assertTemplateUsed(response, 'blog/lite/post_list.html')
+        self.assertEqual(response.cookies['blog_lite'].value, '1')
+        self.assertIn('Cookie', response['Vary'])
+        response = self.client.get('/')
+        self.assertTemplateUsed(response, 'blog/lite/post_list.html')
+        self.assertNotIn('blog_lite', response.cookies)
+
+    def test_onion_host_defaults_to_lite(self):
+        self.assertTemplateUsed(self.client.get('/', headers={'Host': 'example.onion'}), 'blog/lite/post_list.html')
+        self.assertTemplateNotUsed(self.client.get('/'), 'blog/lite/post_list.html')
+
+    def test_async_request(self):
+        async def get_response(request):
+            return HttpResponse(str(request.lite))
+
+        middleware = LiteModeMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/?lite=1'))
+        self.assertEqual(response.content, b'True')
+        self.assertEqual(response.cookies['blog_lite'].value, '1')
+
+    def test_onion_snapshot_is_lite(self):
+        root = tempfile.mkdtemp(dir=TEST_CACHE_DIR)
+
+        def index():
+            with open(os.path.join(root, 'index.html')) as f:
+                return f.read()
+
+        snapshot.publish(root, host='example.onion')
+        self.assertIn('Lite post', index())
+        self.assertNotIn('materialize', index())
+        with self.settings(BLOG_LITE_ONION_DEFAULT=False):
+            stats = snapshot.publish(root, host='example.onion')
+        # Switching modes re-renders every page
+        self.assertEqual(stats['rendered'], stats['pages'])
+        self.assertIn('materialize', index())
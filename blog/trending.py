@@ -0,0 +1,106 @@
+"""
+Trending post scores with exponential time decay.
+
+A post's trending score is the sum of its event weights, each decayed by
+exp(-rate * age). Decaying every row as time passes would mean rewriting
+the whole table, so instead the stored value is the score relative to a
+fixed epoch, in log space:
+
+    trending_score = log(sum(weight * exp(rate * (event_time - EPOCH))))
+
+Every post is scaled by the same exp(-rate * (now - EPOCH)) factor, so
+ordering by the stored value is ordering by the decayed score and a
+(trending_score DESC) index serves the top-N page directly. Log space keeps
+the numbers bounded; adding a batch of events is one log-add-exp UPDATE.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+
+EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+# Posts per UPDATE; each post's value appears three times in the expression
+UPDATE_CHUNK_SIZE = 200
+
+
+def decay_rate():
+    """Decay rate per second derived from the configured half-life"""
+    half_life_hours = getattr(settings, 'BLOG_TRENDING_HALF_LIFE_HOURS', 24)
+    return math.log(2) / (half_life_hours * 3600)
+
+
+def event_score(weight, when=None):
+    """Log-space contribution of one event of the given weight at time `when`"""
+    when = when or timezone.now()
+    return decay_rate() * (when - EPOCH).total_seconds() + math.log(weight)
+
+
+def current_score(stored_score, now=None):
+    """Turn a stored score into the decayed weighted event count as of `now`"""
+    if stored_score is None:
+        return 0.0
+    now = now or timezone.now()
+    return math.exp(stored_score - decay_rate() * (now - EPOCH).total_seconds())
+
+
+def view_weight():
+    return getattr(settings, 'BLOG_TRENDING_VIEW_WEIGHT', 1.0)
+
+
+def publish_weight():
+    return getattr(settings, 'BLOG_TRENDING_PUBLISH_WEIGHT', 10.0)
+
+
+def record_events(weights, when=None):
+    """
+    Add events to posts' trending scores.
+
+    weights maps post id to the total weight of its events in this batch;
+    all events are stamped with `when`. Runs one UPDATE per chunk of posts:
+
+        score = max(score, x) + ln(1 + exp(-|score - x|))
+    """
+    from .models import BlogPost
+
+    when = when or timezone.now()
+    items = [(post_id, event_score(weight, when)) for post_id, weight in weights.items() if weight > 0]
+    for start in range(0, len(items), UPDATE_CHUNK_SIZE):
+        chunk = items[start:start + UPDATE_CHUNK_SIZE]
+        incoming = Case(
+            *[When(pk=post_id, then=Value(score)) for post_id, score in chunk],
+            output_field=FloatField(),
+        )
+        combined = Greatest(F('trending_score'), incoming) + Ln(
+            Value(1.0) + Exp(-Abs(F('trending_score') - incoming))
+        )
+        BlogPost.objects.filter(pk__in=[post_id for post_id, _ in chunk]).update(
+            trending_score=Case(
+                When(trending_score__isnull=True, then=incoming),
+                default=combined,
+                output_field=FloatField(),
+            )
+        )
+
+
+def record_views(view_counts, when=None):
+    """Add a batch of {post_id: views} from the view counter"""
+    weight = view_weight()
+    record_events({post_id: count * weight for post_id, count in view_counts.items()}, when)
+
+
+def record_publish(post_id, when=None):
+    record_events({post_id: publish_weight()}, when)
+
+
+def trending_posts(limit=20):
+    """Published posts ordered by trending score, served by blog_post_trending_idx"""
+    from .models import BlogPost
+
+    return BlogPost.objects.filter(
+        published=True, trending_score__isnull=False
+    ).order_by('-trending_score')[:limit]
@@ -1,5 +1,12 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, feeds, views
+
+
+if getattr(settings, 'BLOG_ASYNC_VIEWS', False):
+    from . import async_views as read_views
+else:
+    read_views = views
 
 
 app_name = 'blog'
@@ -7,20 +14,36 @@ app_name = 'blog'
 
 urlpatterns = [
     # Blog post views
-    path('', views.post_list, name='post_list'),
-    path('post/<slug:slug>/', views.post_detail, name='post_detail'),
+    path('', read_views.post_list, name='post_list'),
+    path('trending/', views.trending_posts, name='trending_posts'),
+    path('post/<slug:slug>/', read_views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
-    path('category/<slug:slug>/', views.category_detail, name='category_detail'),
+    path('category/<slug:slug>/', read_views.category_detail, name='category_detail'),
     path('profile/', views.user_profile, name='user_profile'),
     path('login/', views.login_page, name='login_page'),
+
+    # Feeds and sitemap
+    path('feeds/rss/', feeds.posts_feed, name='posts_feed'),
+    path('feeds/atom/', feeds.posts_feed, {'atom': True}, name='posts_atom_feed'),
+    path('feeds/category/<slug:slug>/rss/', feeds.category_feed, name='category_feed'),
+    path('feeds/category/<slug:slug>/atom/', feeds.category_feed, {'atom': True}, name='category_atom_feed'),
+    path('feeds/tag/<slug:slug>/rss/', feeds.tag_feed, name='tag_feed'),
+    path('feeds/tag/<slug:slug>/atom/', feeds.tag_feed, {'atom': True}, name='tag_atom_feed'),
+    path('sitemap.xml', feeds.sitemap_xml, name='sitemap'),
     path('logout/', views.auth_logout, name='auth_logout'),
     
     # Authentication endpoints
     path('api/generate-keys/', views.generate_keys, name='generate_keys'),
-    path('api/get-challenge/', views.get_challenge, name='get_challenge'),
+    path('api/get-challenge/', read_views.get_challenge, name='get_challenge'),
     path('api/login/', views.auth_login, name='auth_login'),
     
     # API endpoints
-    path('api/posts/', views.api_create_post, name='api_create_post'),
+    path('api/posts/', api.api_posts, name='api_posts'),
+    path('api/posts/export/', api.api_export_posts, name='api_export_posts'),
+    path('api/posts/trending/', read_views.api_trending_posts, name='api_trending_posts'),
+    path('api/posts/search/', read_views.api_search_posts, name='api_search_posts'),
+    path('api/posts/<slug:slug>/stats/', read_views.api_post_stats, name='api_post_stats'),
+    path('api/posts/<slug:slug>/similar/', read_views.api_similar_posts, name='api_similar_posts'),
+    path('api/posts/<slug:slug>/', api.api_post_detail, name='api_post_detail'),
 ]
 
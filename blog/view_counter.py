@@ -0,0 +1,117 @@
+"""
+Buffered post view counting.
+
+Incrementing BlogPost.view_count on every post_detail hit would turn each
+read into a write against SQLite's single writer. Instead each process
+accumulates increments in memory and a background thread writes them with
+one batched UPDATE every BLOG_VIEW_COUNT_FLUSH_INTERVAL seconds, which is
+also the most a crash can lose. If more than BLOG_VIEW_COUNT_MAX_PENDING
+distinct posts are pending, the request that overflows flushes immediately,
+so the buffer stays bounded.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import BlogPost
+from .trending import record_views
+
+
+logger = logging.getLogger(__name__)
+
+# Posts per UPDATE statement; keeps the CASE expression well under SQLite's variable limit
+UPDATE_CHUNK_SIZE = 400
+
+
+class ViewCountBuffer:
+    """Thread-safe per-process buffer of pending view increments"""
+
+    def __init__(self, flush_interval=None, max_pending=None):
+        self.flush_interval = flush_interval or getattr(settings, 'BLOG_VIEW_COUNT_FLUSH_INTERVAL', 10)
+        self.max_pending = max_pending or getattr(settings, 'BLOG_VIEW_COUNT_MAX_PENDING', 1000)
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._pid = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, post_id, count=1):
+        """Count a view of post_id; flushes synchronously if the buffer is full"""
+        with self._lock:
+            self._ensure_started()
+            self._pending[post_id] += count
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.flush()
+
+    def pending(self, post_id):
+        """Views of post_id recorded by this process but not yet written"""
+        with self._lock:
+            return self._pending.get(post_id, 0)
+
+    def flush(self):
+        """Write all pending increments; returns the batch that was written"""
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+        if not batch:
+            return batch
+        try:
+            self._write(batch)
+        except DatabaseError:
+            logger.exception('Failed to flush %d view counts, keeping them for the next flush', len(batch))
+            with self._lock:
+                # Put the batch back, unless that would blow the bound -
+                # then dropping counts beats growing without limit.
+                if len(self._pending) + len(batch) <= self.max_pending * 2:
+                    self._pending.update(batch)
+            return Counter()
+        return batch
+
+    def _write(self, batch):
+        items = list(batch.items())
+        with transaction.atomic():
+            for start in range(0, len(items), UPDATE_CHUNK_SIZE):
+                chunk = items[start:start + UPDATE_CHUNK_SIZE]
+                increment = Case(
+                    *[When(pk=post_id, then=Value(count)) for post_id, count in chunk],
+                    default=Value(0),
+                )
+                BlogPost.objects.filter(pk__in=[post_id for post_id, _ in chunk]).update(
+                    view_count=F('view_count') + increment
+                )
+            # The same batch feeds the trending scores as one set of view events
+            record_views(batch)
+
+    def _ensure_started(self):
+        """Start the flush thread; called with the lock held"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        # First use in this process, or we were forked: the parent's pending
+        # counts are the parent's to flush, and its thread didn't survive.
+        self._pid = pid
+        self._pending = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='view-count-flush', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        stop = self._stop
+        while not stop.wait(self.flush_interval):
+            self.flush()
+        connection.close()
+
+    def stop(self):
+        """Stop the flush thread and write what is left"""
+        self._stop.set()
+        self.flush()
+
+
+view_counts = ViewCountBuffer()
+atexit.register(view_counts.stop)
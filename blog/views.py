@@ -1,4 +1,5 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.http import JsonResponse, HttpRequest, HttpResponse
 from django.views.decorators.http import require_http_methods
 from django.utils.text import slugify
@@ -6,9 +7,16 @@ from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.core.cache import cache
+import hashlib
 import secrets
 import json
 from .models import BlogPost, Category, Tag, PublicKeyUser
+from .lite import template_for
+from .signals import get_taxonomy_version
+from .streaming import stream_list, streaming_enabled
+from .view_counter import view_counts
+from . import semantic, trending
 from .crypto_auth import (
     generate_key_pair, sign_message, get_public_key_fingerprint, 
     encrypt_fingerprint_and_hash, verify_encrypted_fingerprint_and_hash
@@ -17,9 +25,12 @@ from .crypto_auth import (
 
 def post_list(request: HttpRequest):
     """Display list of published blog posts"""
-    posts = BlogPost.objects.filter(published=True).order_by('-created_at')
-    categories = Category.objects.all()
-    tags = Tag.objects.all()
+    posts = BlogPost.objects.filter(published=True).order_by('-created_at').select_related(
+        'category', 'author_user'
+    ).prefetch_related('tags')
+    # Only evaluated when the cached sidebar fragments are missing
+    categories = Category.objects.order_by('-published_post_count', 'name')
+    tags = Tag.objects.order_by('-published_post_count', 'name')
     
     # Filter by category if provided
     category_slug = request.GET.get('category')
@@ -34,18 +45,26 @@ def post_list(request: HttpRequest):
         posts = posts.filter(tags=tag)
     
     context = {
-        'posts': posts,
         'categories': categories,
         'tags': tags,
         'selected_category': category_slug,
         'selected_tag': tag_slug,
+        'taxonomy_version': get_taxonomy_version(),
     }
-    return render(request, 'blog/post_list.html', context)
+    if streaming_enabled():
+        return stream_list(
+            request, template_for(request, 'blog/post_list.html'), context, posts,
+            template_for(request, 'blog/includes/post_card.html'),
+        )
+    context['posts'] = posts
+    return render(request, template_for(request, 'blog/post_list.html'), context)
 
 
 def post_detail(request: HttpRequest, slug: str):
     """Display a single blog post"""
     post = get_object_or_404(BlogPost, slug=slug, published=True)
+    if not getattr(request, 'static_snapshot', False):
+        view_counts.record(post.pk)
     related_posts = BlogPost.objects.filter(
         published=True,
         category=post.category
@@ -53,13 +72,7 @@ def post_detail(request: HttpRequest, slug: str):
     
     # Verify encryption if post has encrypted data and author_user exists
     if post.encrypted_data and post.author_user:
-        from .crypto_auth import verify_encrypted_fingerprint_and_hash
-        encrypted_valid = verify_encrypted_fingerprint_and_hash(
-            post.author_user.public_key,
-            post.encrypted_data,
-            post.author_user.fingerprint,
-            post.content
-        )
+        encrypted_valid = verify_post_encryption(post)
         
         # Update encrypted_valid if it changed
         if post.encrypted_valid != encrypted_valid:
@@ -70,19 +83,60 @@ def post_detail(request: HttpRequest, slug: str):
         'post': post,
         'related_posts': related_posts,
     }
-    return render(request, 'blog/post_detail.html', context)
+    return render(request, template_for(request, 'blog/post_detail.html'), context)
+
+
+def verify_post_encryption(post: BlogPost) -> bool:
+    """
+    Verify a post's encrypted fingerprint and content hash.
+    RSA verification is expensive, so results are kept in the shared cache,
+    keyed by everything the result depends on.
+    """
+    digest = hashlib.sha256('\0'.join([
+        post.author_user.public_key,
+        post.encrypted_data,
+        post.author_user.fingerprint,
+        post.content,
+    ]).encode('utf-8')).hexdigest()
+    key = f'post_verification:{post.pk}:{digest}'
+    encrypted_valid = cache.get(key)
+    if encrypted_valid is None:
+        encrypted_valid = verify_encrypted_fingerprint_and_hash(
+            post.author_user.public_key,
+            post.encrypted_data,
+            post.author_user.fingerprint,
+            post.content
+        )
+        cache.set(key, encrypted_valid)
+    return encrypted_valid
+
+
+def trending_posts(request: HttpRequest):
+    """Display published posts ordered by time-decayed popularity"""
+    posts = trending.trending_posts(limit=20).select_related('category', 'author_user')
+    context = {
+        'posts': posts,
+    }
+    return render(request, template_for(request, 'blog/trending.html'), context)
 
 
 def category_detail(request: HttpRequest, slug: str):
     """Display posts in a category"""
     category = get_object_or_404(Category, slug=slug)
-    posts = BlogPost.objects.filter(category=category, published=True).order_by('-created_at')
+    posts = BlogPost.objects.filter(category=category, published=True).order_by('-created_at').select_related(
+        'author_user'
+    )
     
     context = {
         'category': category,
-        'posts': posts,
     }
-    return render(request, 'blog/category_detail.html', context)
+    if streaming_enabled():
+        return stream_list(
+            request, template_for(request, 'blog/category_detail.html'), context, posts,
+            template_for(request, 'blog/includes/category_post_card.html'),
+        )
+    context['posts'] = posts
+    return render(request, template_for(request, 'blog/category_detail.html'), context)
 
 
 def generate_keys(request: HttpRequest):
@@ -190,13 +244,16 @@ def user_profile(request: HttpRequest):
         user = request.user
         is_own_profile = True
     
-    user_posts = BlogPost.objects.filter(author_user=user).order_by('-created_at')
+    user_posts = BlogPost.objects.filter(author_user=user).order_by('-created_at').only('slug', 'title', 'created_at')
     
     context = {
         'user': user,
-        'posts': user_posts,
+        'post_count': user_posts.count(),
         'is_own_profile': is_own_profile,
     }
+    if streaming_enabled():
+        return stream_list(request, 'blog/profile.html', context, user_posts, 'blog/includes/profile_post_item.html')
+    context['posts'] = user_posts
     return render(request, 'blog/profile.html', context)
 
 
@@ -321,10 +378,45 @@ def post_create(request: HttpRequest):
     context = {
         'categories': categories,
         'tags': tags,
+        'taxonomy_version': get_taxonomy_version(),
     }
     return render(request, 'blog/post_create.html', context)
 
 
+@require_http_methods(["GET"])
+def api_trending_posts(request: HttpRequest):
+    """API endpoint returning the top trending posts"""
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    now = timezone.now()
+    posts = trending.trending_posts(limit=limit).values_list('title', 'slug', 'view_count', 'trending_score')
+    return JsonResponse({
+        'posts': [
+            {
+                'title': title,
+                'slug': slug,
+                'url': reverse('blog:post_detail', kwargs={'slug': slug}),
+                'view_count': view_count,
+                'score': trending.current_score(score, now),
+            }
+            for title, slug, view_count, score in posts
+        ]
+    })
+
+
+@require_http_methods(["GET"])
+def api_post_stats(request: HttpRequest, slug: str):
+    """API endpoint returning a published post's view total"""
+    post = get_object_or_404(BlogPost.objects.only('pk', 'slug', 'view_count'), slug=slug, published=True)
+    return JsonResponse({
+        'slug': post.slug,
+        # Include views buffered in this process but not flushed yet
+        'view_count': post.view_count + view_counts.pending(post.pk),
+    })
+
+
 @require_http_methods(["POST"])
 def api_create_post(request: HttpRequest):
     """API endpoint to create a post via AJAX - requires authentication"""
@@ -342,6 +434,7 @@ def api_create_post(request: HttpRequest):
     category_id = request.POST.get('category')
     new_category_name = request.POST.get('new_category', '').strip()
     tag_ids = request.POST.getlist('tags')
+    new_tags_string = request.POST.get('new_tags', '').strip()
     published = request.POST.get('published') == 'true'
     
     if not title or not content:
@@ -413,3 +506,50 @@ def api_create_post(request: HttpRequest):
             'url': post.get_absolute_url(),
         }
     }, status=201)
+
+
+def _semantic_results(matches):
+    """Published posts for (post_id, score) matches, in match order"""
+    posts = {
+        pk: (title, slug)
+        for pk, title, slug in BlogPost.objects.filter(
+            pk__in=[post_id for post_id, _ in matches], published=True
+        ).values_list('pk', 'title', 'slug')
+    }
+    return [
+        {
+            'title': posts[post_id][0],
+            'slug': posts[post_id][1],
+            'url': reverse('blog:post_detail', kwargs={'slug': posts[post_id][1]}),
+            'score': round(score, 4),
+        }
+        for post_id, score in matches if post_id in posts
+    ]
+
+
+def _result_limit(request):
+    return min(max(int(request.GET.get('limit', 10)), 1), 50)
+
+
+@require_http_methods(["GET"])
+def api_search_posts(request: HttpRequest):
+    """API endpoint ranking published posts by semantic similarity to ?q="""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'q is required'}, status=400)
+    try:
+        limit = _result_limit(request)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    return JsonResponse({'query': query, 'posts': _semantic_results(semantic.search(query[:1000], k=limit))})
+
+
+@require_http_methods(["GET"])
+def api_similar_posts(request: HttpRequest, slug: str):
+    """API endpoint listing the published posts most similar to a post"""
+    post = get_object_or_404(BlogPost.objects.only('pk'), slug=slug, published=True)
+    try:
+        limit = _result_limit(request)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    return JsonResponse({'slug': slug, 'posts': _semantic_results(semantic.similar_posts(post.pk, k=limit))})
@@ -1,7 +1,8 @@
 """
 ASGI config for main project.
 
-It exposes the ASGI callable as a module-level variable named ``application``.
+It exposes the ASGI callable as a module-level variable named ``application``,
+e.g. for ``uvicorn main.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -12,5 +13,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+# Route the public read views to blog.async_views, so slow clients hold a
+# coroutine rather than a thread. Set BLOG_ASYNC_VIEWS=0 to keep the sync views.
+os.environ.setdefault('BLOG_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -1,9 +1,22 @@
+import os
 from django.conf import settings
 
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 class Constants:
     DEBUG = True
     SECRET_KEY = '1234567890'
     API_TOKEN = 'FOOBAR1'
     REDIS_URL = 'redis://localhost:6379'
+    # Comma-separated webui engine names to load before the server forks
+    WEBUI_PRELOAD_ENGINES = os.getenv('WEBUI_PRELOAD_ENGINES', '').split(',')
+    # Where webui writes derived data (embedding store, job outputs)
+    WEBUI_DATA_DIR = os.getenv('WEBUI_DATA_DIR', os.path.join(BASE_DIR, 'webui_data'))
+    EMBEDDING_STORE_DIR = os.path.join(WEBUI_DATA_DIR, 'embeddings')
+    # Disk budget per model; the least recently used vectors are dropped beyond it
+    EMBEDDING_STORE_BUDGET_BYTES = int(os.getenv('EMBEDDING_STORE_BUDGET_BYTES', 1024 ** 3))
+    # Per-process cache of predict() results; also dropped when training finishes
+    PREDICT_CACHE_TTL = int(os.getenv('PREDICT_CACHE_TTL', 300))
+    PREDICT_CACHE_MAX_ENTRIES = int(os.getenv('PREDICT_CACHE_MAX_ENTRIES', 10000))
 
 settings.Constants = Constants
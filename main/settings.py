@@ -52,6 +52,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.sitemaps',
     'blog',
 ]
 
@@ -61,12 +62,14 @@ AUTH_USER_MODEL = 'blog.PublicKeyUser'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'blog.middleware.CompressedResponseCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'blog.lite.LiteModeMiddleware',
 ]
 
 ROOT_URLCONF = 'main.urls'
@@ -101,6 +104,21 @@ DATABASES = {
 }
 
 
+# Cache
+# A SQLite table in WAL mode shared by every worker process on the host, so
+# cached fragments survive restarts and aren't duplicated per worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'blog.cache_backend.SQLiteCache',
+        'LOCATION': BASE_DIR / 'cache.sqlite3',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    }
+}
+
+
 # Custom Authentication Backend
 AUTHENTICATION_BACKENDS = [
     'blog.auth_backend.PublicKeyAuthBackend',
@@ -145,6 +163,20 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# `manage.py build_static` writes minified, content-hashed copies of the
+# static files with .gz siblings here (see blog.assets). Hashed names are
+# served with a year-long immutable Cache-Control.
+STATIC_ROOT = os.getenv('STATIC_ROOT') or BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'blog.assets.HashedCompressedStaticStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -163,3 +195,81 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # Persist across browser restarts
 CSRF_COOKIE_HTTPONLY = True  # Prevents JavaScript access to CSRF token cookie
 CSRF_COOKIE_SAMESITE = 'Lax'  # CSRF protection
 # CSRF_COOKIE_SECURE is False for Tor hidden service (HTTP only)
+
+# Post view counting
+# View increments are buffered per process and written in one batched UPDATE
+# every BLOG_VIEW_COUNT_FLUSH_INTERVAL seconds - at most that many seconds of
+# counts are lost if a worker crashes.
+BLOG_VIEW_COUNT_FLUSH_INTERVAL = 10
+BLOG_VIEW_COUNT_MAX_PENDING = 1000
+
+# Trending posts
+# Views and publishes add weighted events to a post's trending score, which
+# halves every BLOG_TRENDING_HALF_LIFE_HOURS.
+BLOG_TRENDING_HALF_LIFE_HOURS = 24
+BLOG_TRENDING_VIEW_WEIGHT = 1.0
+BLOG_TRENDING_PUBLISH_WEIGHT = 10.0
+
+# Semantic search
+# Published posts are embedded on save with BLOG_SEMANTIC_ENGINE: 'hashing'
+# (built in, no model needed) or a webui engine name such as
+# 'large_feature_extraction'. Changing it requires `manage.py embed_posts`.
+# Above BLOG_SEMANTIC_IVF_MIN_POSTS posts searches use an IVF partition and
+# scan the BLOG_SEMANTIC_IVF_PROBES nearest clusters instead of every post.
+# With BLOG_SEMANTIC_BACKGROUND saved posts are embedded on a background
+# thread after commit rather than before the response is sent.
+BLOG_SEMANTIC_ENGINE = 'hashing'
+BLOG_SEMANTIC_IVF_MIN_POSTS = 20000
+BLOG_SEMANTIC_IVF_PROBES = 8
+BLOG_SEMANTIC_BACKGROUND = True
+
+# Async read views
+# Serve the public read views (post list/detail, categories, challenge and
+# JSON APIs) from blog.async_views. main.asgi enables this; under WSGI the
+# sync views are used.
+BLOG_ASYNC_VIEWS = os.getenv('BLOG_ASYNC_VIEWS', '') == '1'
+
+# Corpus export
+# api/posts/export/ streams every post as NDJSON to requests whose
+# X-API-TOKEN header matches BLOG_EXPORT_TOKEN; it is disabled when unset.
+BLOG_EXPORT_TOKEN = os.getenv('BLOG_EXPORT_TOKEN', '')
+
+# Static snapshot
+# `manage.py publish_static` renders the public pages and feeds into
+# STATIC_SNAPSHOT_ROOT for the front web server. When it is set, post
+# changes also regenerate the affected pages in the background. Absolute
+# URLs (feeds, sitemap) use STATIC_SNAPSHOT_HOST.
+STATIC_SNAPSHOT_ROOT = os.getenv('STATIC_SNAPSHOT_ROOT') or None
+STATIC_SNAPSHOT_HOST = os.getenv('STATIC_SNAPSHOT_HOST', TOR_HIDDEN_SERVICE_HOSTNAME)
+
+# Response compression
+# blog.middleware compresses responses once per ETag and encoding and keeps
+# the compressed bodies in a per-process LRU of up to
+# BLOG_COMPRESSION_CACHE_MAX_BYTES. Levels are per content type; 0 disables.
+BLOG_COMPRESSION_LEVELS = {
+    'text/html': 6,
+    'application/json': 6,
+    'application/xml': 9,
+    'application/rss+xml': 9,
+    'application/atom+xml': 9,
+    'application/x-ndjson': 6,
+    'text/css': 9,
+    'text/javascript': 9,
+    'application/javascript': 9,
+    'text/plain': 6,
+}
+BLOG_COMPRESSION_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Streamed list pages
+# The post list, category and profile pages send their head and the first
+# posts straight away, then the rest BLOG_STREAM_CHUNK_SIZE posts at a time
+# (see blog.streaming). Set BLOG_STREAM_LISTS = False to render them whole.
+BLOG_STREAM_LISTS = True
+BLOG_STREAM_CHUNK_SIZE = 25
+
+# Lite mode
+# The reading pages render from blog/lite/ (inline CSS, no web fonts, no JS)
+# for ?lite=1, the blog_lite cookie it sets, and, with
+# BLOG_LITE_ONION_DEFAULT, every request to a .onion host. The static
+# snapshot follows the same default for STATIC_SNAPSHOT_HOST.
+BLOG_LITE_ONION_DEFAULT = True
@@ -1,7 +1,14 @@
+import re
+
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from blog.assets import serve_asset
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Built assets from STATIC_ROOT, for when no front web server serves them
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve_asset),
     path('', include('blog.urls')),
 ]
@@ -0,0 +1,34 @@
+"""
+Version counters in the shared cache.
+
+Cached data that is expensive to invalidate key by key (taxonomy fragments,
+feeds, the semantic index, webui predictions) carries a version in its key
+instead; bumping the version makes every process stop using the old entries
+at once, and they age out of the cache on their own.
+
+Counters are seeded from the clock rather than 1, so a counter that was
+evicted and reseeded can never roll back onto entries stored under an
+older version.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Current value of the counter at key, seeding it if it doesn't exist"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Advance the counter at key and return its new value"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+        return version
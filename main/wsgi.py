@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
 
 application = get_wsgi_application()
+
+# Load webui model engines now when configured, so that with
+# `gunicorn --preload` they are loaded once in the master and shared
+# copy-on-write by the forked workers.
+if os.getenv('WEBUI_PRELOAD_ENGINES'):
+    from webui.registry import preload_configured
+    preload_configured()
@@ -0,0 +1,203 @@
+"""
+Dynamic micro-batching in front of the webui engines.
+
+Each request thread submits its text(s) to the engine's MicroBatcher and
+waits on a future. A single worker thread per engine collects queued texts
+until it has max_batch_size of them or the oldest has waited max_wait_ms,
+runs one batched forward pass, and fans the rows back out to the waiting
+requests. Under concurrency this turns N forward passes of one text into a
+few passes of many, which is where transformer and llama.cpp throughput
+comes from; a lone request pays at most max_wait_ms extra latency.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from .embedding_store import cached_embeddings
+from .registry import registry
+
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 1
+# Seconds a caller waits for its results before giving up
+DEFAULT_TIMEOUT = 60
+
+
+class EngineNotLoaded(Exception):
+    pass
+
+
+def _embed_with_transformer(engine, texts):
+    """Batched forward pass for LargeFeatureExtractionEngine-style engines"""
+    import torch
+
+    inputs = engine.tokenizer(list(texts), return_tensors='pt', padding=True, truncation=True, max_length=512)
+    with torch.no_grad():
+        outputs = engine.model(**inputs)
+    # Mean over real tokens only, so padding doesn't change a text's
+    # embedding compared to embedding it on its own.
+    mask = inputs['attention_mask'].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+    summed = (outputs.last_hidden_state * mask).sum(dim=1)
+    return (summed / mask.sum(dim=1).clamp(min=1)).numpy().astype(np.float32, copy=False)
+
+
+def embed_batch(engine, texts):
+    """
+    Embed a list of texts in as few forward passes as the engine allows.
+    Returns a float32 array with one row per text.
+    """
+    if hasattr(engine, 'extract_features_batch'):
+        return np.asarray(engine.extract_features_batch(list(texts)), dtype=np.float32)
+    if hasattr(engine, 'tokenizer') and hasattr(engine, 'model'):
+        return _embed_with_transformer(engine, texts)
+    if getattr(engine, 'embedding_model', None) is not None:
+        # llama.cpp embeds a list of inputs in one call
+        result = engine.embedding_model.create_embedding(list(texts))
+        return np.asarray([row['embedding'] for row in result['data']], dtype=np.float32)
+    return np.stack([np.asarray(engine.extract_features(text), dtype=np.float32) for text in texts])
+
+
+class MicroBatcher:
+    """Collects concurrent submissions into batches for batch_fn(items) -> results"""
+
+    def __init__(self, batch_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, timeout=DEFAULT_TIMEOUT):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return self._queue
+            # First use, or forked from a process whose worker didn't survive
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            threading.Thread(target=self._run, args=(self._queue,), name='micro-batcher', daemon=True).start()
+            return self._queue
+
+    def submit(self, item):
+        future = Future()
+        self._ensure_started().put((item, future))
+        return future
+
+    def __call__(self, items, timeout=None):
+        """
+        Submit items and block until all of their results are ready. Raises
+        TimeoutError if that takes longer than timeout seconds (default: the
+        batcher's timeout) in total; items not yet picked up are withdrawn.
+        """
+        futures = [self.submit(item) for item in items]
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        try:
+            return [future.result(max(deadline - time.monotonic(), 0)) for future in futures]
+        except TimeoutError:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _run(self, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                results = list(self.batch_fn(items))
+                if len(results) != len(items):
+                    raise ValueError(f'Batch function returned {len(results)} results for {len(items)} items')
+                self.batches += 1
+                self.items += len(items)
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            except BaseException as exc:
+                # Nobody may be left waiting forever on a future of this batch
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+                if not isinstance(exc, Exception):
+                    raise
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': round(self.items / self.batches, 2) if self.batches else 0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(engine_name, batch_fn=None):
+    """
+    Return the embedding batcher for a registry engine. The engine is looked
+    up per batch, so reloading it through the registry takes effect at once.
+    """
+    with _batchers_lock:
+        batcher = _batchers.get(engine_name)
+        if batcher is None:
+            def run_batch(texts):
+                engine = registry.get(engine_name, load=False)
+                if engine is None:
+                    raise EngineNotLoaded(engine_name)
+                return (batch_fn or embed_batch)(engine, texts)
+            batcher = _batchers[engine_name] = MicroBatcher(run_batch)
+        return batcher
+
+
+def embedding_model_id(engine_name, engine):
+    """
+    Identity of the model behind an engine for the embedding store, or None
+    if the engine doesn't say which model it serves (then nothing is cached).
+    """
+    model = getattr(engine, 'embedding_model_name', None) or getattr(engine, 'model_name', None)
+    return f'{engine_name}:{model}' if model else None
+
+
+def embed_texts(engine_name, texts, batch_fn=None, version=None):
+    """
+    Embeddings for texts from a registry engine as a float32 array. Texts
+    already in the embedding store are served from disk; the rest go through
+    the engine's micro-batcher and are added to the store. batch_fn(engine,
+    texts) replaces embed_batch for engines with their own embedding method;
+    version, for engines whose model changes in place (training), is part
+    of the store key.
+    """
+    engine = registry.get(engine_name, load=False)
+    if engine is None:
+        raise EngineNotLoaded(engine_name)
+    batcher = get_batcher(engine_name, batch_fn)
+    embed = lambda batch: np.stack(batcher(batch))
+    model_id = embedding_model_id(engine_name, engine)
+    if version is not None:
+        model_id = f'{model_id or engine_name}:v{version}'
+    if model_id is None:
+        return embed(list(texts))
+    return cached_embeddings(model_id, list(texts), embed)
+
+
+def batcher_stats():
+    return {name: batcher.stats() for name, batcher in _batchers.items()}
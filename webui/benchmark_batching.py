@@ -0,0 +1,97 @@
+"""
+Throughput benchmark for the micro-batcher against a CPU stand-in engine.
+
+    python -m webui.benchmark_batching --clients 32 --requests 2000
+
+The stand-in hashes tokens into a bag-of-words vector and runs it through
+two dense layers with NumPy, so - like a real model - a forward pass has a
+fixed per-call cost that batching amortises. It needs neither torch nor
+model weights.
+"""
+import argparse
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+
+from .batching import MicroBatcher, embed_batch
+
+
+class StandInEngine:
+    """CPU stand-in exposing the same extract_features / extract_features_batch interface"""
+
+    model_name = 'stand-in'
+
+    def __init__(self, vocab_size=8192, hidden=1024, dim=384, seed=0):
+        rng = np.random.default_rng(seed)
+        self.vocab_size = vocab_size
+        self.w1 = rng.standard_normal((vocab_size, hidden), dtype=np.float32) / np.sqrt(vocab_size)
+        self.w2 = rng.standard_normal((hidden, dim), dtype=np.float32) / np.sqrt(hidden)
+        self._lock = threading.Lock()
+
+    def _bag(self, texts):
+        bag = np.zeros((len(texts), self.vocab_size), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                bag[row, zlib.crc32(token.encode('utf-8')) % self.vocab_size] += 1.0
+        return bag
+
+    def extract_features_batch(self, texts):
+        # One forward pass at a time, like a model that isn't re-entrant
+        with self._lock:
+            hidden = np.tanh(self._bag(texts) @ self.w1)
+            return hidden @ self.w2
+
+    def extract_features(self, text):
+        return self.extract_features_batch([text])[0]
+
+
+def _run_clients(clients, requests, call):
+    texts = [f'sentence number {i} about topic {i % 97} and more words' for i in range(requests)]
+    per_client = [texts[i::clients] for i in range(clients)]
+
+    def client(batch):
+        for text in batch:
+            call(text)
+
+    threads = [threading.Thread(target=client, args=(batch,)) for batch in per_client]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent client threads')
+    parser.add_argument('--requests', type=int, default=2000, help='Total single-text requests')
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=1)
+    args = parser.parse_args()
+
+    engine = StandInEngine()
+    engine.extract_features('warm up')
+
+    direct = _run_clients(args.clients, args.requests, engine.extract_features)
+
+    batcher = MicroBatcher(
+        lambda texts: embed_batch(engine, texts),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+    batched = _run_clients(args.clients, args.requests, lambda text: batcher([text])[0])
+
+    print(f'{args.clients} clients, {args.requests} requests')
+    print(f'  one forward pass per request: {direct:10,.0f} req/s')
+    print(f'  micro-batched:                {batched:10,.0f} req/s '
+          f'(mean batch {batcher.stats()["mean_batch_size"]}, {batched / direct:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+Content-addressed on-disk embedding cache.
+
+Embeddings are keyed by (model id, SHA-256 of the normalised text). Each
+model gets a pair of append-only files under Constants.EMBEDDING_STORE_DIR:
+
+    <model>.f32    float32 vectors, one row per text, memory-mapped for reads
+    <model>.idx    fixed-size records (16-byte SHA-256 prefix, int64 row)
+
+A lookup is a dict probe plus a row view into the memory map - no copy and
+no model call. Appends take an exclusive flock, so every worker process on
+the host can share the files; other processes pick up new records by
+reading the index tail. When the vectors outgrow the disk budget the store
+is compacted down to its most recently used rows and the files are
+atomically replaced (readers still holding the old mapping keep working).
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from main.constants import Constants
+
+
+INDEX_DTYPE = np.dtype([('digest', 'S16'), ('row', '<i8')])
+
+# Compaction keeps this fraction of the budget, so it doesn't rerun on the next append
+COMPACT_TARGET = 0.75
+
+
+def normalise(text):
+    """Canonical form used for hashing: NFC, whitespace collapsed, trimmed"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def text_digest(text):
+    return hashlib.sha256(normalise(text).encode('utf-8')).digest()[:INDEX_DTYPE['digest'].itemsize]
+
+
+class EmbeddingStore:
+    """Append-only float32 vector store for one model"""
+
+    def __init__(self, root, model_id, disk_budget_bytes):
+        self.model_id = model_id
+        self.disk_budget_bytes = disk_budget_bytes
+        os.makedirs(root, exist_ok=True)
+        base = os.path.join(root, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_id))
+        self._vectors_path = base + '.f32'
+        self._index_path = base + '.idx'
+        self._meta_path = base + '.json'
+        self._lock_path = base + '.lock'
+        self._lock = threading.RLock()
+        self._holds_file_lock = False
+        self.hits = 0
+        self.misses = 0
+        self._reset()
+
+    def _reset(self):
+        self._rows = {}
+        self._last_used = {}
+        self._clock = 0
+        self._index_offset = 0
+        self._index_inode = None
+        self._vectors = None
+        self.dim = None
+
+    # -- file handling ----------------------------------------------------------
+
+    def _file_lock(self, operation=fcntl.LOCK_EX):
+        handle = open(self._lock_path, 'a')
+        fcntl.flock(handle, operation)
+        return handle
+
+    def _index_changed(self):
+        """Whether the index file was replaced (compacted) since it was last read"""
+        try:
+            return os.stat(self._index_path).st_ino != self._index_inode
+        except FileNotFoundError:
+            return False
+
+    def _refresh(self):
+        """Pick up records appended by other processes, or reload after compaction"""
+        try:
+            stat = os.stat(self._index_path)
+        except FileNotFoundError:
+            return
+        if self._index_inode is not None and stat.st_ino != self._index_inode:
+            self._reset()
+        self._index_inode = stat.st_ino
+        if self.dim is None:
+            with open(self._meta_path) as f:
+                self.dim = json.load(f)['dim']
+        if stat.st_size > self._index_offset:
+            count = (stat.st_size - self._index_offset) // INDEX_DTYPE.itemsize
+            records = np.fromfile(self._index_path, dtype=INDEX_DTYPE, count=count, offset=self._index_offset)
+            self._index_offset += count * INDEX_DTYPE.itemsize
+            for digest, row in zip(records['digest'].tolist(), records['row'].tolist()):
+                self._rows[digest] = row
+            self._vectors = None
+
+    def _matrix(self):
+        if self._vectors is None:
+            # Compaction swaps both files under the exclusive lock; the shared
+            # one keeps it from running between the inode check and the mapping.
+            handle = None if self._holds_file_lock else self._file_lock(fcntl.LOCK_SH)
+            try:
+                if self._index_changed():
+                    # Our rows number the old file; reload them for the new one
+                    self._reset()
+                    self._refresh()
+                rows = os.path.getsize(self._vectors_path) // (self.dim * 4)
+                self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+            finally:
+                if handle is not None:
+                    handle.close()
+        return self._vectors
+
+    # -- lookups ------------------------------------------------------------------
+
+    def get_many(self, texts):
+        """Return a list with a read-only vector view per cached text and None per miss"""
+        digests = [text_digest(text) for text in texts]
+        with self._lock:
+            if self._index_changed() or any(digest not in self._rows for digest in digests):
+                self._refresh()
+            results = []
+            for digest in digests:
+                row = self._rows.get(digest)
+                if row is not None:
+                    matrix = self._matrix()
+                    if row >= matrix.shape[0]:
+                        # Appended after the mapping was made
+                        self._vectors = None
+                        matrix = self._matrix()
+                    # Mapping may have reloaded the rows after a compaction
+                    row = self._rows.get(digest)
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self.hits += 1
+                self._clock += 1
+                self._last_used[digest] = self._clock
+                results.append(matrix[row])
+            return results
+
+    def get(self, text):
+        return self.get_many([text])[0]
+
+    # -- writes ---------------------------------------------------------------------
+
+    def put_many(self, texts, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(texts) != vectors.shape[0]:
+            raise ValueError('Expected one vector row per text')
+        with self._lock:
+            handle = self._file_lock()
+            self._holds_file_lock = True
+            try:
+                self._refresh()
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    self._write_meta()
+                elif vectors.shape[1] != self.dim:
+                    raise ValueError(f'Store for {self.model_id} holds {self.dim}-d vectors, got {vectors.shape[1]}-d')
+
+                new = {}
+                for text, vector in zip(texts, vectors):
+                    digest = text_digest(text)
+                    if digest not in self._rows and digest not in new:
+                        new[digest] = vector
+                if not new:
+                    return
+
+                with open(self._vectors_path, 'ab') as f:
+                    first_row = f.tell() // (self.dim * 4)
+                    f.write(np.stack(list(new.values())).tobytes())
+                records = np.empty(len(new), dtype=INDEX_DTYPE)
+                records['digest'] = list(new)
+                records['row'] = np.arange(first_row, first_row + len(new))
+                # Vectors are written before their index records, so a reader
+                # that sees a record always finds its row on disk.
+                with open(self._index_path, 'ab') as f:
+                    f.write(records.tobytes())
+                self._refresh()
+                for digest in new:
+                    self._clock += 1
+                    self._last_used[digest] = self._clock
+
+                if os.path.getsize(self._vectors_path) > self.disk_budget_bytes:
+                    self._compact()
+            finally:
+                self._holds_file_lock = False
+                handle.close()
+
+    def _write_meta(self):
+        tmp = self._meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'model_id': self.model_id, 'dim': self.dim}, f)
+        os.replace(tmp, self._meta_path)
+
+    def _compact(self):
+        """Rewrite the store keeping the most recently used rows; caller holds the file lock"""
+        keep_rows = int(self.disk_budget_bytes * COMPACT_TARGET) // (self.dim * 4)
+        # Rows this process never touched rank by age: a higher row was appended later
+        ranked = sorted(
+            self._rows.items(),
+            key=lambda item: (self._last_used.get(item[0], 0), item[1]),
+            reverse=True,
+        )[:keep_rows]
+        ranked.sort(key=lambda item: item[1])
+
+        matrix = self._matrix()
+        records = np.empty(len(ranked), dtype=INDEX_DTYPE)
+        records['digest'] = [digest for digest, _ in ranked]
+        records['row'] = np.arange(len(ranked))
+        with open(self._vectors_path + '.tmp', 'wb') as f:
+            for start in range(0, len(ranked), 4096):
+                chunk = [row for _, row in ranked[start:start + 4096]]
+                f.write(np.ascontiguousarray(matrix[chunk]).tobytes())
+        records.tofile(self._index_path + '.tmp')
+        os.replace(self._vectors_path + '.tmp', self._vectors_path)
+        os.replace(self._index_path + '.tmp', self._index_path)
+
+        last_used = {digest: self._last_used[digest] for digest, _ in ranked if digest in self._last_used}
+        self._reset()
+        self._refresh()
+        self._last_used = last_used
+        self._clock = max(last_used.values(), default=0)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'model_id': self.model_id,
+                'entries': len(self._rows),
+                'dim': self.dim,
+                'bytes': os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0,
+                'budget_bytes': self.disk_budget_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(model_id):
+    with _stores_lock:
+        store = _stores.get(model_id)
+        if store is None:
+            store = _stores[model_id] = EmbeddingStore(
+                Constants.EMBEDDING_STORE_DIR, model_id, Constants.EMBEDDING_STORE_BUDGET_BYTES
+            )
+        return store
+
+
+def cached_embeddings(model_id, texts, embed):
+    """
+    Embeddings for texts as a float32 array, computing only the texts the
+    store doesn't hold with embed(list_of_texts) and storing the results.
+    """
+    store = get_store(model_id)
+    cached = store.get_many(texts)
+    missing = {}
+    for i, vector in enumerate(cached):
+        if vector is None:
+            missing.setdefault(normalise(texts[i]), []).append(i)
+    if missing:
+        # Each distinct text goes to the model once, however often it repeats
+        pending = [texts[positions[0]] for positions in missing.values()]
+        computed = np.asarray(embed(pending), dtype=np.float32)
+        store.put_many(pending, computed)
+        for positions, vector in zip(missing.values(), computed):
+            for i in positions:
+                cached[i] = vector
+    return np.stack(cached) if cached else np.empty((0, store.dim or 0), dtype=np.float32)
+
+
+def store_stats():
+    return {model_id: store.stats() for model_id, store in _stores.items()}
@@ -0,0 +1,123 @@
+"""
+Response encodings for embedding arrays.
+
+JSON float lists are several times larger than the vectors themselves and
+slow to produce and parse, so embedding endpoints negotiate a format:
+
+    ?format=   Accept                    body
+    json       application/json          {"embedding": [[...]]} (default)
+    npy        application/x-npy         .npy file (np.load-able)
+    base64     -                         JSON with little-endian float32 bytes, base64-encoded
+    base64-f16 -                         as base64, but float16 (half the size, ~3 digits)
+    msgpack    application/x-msgpack     MessagePack map with raw float32 bytes (needs msgpack)
+
+The binary forms are written straight from the array's buffer. Encoded
+arrays are described as {"dtype": ..., "shape": [...], "data": ...}.
+Companion arrays (e.g. the CSV row each embedding came from) are encoded
+the same way in their own dtype next to the main one; npy carries only
+the main array.
+"""
+import base64
+import io
+
+import numpy as np
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+FORMATS = ('json', 'npy', 'base64', 'base64-f16', 'msgpack')
+
+ACCEPT_FORMATS = {
+    'application/x-npy': 'npy',
+    'application/x-msgpack': 'msgpack',
+    'application/msgpack': 'msgpack',
+    'application/json': 'json',
+}
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+def negotiate(request):
+    """Response format from ?format= (or a POSTed 'format'), then the Accept header"""
+    requested = request.GET.get('format') or request.POST.get('format')
+    if requested:
+        if requested not in FORMATS:
+            raise UnsupportedFormat(requested)
+        return requested
+    for media_type in request.headers.get('Accept', '').split(','):
+        fmt = ACCEPT_FORMATS.get(media_type.split(';')[0].strip())
+        if fmt is not None:
+            return fmt
+    return 'json'
+
+
+def as_array(value):
+    """float32 ndarray from engine output: ndarrays, torch tensors, scipy sparse matrices or lists"""
+    if hasattr(value, 'toarray'):
+        value = value.toarray()
+    elif hasattr(value, 'detach'):
+        value = value.detach().cpu().numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+def _packed(array, dtype):
+    data = np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': data.dtype.name, 'shape': list(data.shape), 'data': data}
+
+
+def npy_bytes(array):
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, np.ascontiguousarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _b64(packed):
+    packed['data'] = base64.b64encode(packed['data'].data).decode('ascii')
+    return packed
+
+
+def _raw(packed):
+    packed['data'] = packed['data'].data
+    return packed
+
+
+def encode_array(request, key, value, extra=None, fmt=None, arrays=None):
+    """
+    HttpResponse carrying value under key in the negotiated format; extra
+    JSON-serialisable fields are included where the format has room for them.
+    arrays maps further keys to companion ndarrays, sent in their own dtype.
+    """
+    fmt = fmt or negotiate(request)
+    array = as_array(value)
+    extra = extra or {}
+    arrays = {name: np.asarray(companion) for name, companion in (arrays or {}).items()}
+
+    if fmt == 'npy':
+        response = HttpResponse(npy_bytes(array), content_type='application/x-npy')
+    elif fmt in ('base64', 'base64-f16'):
+        packed = _b64(_packed(array, np.float16 if fmt == 'base64-f16' else np.float32))
+        companions = {name: _b64(_packed(companion, companion.dtype)) for name, companion in arrays.items()}
+        response = JsonResponse({key: packed, **companions, **extra})
+    elif fmt == 'msgpack':
+        if msgpack is None:
+            raise UnsupportedFormat('msgpack (the msgpack package is not installed)')
+        packed = _raw(_packed(array, np.float32))
+        companions = {name: _raw(_packed(companion, companion.dtype)) for name, companion in arrays.items()}
+        response = HttpResponse(msgpack.packb({key: packed, **companions, **extra}), content_type='application/x-msgpack')
+    else:
+        # ndarray.tolist() converts in C; no per-element Python work
+        companions = {name: companion.tolist() for name, companion in arrays.items()}
+        response = JsonResponse({key: array.tolist(), **companions, **extra})
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def unsupported_format_response(exc):
+    return JsonResponse({"error": f"unsupported format: {exc}", "formats": list(FORMATS)}, status=406)
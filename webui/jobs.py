@@ -0,0 +1,245 @@
+"""
+Background jobs for webui requests too long to run inside the request.
+
+A job is a function run on a worker thread; the request gets the job id
+back at once and polls job_status for progress and the result. Job state
+lives in a SQLite table (WAL mode, no broker), so any worker process can
+report on any job, while the job itself runs in the process that queued
+it. Each job type has its own bounded pool, so e.g. a long training run
+can't starve model loads.
+
+Jobs left queued or running by a process that has since died are marked
+failed the first time the runner is used.
+
+Each job gets its own output directory under Constants.WEBUI_DATA_DIR/jobs
+for the files it produces.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from main.constants import Constants
+
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.path.join(Constants.WEBUI_DATA_DIR, 'jobs')
+JOBS_DATABASE = os.path.join(Constants.WEBUI_DATA_DIR, 'webui_jobs.sqlite3')
+
+# Concurrent jobs per type; anything else gets DEFAULT_CONCURRENCY
+JOB_CONCURRENCY = {
+    'train': 1,
+    'load_model': 1,
+    'score_matrix': 1,
+    'csv_feature_extraction': 2,
+}
+DEFAULT_CONCURRENCY = 1
+
+# Finished jobs are forgotten after this long
+JOB_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+# Progress is written at most this often per job
+PROGRESS_INTERVAL = 0.5
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """Handle passed to a running job function"""
+
+    def __init__(self, runner, job_id, job_type):
+        self.id = job_id
+        self.type = job_type
+        self.output_dir = os.path.join(JOBS_DIR, job_id)
+        self._runner = runner
+        self._last_progress = 0.0
+
+    def progress(self, done, total=None):
+        """Report progress; raises JobCancelled once cancellation was requested"""
+        now = time.monotonic()
+        if now - self._last_progress >= PROGRESS_INTERVAL or done == total:
+            self._last_progress = now
+            self._runner._update_progress(self.id, done, total)
+        if self.cancelled():
+            raise JobCancelled(self.id)
+
+    def cancelled(self):
+        return self._runner._cancel_requested(self.id)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobRunner:
+    def __init__(self, database=JOBS_DATABASE, concurrency=None):
+        self.database = database
+        self.concurrency = dict(JOB_CONCURRENCY, **(concurrency or {}))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executors = {}
+        self._pid = None
+
+    # -- storage ----------------------------------------------------------------
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.database), exist_ok=True)
+            connection = sqlite3.connect(self.database, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY, type TEXT NOT NULL, status TEXT NOT NULL,'
+                ' done INTEGER NOT NULL DEFAULT 0, total INTEGER, result TEXT, error TEXT,'
+                ' cancel_requested INTEGER NOT NULL DEFAULT 0, pid INTEGER,'
+                ' created_at REAL NOT NULL, started_at REAL, finished_at REAL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _ensure_started(self):
+        """Per-process setup: fresh executors, and fail jobs orphaned by dead processes"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Executors (and their threads) don't survive a fork
+            self._executors = {}
+            connection = self._connection()
+            rows = connection.execute(
+                'SELECT id, pid FROM jobs WHERE status IN (?, ?)', (QUEUED, RUNNING)
+            ).fetchall()
+            orphaned = [row['id'] for row in rows if row['pid'] is None or not _pid_alive(row['pid'])]
+            for job_id in orphaned:
+                connection.execute(
+                    'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)',
+                    (FAILED, 'Worker process exited before the job finished', time.time(), job_id, QUEUED, RUNNING),
+                )
+            if orphaned:
+                logger.warning('Marked %d orphaned jobs as failed', len(orphaned))
+            connection.execute(
+                'DELETE FROM jobs WHERE finished_at < ?', (time.time() - JOB_RETENTION_SECONDS,)
+            )
+
+    def _executor(self, job_type):
+        with self._lock:
+            executor = self._executors.get(job_type)
+            if executor is None:
+                executor = self._executors[job_type] = ThreadPoolExecutor(
+                    max_workers=self.concurrency.get(job_type, DEFAULT_CONCURRENCY),
+                    thread_name_prefix=f'webui-job-{job_type}',
+                )
+            return executor
+
+    def _update_progress(self, job_id, done, total):
+        self._connection().execute(
+            'UPDATE jobs SET done = ?, total = COALESCE(?, total) WHERE id = ?', (done, total, job_id)
+        )
+
+    def _cancel_requested(self, job_id):
+        row = self._connection().execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self._connection().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+        )
+
+    # -- API -------------------------------------------------------------------------
+
+    def submit(self, job_type, func, *args, **kwargs):
+        """Queue func(job, *args, **kwargs) and return its Job; func's return value must be JSON-serialisable"""
+        self._ensure_started()
+        job = Job(self, uuid.uuid4().hex, job_type)
+        self._connection().execute(
+            'INSERT INTO jobs (id, type, status, pid, created_at) VALUES (?, ?, ?, ?, ?)',
+            (job.id, job_type, QUEUED, os.getpid(), time.time()),
+        )
+        self._executor(job_type).submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        connection = self._connection()
+        started = connection.execute(
+            'UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ? AND cancel_requested = 0',
+            (RUNNING, time.time(), job.id, QUEUED),
+        ).rowcount
+        if not started:
+            # Cancelled while queued
+            self._finish(job.id, CANCELLED)
+            return
+        try:
+            os.makedirs(job.output_dir, exist_ok=True)
+            result = func(job, *args, **kwargs)
+        except JobCancelled:
+            self._finish(job.id, CANCELLED)
+        except Exception as exc:
+            logger.exception('Job %s (%s) failed', job.id, job.type)
+            self._finish(job.id, FAILED, error=f'{type(exc).__name__}: {exc}')
+        else:
+            self._finish(job.id, SUCCEEDED, result=result)
+
+    def get(self, job_id):
+        """Job state as a dict, or None for an unknown id"""
+        self._ensure_started()
+        row = self._connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'type': row['type'],
+            'status': row['status'],
+            'progress': {'done': row['done'], 'total': row['total']},
+            'cancel_requested': bool(row['cancel_requested']),
+            'error': row['error'],
+            'output_dir': os.path.join(JOBS_DIR, row['id']),
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+        }
+
+    def result(self, job_id):
+        """The finished job's return value; None if it hasn't succeeded"""
+        row = self._connection().execute(
+            'SELECT result FROM jobs WHERE id = ? AND status = ?', (job_id, SUCCEEDED)
+        ).fetchone()
+        return json.loads(row['result']) if row is not None and row['result'] is not None else None
+
+    def cancel(self, job_id):
+        """
+        Request cancellation. Queued jobs never start; running jobs stop at
+        their next progress report. Returns False if the job already finished.
+        """
+        return bool(self._connection().execute(
+            f'UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status NOT IN ({", ".join("?" * len(FINISHED))})',
+            (job_id, *FINISHED),
+        ).rowcount)
+
+
+jobs = JobRunner()
@@ -0,0 +1,166 @@
+"""
+Streaming CSV feature extraction.
+
+The CSV is read twice, row by row: once to count the non-empty cells of
+the column, then in fixed-size chunks that are embedded and written into a
+preallocated float32 .npy memmap. Peak memory is one chunk of texts and
+vectors whatever the file size.
+
+Each run writes to a directory derived from (model, CSV, column):
+
+    embeddings.npy   float32 (rows, dim)
+    row_ids.npy      int64 (rows,), the CSV data row each vector came from
+    progress.json    checkpoint, rewritten atomically after every chunk
+
+The checkpoint is only written after the chunk's vectors are flushed, so
+after a crash the same request resumes from the last completed chunk. A
+changed CSV (size or mtime) starts over. Runs for the same directory, from
+concurrent jobs or other processes, take turns on an exclusive lock on its
+.lock file; the later one then finds the work done or resumes it.
+"""
+import csv
+import fcntl
+import hashlib
+import json
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from main.constants import Constants
+
+from .batching import embed_texts, embedding_model_id
+from .registry import registry
+
+
+FEATURES_DIR = os.path.join(Constants.WEBUI_DATA_DIR, 'features')
+
+DEFAULT_CHUNK_ROWS = 1024
+
+LOCK_NAME = '.lock'
+
+
+def _iter_column(csv_path, column):
+    """Yield (data_row, text) for every non-empty cell of column"""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if column not in header:
+            raise ValueError(f'Column {column!r} not found in {csv_path}')
+        position = header.index(column)
+        for data_row, record in enumerate(reader):
+            if position < len(record) and record[position].strip():
+                yield data_row, record[position]
+
+
+def output_dir_for(engine_name, csv_path, column):
+    engine = registry.get(engine_name, load=False)
+    model_id = embedding_model_id(engine_name, engine) if engine is not None else engine_name
+    key = json.dumps([model_id, os.path.abspath(csv_path), column])
+    return os.path.join(FEATURES_DIR, hashlib.sha256(key.encode('utf-8')).hexdigest()[:24])
+
+
+def _fingerprint(csv_path, column):
+    stat = os.stat(csv_path)
+    return {'csv_path': os.path.abspath(csv_path), 'column': column, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(path, checkpoint):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def extract_csv_features(engine_name, csv_path, column, output_dir, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None):
+    """
+    Embed every non-empty cell of column into output_dir, resuming from its
+    checkpoint if there is a matching one. progress(done, total) is called
+    after each chunk. Returns the final checkpoint.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, LOCK_NAME), 'a') as lock:
+        # One run per directory at a time; they share the memmaps and the checkpoint
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return _extract(engine_name, csv_path, column, output_dir, chunk_rows, progress)
+
+
+def _extract(engine_name, csv_path, column, output_dir, chunk_rows, progress):
+    checkpoint_path = os.path.join(output_dir, 'progress.json')
+    embeddings_path = os.path.join(output_dir, 'embeddings.npy')
+    row_ids_path = os.path.join(output_dir, 'row_ids.npy')
+
+    fingerprint = _fingerprint(csv_path, column)
+    checkpoint = _read_checkpoint(checkpoint_path)
+    resumable = (
+        checkpoint is not None and checkpoint['source'] == fingerprint
+        and (not checkpoint['done'] or os.path.exists(embeddings_path) and os.path.exists(row_ids_path))
+    )
+    if not resumable:
+        total = sum(1 for _ in _iter_column(csv_path, column))
+        checkpoint = {'source': fingerprint, 'total': total, 'done': 0, 'dim': None, 'complete': False}
+    elif checkpoint['complete']:
+        if progress is not None:
+            progress(checkpoint['done'], checkpoint['total'])
+        return checkpoint
+
+    total = checkpoint['total']
+    embeddings = row_ids = None
+    if checkpoint['done']:
+        embeddings = open_memmap(embeddings_path, mode='r+')
+        row_ids = open_memmap(row_ids_path, mode='r+')
+
+    def write_chunk(rows, texts):
+        nonlocal embeddings, row_ids
+        vectors = embed_texts(engine_name, texts)
+        if embeddings is None:
+            checkpoint['dim'] = int(vectors.shape[1])
+            embeddings = open_memmap(embeddings_path, mode='w+', dtype=np.float32, shape=(total, vectors.shape[1]))
+            row_ids = open_memmap(row_ids_path, mode='w+', dtype=np.int64, shape=(total,))
+        start = checkpoint['done']
+        embeddings[start:start + len(texts)] = vectors
+        row_ids[start:start + len(texts)] = rows
+        embeddings.flush()
+        row_ids.flush()
+        checkpoint['done'] = start + len(texts)
+        _write_checkpoint(checkpoint_path, checkpoint)
+        if progress is not None:
+            progress(checkpoint['done'], total)
+
+    rows, texts = [], []
+    for index, (data_row, text) in enumerate(_iter_column(csv_path, column)):
+        if index < checkpoint['done']:
+            continue
+        rows.append(data_row)
+        texts.append(text)
+        if len(texts) == chunk_rows:
+            write_chunk(rows, texts)
+            rows, texts = [], []
+    if texts:
+        write_chunk(rows, texts)
+    if embeddings is None:
+        # Nothing to embed; still leave loadable (empty) outputs
+        open_memmap(embeddings_path, mode='w+', dtype=np.float32, shape=(0, 0))
+        open_memmap(row_ids_path, mode='w+', dtype=np.int64, shape=(0,))
+
+    checkpoint['complete'] = True
+    _write_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+def load_features(output_dir):
+    """Read-only memmaps of a finished extraction's embeddings and row ids"""
+    return (
+        np.load(os.path.join(output_dir, 'embeddings.npy'), mmap_mode='r'),
+        np.load(os.path.join(output_dir, 'row_ids.npy'), mmap_mode='r'),
+    )
@@ -0,0 +1,215 @@
+"""
+Process-wide registry of webui model engines.
+
+Engines are expensive to build (model weights, tokenizers), so each one is
+loaded once per process and shared by every request thread. Loading is
+explicit - load()/unload()/configure() - or lazy on first get(), and is
+serialised per engine so concurrent first requests don't load twice.
+
+Preloading before the server forks lets workers share the weights
+copy-on-write instead of loading a private copy each:
+
+    WEBUI_PRELOAD_ENGINES=content,large_feature_extraction \
+        gunicorn --preload main.wsgi
+
+main.wsgi calls preload_configured() at import time, which with --preload
+runs once in the gunicorn master before the workers are forked.
+"""
+import gc
+import logging
+import os
+import threading
+import time
+
+from main.constants import Constants
+
+
+logger = logging.getLogger(__name__)
+
+
+def _rss_bytes():
+    """Resident set size of this process, or None where it can't be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class EngineEntry:
+    """A loaded engine and its load statistics"""
+
+    def __init__(self, engine, load_seconds, rss_delta, version):
+        self.engine = engine
+        self.load_seconds = load_seconds
+        self.rss_delta = rss_delta
+        self.loaded_at = time.time()
+        self.version = version
+        self.pid = os.getpid()
+
+    def stats(self):
+        return {
+            'loaded': True,
+            'engine': type(self.engine).__name__,
+            'model': getattr(self.engine, 'model_name', None),
+            'version': self.version,
+            'load_seconds': round(self.load_seconds, 3),
+            'rss_delta_bytes': self.rss_delta,
+            'loaded_at': self.loaded_at,
+            # Loaded in another process and inherited through fork
+            'preloaded': self.pid != os.getpid(),
+        }
+
+
+class EngineRegistry:
+    """Thread-safe name -> engine registry with explicit load/unload"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._factories = {}
+        self._warmups = {}
+        self._entries = {}
+        self._engine_locks = {}
+        self._versions = {}
+
+    def register(self, name, factory, warmup=None):
+        """Register a factory building the engine; warmup(engine) runs after each load"""
+        with self._lock:
+            self._factories[name] = factory
+            self._warmups[name] = warmup
+            self._engine_locks.setdefault(name, threading.RLock())
+
+    def names(self):
+        return list(self._factories)
+
+    def _engine_lock(self, name):
+        if name not in self._factories:
+            raise KeyError(f'Unknown engine: {name}')
+        return self._engine_locks[name]
+
+    def _next_version(self, name):
+        self._versions[name] = self._versions.get(name, 0) + 1
+        return self._versions[name]
+
+    def _measure(self, name, func):
+        """
+        Run func() under the engine lock, recording time and RSS growth, then
+        swap the result in. Until then get() returns the engine loaded
+        before, and it stays loaded if func() or the warmup raises.
+        """
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        engine = func()
+        warmup = self._warmups.get(name)
+        if warmup is not None:
+            warmup(engine)
+        elapsed = time.perf_counter() - start
+        rss_after = _rss_bytes()
+        rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        with self._lock:
+            self._entries[name] = EngineEntry(engine, elapsed, rss_delta, self._next_version(name))
+        logger.info('Loaded engine %s in %.2fs (RSS %+d bytes)', name, elapsed, rss_delta or 0)
+        return engine
+
+    def load(self, name, *args, **kwargs):
+        """Build the engine with the given factory arguments, replacing any loaded one"""
+        with self._engine_lock(name):
+            return self._measure(name, lambda: self._factories[name](*args, **kwargs))
+
+    def get(self, name, load=True):
+        """Return the loaded engine, loading it with default arguments if needed"""
+        entry = self._entries.get(name)
+        if entry is not None:
+            return entry.engine
+        if not load:
+            return None
+        with self._engine_lock(name):
+            entry = self._entries.get(name)
+            if entry is not None:
+                return entry.engine
+            return self._measure(name, self._factories[name])
+
+    def configure(self, name, func):
+        """
+        Run func(engine) under the engine's lock, e.g. to swap the model an
+        engine serves. Counts as a load for stats and bumps the version.
+        """
+        with self._engine_lock(name):
+            engine = self.get(name)
+            self._measure(name, lambda: func(engine) or engine)
+            return engine
+
+    def unload(self, name):
+        """Drop the engine so its memory can be reclaimed; returns whether one was loaded"""
+        with self._engine_lock(name):
+            with self._lock:
+                entry = self._entries.pop(name, None)
+            if entry is None:
+                return False
+            self._next_version(name)
+        gc.collect()
+        return True
+
+    def is_loaded(self, name):
+        return name in self._entries
+
+    def version(self, name):
+        """Increases every time the engine is loaded, reconfigured or unloaded"""
+        return self._versions.get(name, 0)
+
+    def bump_version(self, name):
+        """Mark the engine's model as changed, e.g. after training"""
+        with self._engine_lock(name):
+            return self._next_version(name)
+
+    def preload(self, names):
+        """Load the given engines now, e.g. before the server forks"""
+        for name in names:
+            self.get(name)
+        # Move everything allocated so far out of the collector's reach, so
+        # GC passes in the forked workers don't touch (and copy) those pages.
+        gc.freeze()
+        return self.stats()
+
+    def stats(self):
+        result = {}
+        for name in self._factories:
+            entry = self._entries.get(name)
+            result[name] = entry.stats() if entry is not None else {'loaded': False, 'version': self.version(name)}
+        return result
+
+
+def _content_engine():
+    from main.engines import ContentEngine
+    return ContentEngine()
+
+
+def _large_feature_extraction_engine(model_name=None):
+    from main.engines import LargeFeatureExtractionEngine
+    if model_name:
+        return LargeFeatureExtractionEngine(model_name)
+    return LargeFeatureExtractionEngine()
+
+
+def _gguf_engine():
+    from main.engines import GGUFContentEngine
+    return GGUFContentEngine()
+
+
+def _warm_feature_extraction(engine):
+    # First forward pass initialises lazy kernels and allocator pools
+    engine.extract_features('warm up')
+
+
+registry = EngineRegistry()
+registry.register('content', _content_engine)
+registry.register('large_feature_extraction', _large_feature_extraction_engine, warmup=_warm_feature_extraction)
+registry.register('gguf', _gguf_engine)
+
+
+def preload_configured():
+    """Preload the engines listed in Constants.WEBUI_PRELOAD_ENGINES"""
+    names = [name.strip() for name in Constants.WEBUI_PRELOAD_ENGINES if name.strip()]
+    if names:
+        return registry.preload(names)
+    return {}
@@ -0,0 +1,100 @@
+"""
+In-process TTL + LRU cache for engine results.
+
+predict() answers come from the content engine's trained model, so they
+only change when it is retrained. Results are cached per process keyed by
+(model version, item, num); the model version lives in the shared Django
+cache and is bumped when training finishes, so every worker process stops
+using its old entries at once and they age out through LRU eviction.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from main.constants import Constants
+from main.versions import bump_version, get_version
+
+
+MODEL_VERSION_KEY = 'webui:model_version:%s'
+
+
+def model_version(engine_name):
+    """Shared version of an engine's trained model, consistent across processes"""
+    return get_version(MODEL_VERSION_KEY % engine_name)
+
+
+def bump_model_version(engine_name):
+    return bump_version(MODEL_VERSION_KEY % engine_name)
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe mapping with a per-entry time to live and LRU eviction beyond max_entries"""
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+            }
+
+
+predict_cache = TTLCache(
+    max_entries=Constants.PREDICT_CACHE_MAX_ENTRIES,
+    ttl=Constants.PREDICT_CACHE_TTL,
+)
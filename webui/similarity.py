@@ -0,0 +1,153 @@
+"""
+Memory-bounded cosine similarity matrices.
+
+A full N x N score matrix doesn't fit in memory (or a JSON response) for
+large N, so it is computed from L2-normalised rows in strips sized to a
+memory ceiling and each strip is appended to an .npy file. Peak memory is
+the embeddings plus roughly that ceiling whatever N is.
+
+With top_k only the k best matches per row are kept: each row block keeps
+a running (block, k) candidate set which is merged with every column tile
+using argpartition, and the result is written as a pair of .npy files.
+Inputs with fewer than two rows produce correctly shaped empty outputs.
+"""
+import math
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+DEFAULT_MEMORY_LIMIT_BYTES = 256 * 1024 ** 2
+
+
+def normalise_rows(embeddings, block_rows=8192):
+    """L2-normalised float32 copy of embeddings, built a block at a time"""
+    embeddings = np.asarray(embeddings)
+    if embeddings.ndim == 1 and embeddings.size == 0:
+        # An empty feature file has no dimension to report
+        embeddings = embeddings.reshape(0, 0)
+    result = np.empty(embeddings.shape, dtype=np.float32)
+    for start in range(0, embeddings.shape[0], block_rows):
+        block = np.asarray(embeddings[start:start + block_rows], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        np.divide(block, norms, out=result[start:start + block_rows], where=norms > 0)
+        result[start:start + block_rows][(norms == 0).ravel()] = 0
+    return result
+
+
+def cosine_similarity(a, b):
+    """Cosine of the angle between two vectors; 0.0 when either is all zeros"""
+    a = np.asarray(a, dtype=np.float32).ravel()
+    b = np.asarray(b, dtype=np.float32).ravel()
+    norms = float(np.linalg.norm(a)) * float(np.linalg.norm(b))
+    return float(np.dot(a, b)) / norms if norms else 0.0
+
+
+def block_size(n, dim, memory_limit_bytes, top_k=None):
+    """
+    Largest tile edge b whose working set fits the memory ceiling: the b x b
+    score tile (plus the b x (b + k) candidate scores and indices when
+    merging top-k) and the two b x dim operand blocks.
+    """
+    k = top_k or 0
+    # Bytes per b^2 and per b terms
+    quadratic = 4 + (12 if top_k else 0)
+    linear = 4 * 2 * dim + (12 * k if top_k else 0)
+    b = (-linear + math.sqrt(linear * linear + 4 * quadratic * memory_limit_bytes)) / (2 * quadratic)
+    return max(1, min(n, int(b)))
+
+
+def score_matrix(embeddings, output_path, memory_limit_bytes=DEFAULT_MEMORY_LIMIT_BYTES, progress=None):
+    """
+    Write the N x N cosine similarity matrix of embeddings to output_path as
+    float32 .npy. progress(done_rows, total_rows) is called after each strip.
+    """
+    vectors = normalise_rows(embeddings)
+    n, dim = vectors.shape
+    if n == 0:
+        np.save(output_path, np.empty((0, 0), dtype=np.float32))
+        return {'path': output_path, 'shape': [0, 0], 'strip_rows': 0}
+    # Rows are computed a full-width strip at a time and appended to the
+    # file, so the output never has to be resident (or dirty) in memory.
+    strip_rows = max(1, min(n, memory_limit_bytes // (4 * (n + dim))))
+    header = open_memmap(output_path, mode='w+', dtype=np.float32, shape=(n, n))
+    offset = header.offset
+    del header
+    strip = np.empty((strip_rows, n), dtype=np.float32)
+    with open(output_path, 'r+b') as f:
+        f.seek(offset)
+        for row in range(0, n, strip_rows):
+            rows = vectors[row:row + strip_rows]
+            out = strip[:rows.shape[0]]
+            np.matmul(rows, vectors.T, out=out)
+            out.tofile(f)
+            if progress is not None:
+                progress(row + rows.shape[0], n)
+    return {'path': output_path, 'shape': [n, n], 'strip_rows': strip_rows}
+
+
+def top_k_matrix(embeddings, output_prefix, top_k, memory_limit_bytes=DEFAULT_MEMORY_LIMIT_BYTES,
+                 exclude_self=True, progress=None):
+    """
+    Write the top_k most similar rows for every row as two .npy files:
+    <output_prefix>.indices.npy (int64, N x k) and <output_prefix>.scores.npy
+    (float32, N x k), best match first.
+    """
+    vectors = normalise_rows(embeddings)
+    n, dim = vectors.shape
+    if top_k < 1:
+        raise ValueError('top_k must be at least 1')
+    k = max(0, min(top_k, n - 1 if exclude_self else n))
+    indices_path = f'{output_prefix}.indices.npy'
+    scores_path = f'{output_prefix}.scores.npy'
+    if k == 0:
+        # No row has a candidate: a single row (or none) matches nothing but itself
+        np.save(indices_path, np.empty((n, 0), dtype=np.int64))
+        np.save(scores_path, np.empty((n, 0), dtype=np.float32))
+        if progress is not None:
+            progress(n, n)
+        return {'indices_path': indices_path, 'scores_path': scores_path, 'shape': [n, 0], 'block_size': 0}
+    b = block_size(n, dim, memory_limit_bytes, top_k=k)
+    indices = open_memmap(indices_path, mode='w+', dtype=np.int64, shape=(n, k))
+    scores = open_memmap(scores_path, mode='w+', dtype=np.float32, shape=(n, k))
+
+    for row in range(0, n, b):
+        rows = vectors[row:row + b]
+        height = rows.shape[0]
+        best_scores = np.full((height, k), -np.inf, dtype=np.float32)
+        best_indices = np.zeros((height, k), dtype=np.int64)
+        for col in range(0, n, b):
+            tile = rows @ vectors[col:col + b].T
+            if exclude_self and col < row + height and row < col + tile.shape[1]:
+                # Mask the diagonal where the tile overlaps it
+                own = np.arange(max(row, col), min(row + height, col + tile.shape[1]))
+                tile[own - row, own - col] = -np.inf
+            candidate_scores = np.concatenate([best_scores, tile], axis=1)
+            candidate_indices = np.concatenate(
+                [best_indices, np.broadcast_to(np.arange(col, col + tile.shape[1]), tile.shape)], axis=1
+            )
+            keep = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(candidate_scores, keep, axis=1)
+            best_indices = np.take_along_axis(candidate_indices, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        scores[row:row + height] = np.take_along_axis(best_scores, order, axis=1)
+        indices[row:row + height] = np.take_along_axis(best_indices, order, axis=1)
+        if progress is not None:
+            progress(min(row + b, n), n)
+
+    indices.flush()
+    scores.flush()
+    del indices, scores
+    return {'indices_path': indices_path, 'scores_path': scores_path, 'shape': [n, k], 'block_size': b}
+
+
+def write_score_matrix(embeddings, output_dir, top_k=None, memory_limit_bytes=DEFAULT_MEMORY_LIMIT_BYTES,
+                       progress=None):
+    """Full matrix, or the top-k sparse form when top_k is given, under output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    if top_k:
+        return top_k_matrix(embeddings, os.path.join(output_dir, 'score_matrix'), top_k,
+                            memory_limit_bytes=memory_limit_bytes, progress=progress)
+    return score_matrix(embeddings, os.path.join(output_dir, 'score_matrix.npy'),
+                        memory_limit_bytes=memory_limit_bytes, progress=progress)
@@ -1,15 +1,26 @@
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import FileResponse, JsonResponse, HttpResponseForbidden
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from main.constants import settings
 from functools import wraps
 from django.shortcuts import render, redirect
 from django.contrib import messages
-# from main.engines import ContentEngine, GGUFContentEngine, LLMContentEngine, LargeFeatureExtractionEngine
+from django.utils.cache import patch_vary_headers
+import json
+import os
+import numpy as np
+from .batching import embed_texts, batcher_stats
+from .embedding_store import store_stats
+from .encoding import UnsupportedFormat, encode_array, negotiate, unsupported_format_response
+from .jobs import jobs
+from .pipeline import DEFAULT_CHUNK_ROWS, extract_csv_features, load_features, output_dir_for
+from .registry import registry
+from .result_cache import bump_model_version, model_version, predict_cache
+from .similarity import DEFAULT_MEMORY_LIMIT_BYTES, cosine_similarity, write_score_matrix
+
+# Upper bound on texts accepted by the batch endpoints
+MAX_BATCH_TEXTS = 256
 
-content_engine = None
-large_feature_extraction_engine = None
-GGUF_content_engine = None
 
 def token_auth(view_func):
     @wraps(view_func)
@@ -19,6 +30,103 @@ def token_auth(view_func):
         return view_func(request, *args, **kwargs)
     return _wrapped_view
 
+def _array_response(request, key, value, extra=None, arrays=None):
+    """Encode an embedding array in the format the client negotiated (see webui.encoding)"""
+    try:
+        return encode_array(request, key, value, extra, arrays=arrays)
+    except UnsupportedFormat as exc:
+        return unsupported_format_response(exc)
+
+def _train_job(job, data_url):
+    registry.get('content').train(data_url)
+    registry.bump_version('content')
+    # Cached predictions of every process belong to the old model now
+    bump_model_version('content')
+    return {"trained": True, "version": registry.version('content')}
+
+def _load_model_job(job, engine_name, model_name):
+    registry.load(engine_name, model_name)
+    return {"loaded_model": model_name, "version": registry.version(engine_name)}
+
+def _configure_gguf_job(job, kind, model_name, filename):
+    def configure(engine):
+        if kind == 'chat':
+            engine.set_chat_model(model_name, filename)
+        else:
+            engine.set_embedding_model(model_name, filename)
+            # Names the model for the embedding store
+            engine.embedding_model_name = f'{model_name}/{filename}'
+    registry.configure('gguf', configure)
+    return {"loaded_model": model_name, "filename": filename, "version": registry.version('gguf')}
+
+def _csv_features_job(job, engine_name, csv_path, sentence_col, output_dir, chunk_rows):
+    checkpoint = extract_csv_features(engine_name, csv_path, sentence_col, output_dir,
+                                      chunk_rows=chunk_rows, progress=job.progress)
+    return {
+        'embeddings_path': os.path.join(output_dir, 'embeddings.npy'),
+        'row_ids_path': os.path.join(output_dir, 'row_ids.npy'),
+        'shape': [checkpoint['done'], checkpoint['dim'] or 0],
+    }
+
+def _start_csv_features_job(request, engine_name, csv_path, sentence_col):
+    """
+    Queue a streaming CSV extraction. Repeating the request for the same
+    model, file and column resumes an interrupted run from its checkpoint.
+    """
+    if not csv_path or not os.path.isfile(csv_path):
+        return JsonResponse({"error": "csv-path must be an existing file"}, status=400)
+    try:
+        chunk_rows = int(request.POST.get('chunk-size') or DEFAULT_CHUNK_ROWS)
+    except ValueError:
+        return JsonResponse({"error": "chunk-size must be an integer"}, status=400)
+    output_dir = output_dir_for(engine_name, csv_path, sentence_col)
+    job = jobs.submit('csv_feature_extraction', _csv_features_job, engine_name, csv_path, sentence_col,
+                      output_dir, max(1, chunk_rows))
+    return JsonResponse({"job_id": job.id, "output_dir": output_dir}, status=202)
+
+def _score_matrix_job(job, engine_name, csv_path, sentence_col, top_k, memory_limit):
+    features_dir = output_dir_for(engine_name, csv_path, sentence_col)
+    extract_csv_features(engine_name, csv_path, sentence_col, features_dir, progress=job.progress)
+    embeddings, row_ids = load_features(features_dir)
+    result = write_score_matrix(embeddings, job.output_dir, top_k=top_k, memory_limit_bytes=memory_limit,
+                                progress=job.progress)
+    result['row_ids_path'] = os.path.join(features_dir, 'row_ids.npy')
+    return result
+
+def _start_score_matrix_job(request, engine_name, csv_path, sentence_col):
+    """
+    Queue a score matrix job. Optional 'top-k' keeps only the k best matches
+    per row; optional 'memory-limit' (bytes) bounds the tile working set.
+    """
+    if not csv_path or not os.path.isfile(csv_path):
+        return JsonResponse({"error": "csv-path must be an existing file"}, status=400)
+    try:
+        top_k = int(request.POST.get('top-k') or 0) or None
+        memory_limit = int(request.POST.get('memory-limit') or DEFAULT_MEMORY_LIMIT_BYTES)
+    except ValueError:
+        return JsonResponse({"error": "top-k and memory-limit must be integers"}, status=400)
+    job = jobs.submit('score_matrix', _score_matrix_job, engine_name, csv_path, sentence_col, top_k, memory_limit)
+    return JsonResponse({"job_id": job.id, "output_dir": job.output_dir}, status=202)
+
+def _content_features(engine, texts):
+    # The content engine embeds one text per call
+    return np.stack([np.asarray(engine.feature_extraction(text), dtype=np.float32).reshape(-1) for text in texts])
+
+def _texts_from_request(request):
+    """Read a list of texts from a JSON body {"texts": [...]} or repeated 'texts' form fields"""
+    if request.content_type == 'application/json':
+        try:
+            texts = json.loads(request.body).get('texts')
+        except (ValueError, AttributeError):
+            return None
+    else:
+        texts = request.POST.getlist('texts')
+    if not isinstance(texts, list) or not texts or len(texts) > MAX_BATCH_TEXTS:
+        return None
+    if not all(isinstance(text, str) for text in texts):
+        return None
+    return texts
+
 @csrf_exempt
 @require_POST
 @token_auth
@@ -27,142 +135,241 @@ def predict(request):
     num_predictions = int(request.POST.get('num', 10))
     if not item:
         return JsonResponse([], safe=False)
-    if content_engine is None:
-        content_engine = ContentEngine()
-    predictions = content_engine.predict(str(item), num_predictions)
-    predictions = [(p[0].decode('utf-8'), float(p[1])) for p in predictions]
-    return JsonResponse(predictions, safe=False)
+
+    def compute():
+        predictions = registry.get('content').predict(str(item), num_predictions)
+        return [(p[0].decode('utf-8'), float(p[1])) for p in predictions]
+
+    key = (model_version('content'), str(item), num_predictions)
+    return JsonResponse(predict_cache.get_or_compute(key, compute), safe=False)
 
 @csrf_exempt
 @token_auth
 def train(request):
-    data_url = request.POST.get('data-url')
-    if content_engine is None:
-        content_engine = ContentEngine()
-    content_engine.train(data_url)
-    return JsonResponse({"message": "Success!", "success": 1})
+    job = jobs.submit('train', _train_job, request.POST.get('data-url'))
+    return JsonResponse({"message": "Training queued", "success": 1, "job_id": job.id}, status=202)
 
 @csrf_exempt
 @token_auth
 def feature_extraction(request):
     text = request.POST.get('text')
-    if content_engine is None:
-        content_engine = ContentEngine()
-    return JsonResponse({"embedding": content_engine.feature_extraction(text)})
+    if text is None:
+        return JsonResponse({"error": "text is required"}, status=400)
+    registry.get('content')
+    # Keyed on the trained model's version, which training bumps
+    embedding = embed_texts('content', [text], _content_features, model_version('content'))[0]
+    return _array_response(request, "embedding", embedding)
 
 @csrf_exempt
 @token_auth
 def sentence_similarity(request):
     text1 = request.POST.get('text1')
     text2 = request.POST.get('text2')
-    if content_engine is None:
-        content_engine = ContentEngine()
-    return JsonResponse({"similarity": content_engine.sentence_similarity(text1, text2)})
+    content_engine = registry.get('content')
+    return JsonResponse({"similarity": float(content_engine.sentence_similarity(text1, text2))})
 
 @csrf_exempt
 @token_auth
 def fetch_large_feature_extraction_engine(request):
     model_name = request.POST.get('model-name')
-    if large_feature_extraction_engine is None:
-        large_feature_extraction_engine = LargeFeatureExtractionEngine(model_name)
-    return JsonResponse({"success": 1, "loaded_model": model_name})
+    job = jobs.submit('load_model', _load_model_job, 'large_feature_extraction', model_name)
+    return JsonResponse({"success": 1, "loading_model": model_name, "job_id": job.id}, status=202)
 
 @csrf_exempt
 @token_auth
 def extract_features_with_large_feature_extraction_engine(request):
     text = request.POST.get('text')
+    large_feature_extraction_engine = registry.get('large_feature_extraction', load=False)
     if large_feature_extraction_engine is None:
         return JsonResponse({"error": "Large feature extraction engine not loaded"}, status=400)
-    return JsonResponse({"embedding": large_feature_extraction_engine.extract_features(text)})
+    embedding = embed_texts('large_feature_extraction', [text])[0]
+    return _array_response(request, "embedding", embedding)
 
 @csrf_exempt
 @token_auth
 def sentence_similarity_with_large_feature_extraction_engine(request):
     text1 = request.POST.get('text1')
     text2 = request.POST.get('text2')
+    large_feature_extraction_engine = registry.get('large_feature_extraction', load=False)
     if large_feature_extraction_engine is None:
         return JsonResponse({"error": "Large feature extraction engine not loaded"}, status=400)
-    return JsonResponse({"similarity": large_feature_extraction_engine.sentence_similarity(text1, text2)})
+    embedding1, embedding2 = embed_texts('large_feature_extraction', [text1, text2])
+    return JsonResponse({"similarity": cosine_similarity(embedding1, embedding2)})
+
+@csrf_exempt
+@require_POST
+@token_auth
+def batch_extract_features_with_large_feature_extraction_engine(request):
+    texts = _texts_from_request(request)
+    if texts is None:
+        return JsonResponse({"error": f"texts must be a list of 1-{MAX_BATCH_TEXTS} strings"}, status=400)
+    if not registry.is_loaded('large_feature_extraction'):
+        return JsonResponse({"error": "Large feature extraction engine not loaded"}, status=400)
+    return _array_response(request, "embeddings", embed_texts('large_feature_extraction', texts))
 
 @csrf_exempt
 @token_auth
 def score_matrix_with_large_feature_extraction_engine(request):
     csv_path = request.POST.get('csv-path')
     sentence_col = request.POST.get('sentence-col')
+    large_feature_extraction_engine = registry.get('large_feature_extraction', load=False)
     if large_feature_extraction_engine is None:
         return JsonResponse({"error": "Large feature extraction engine not loaded"}, status=400)
-    return JsonResponse({"score_matrix": large_feature_extraction_engine.score_matrix(csv_path, sentence_col)})
+    return _start_score_matrix_job(request, 'large_feature_extraction', csv_path, sentence_col)
 
 @csrf_exempt
 @token_auth
 def csv_feature_extraction_with_large_feature_extraction_engine(request):
     csv_path = request.POST.get('csv-path')
     sentence_col = request.POST.get('sentence-col')
+    large_feature_extraction_engine = registry.get('large_feature_extraction', load=False)
     if large_feature_extraction_engine is None:
         return JsonResponse({"error": "Large feature extraction engine not loaded"}, status=400)
-    return JsonResponse({"embeddings": large_feature_extraction_engine.feature_extraction(csv_path, sentence_col)})
+    return _start_csv_features_job(request, 'large_feature_extraction', csv_path, sentence_col)
 
 @csrf_exempt
 @token_auth
 def fetch_GGUF_embeddings_model(request):
     model_name = request.POST.get('model-name')
-    if GGUF_content_engine is None:
-        GGUF_content_engine = GGUFContentEngine()
-    GGUF_content_engine.set_embedding_model(model_name)
-    return JsonResponse({"success": 1, "loaded_model": model_name})
+    filename = request.POST.get('filename')
+    job = jobs.submit('load_model', _configure_gguf_job, 'embedding', model_name, filename)
+    return JsonResponse({"success": 1, "loading_model": model_name, "job_id": job.id}, status=202)
 
 @csrf_exempt
 @token_auth
 def fetch_GGUF_chat_model(request):
     model_name = request.POST.get('model-name')
-    if GGUF_content_engine is None:
-        GGUF_content_engine = GGUFContentEngine()
-    GGUF_content_engine.set_chat_model(model_name)
-    return JsonResponse({"success": 1, "loaded_model": model_name})
+    filename = request.POST.get('filename')
+    job = jobs.submit('load_model', _configure_gguf_job, 'chat', model_name, filename)
+    return JsonResponse({"success": 1, "loading_model": model_name, "job_id": job.id}, status=202)
 
 @csrf_exempt
 @token_auth
 def extract_features_with_GGUF_engine(request):
     text = request.POST.get('text')
+    GGUF_content_engine = registry.get('gguf', load=False)
     if GGUF_content_engine is None:
         return JsonResponse({"error": "gguf engine not loaded"}, status=400)
-    return JsonResponse({"embedding": GGUF_content_engine.extract_features(text)})
+    embedding = embed_texts('gguf', [text])[0]
+    return _array_response(request, "embedding", embedding)
 
 @csrf_exempt
 @token_auth
 def sentence_similarity_with_GGUF_engine(request):
     text1 = request.POST.get('text1')
     text2 = request.POST.get('text2')
+    GGUF_content_engine = registry.get('gguf', load=False)
     if GGUF_content_engine is None:
         return JsonResponse({"error": "gguf engine not loaded"}, status=400)
-    return JsonResponse({"similarity": GGUF_content_engine.sentence_similarity(text1, text2)})
+    embedding1, embedding2 = embed_texts('gguf', [text1, text2])
+    return JsonResponse({"similarity": cosine_similarity(embedding1, embedding2)})
+
+@csrf_exempt
+@require_POST
+@token_auth
+def batch_extract_features_with_GGUF_engine(request):
+    texts = _texts_from_request(request)
+    if texts is None:
+        return JsonResponse({"error": f"texts must be a list of 1-{MAX_BATCH_TEXTS} strings"}, status=400)
+    if not registry.is_loaded('gguf'):
+        return JsonResponse({"error": "gguf engine not loaded"}, status=400)
+    return _array_response(request, "embeddings", embed_texts('gguf', texts))
 
 @csrf_exempt
 @token_auth
 def csv_feature_extraction_with_GGUF_engine(request):
     csv_path = request.POST.get('csv-path')
     sentence_col = request.POST.get('sentence-col')
+    GGUF_content_engine = registry.get('gguf', load=False)
     if GGUF_content_engine is None:
         return JsonResponse({"error": "gguf engine not loaded"}, status=400)
-    return JsonResponse({"embeddings": GGUF_content_engine.feature_extraction(csv_path, sentence_col)})
+    return _start_csv_features_job(request, 'gguf', csv_path, sentence_col)
 
 @csrf_exempt
 @token_auth
 def score_matrix_with_GGUF_engine(request):
     csv_path = request.POST.get('csv-path')
     sentence_col = request.POST.get('sentence-col')
+    GGUF_content_engine = registry.get('gguf', load=False)
     if GGUF_content_engine is None:
         return JsonResponse({"error": "gguf engine not loaded"}, status=400)
-    return JsonResponse({"score_matrix": GGUF_content_engine.score_matrix(csv_path, sentence_col)})
+    return _start_score_matrix_job(request, 'gguf', csv_path, sentence_col)
+
+@csrf_exempt
+@token_auth
+def job_status(request, job_id):
+    """State and progress of a job queued by any webui endpoint"""
+    job = jobs.get(job_id)
+    if job is None:
+        return JsonResponse({"error": "unknown job"}, status=404)
+    return JsonResponse(job)
+
+@csrf_exempt
+@token_auth
+def job_result(request, job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return JsonResponse({"error": "unknown job"}, status=404)
+    if job['status'] != 'succeeded':
+        return JsonResponse({"error": f"job is {job['status']}", "status": job['status']}, status=409)
+    return JsonResponse({"id": job_id, "result": jobs.result(job_id)})
+
+@csrf_exempt
+@token_auth
+def job_embeddings(request, job_id):
+    """
+    A finished CSV feature extraction job's embeddings and row ids, in the
+    negotiated format. npy serves one file: the embeddings, or the row ids
+    with ?array=row_ids.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return JsonResponse({"error": "unknown job"}, status=404)
+    result = jobs.result(job_id) or {}
+    if 'embeddings_path' not in result:
+        return JsonResponse({"error": "job has no embeddings", "status": job['status']}, status=409)
+    try:
+        fmt = negotiate(request)
+    except UnsupportedFormat as exc:
+        return unsupported_format_response(exc)
+    if fmt == 'npy':
+        # The outputs already are .npy files
+        path = result['row_ids_path'] if request.GET.get('array') == 'row_ids' else result['embeddings_path']
+        response = FileResponse(open(path, 'rb'), content_type='application/x-npy')
+        patch_vary_headers(response, ['Accept'])
+        return response
+    embeddings = np.load(result['embeddings_path'], mmap_mode='r')
+    row_ids = np.load(result['row_ids_path'], mmap_mode='r')
+    return _array_response(request, "embeddings", embeddings, arrays={"row_ids": row_ids})
+
+@csrf_exempt
+@require_POST
+@token_auth
+def cancel_job(request, job_id):
+    if jobs.get(job_id) is None:
+        return JsonResponse({"error": "unknown job"}, status=404)
+    return JsonResponse({"id": job_id, "cancel_requested": jobs.cancel(job_id)})
+
+@csrf_exempt
+@token_auth
+def engine_stats(request):
+    """Per-engine load state, version, load time and memory growth"""
+    return JsonResponse({"engines": registry.stats(), "batchers": batcher_stats(), "embedding_store": store_stats(),
+                         "predict_cache": predict_cache.stats()})
+
+@csrf_exempt
+@require_POST
+@token_auth
+def unload_engine(request):
+    name = request.POST.get('engine')
+    if name not in registry.names():
+        return JsonResponse({"error": "unknown engine"}, status=400)
+    return JsonResponse({"success": 1, "unloaded": registry.unload(name)})
 
 
 def train_ui(request):
     if request.method == 'POST':
-        data_url = request.POST.get('data-url')
-        if content_engine is None:
-            content_engine = ContentEngine()
-        content_engine.train(data_url)
-        messages.success(request, 'Training started successfully')
+        job = jobs.submit('train', _train_job, request.POST.get('data-url'))
+        messages.success(request, f'Training started successfully (job {job.id})')
         return redirect('train_ui')
     return render(request, 'train.html')
-